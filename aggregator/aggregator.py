@@ -1,45 +1,120 @@
 import json
 import os
 import time
-import torch
 import csv
-import subprocess # <--- 新增导入
 import sys # <--- 新增导入
-from collections import OrderedDict
-from web3 import Web3
-
-# --- 解决代理问题 ---
-if 'http_proxy' in os.environ:
-    del os.environ['http_proxy']
-if 'https_proxy' in os.environ:
-    del os.environ['https_proxy']
-# --------------------
+import queue
+import threading
+from collections import OrderedDict, defaultdict
 
 # 告诉 Python 在哪里找到模块
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import config
 from config import (
-    RPC_URL, CONTRACT_ADDRESS, ABI_PATH, AGGREGATOR_PRIVATE_KEY,
+    RPC_URL, ABI_PATH, AGGREGATOR_PRIVATE_KEY, WORKER_SIGNAL_PREFIX,
 )
-from models import ComplexCNN 
-from data_loader import load_cifar10_test
+from model_store import ModelStore, cid_to_bytes32, cid_from_bytes32
+from utils import metrics
+from utils.checkpoint import write_checkpoint
+from utils.fileio import atomic_write
+from utils.plotter import AccuracyPlotter, read_history
+# torch（约 2 秒）与 web3（约 0.5 秒）以及依赖它们的模块在首次使用时才导入，与 client.py 相同
 
 # --- 全局参数 ---
-GLOBAL_MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'saved_models', 'global_model.pth'))
+# 内容寻址存储中保留最近多少轮引用的模型（更早轮次的客户端更新与全局模型会被回收）
+STORE_KEEP_ROUNDS = 2
 HISTORY_LOG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs', 'history.csv'))
+# 每轮模型更新读写字节数的记录
+UPDATE_IO_LOG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs', 'update_io.csv'))
+# 联邦平均的加权方式："samples" 按客户端报告的样本数加权，"uniform" 每个客户端权重相同
+FEDAVG_WEIGHTING = "samples"
+# 聚合规则："fedavg" 使用流式加权平均；"median" / "trimmed_mean" / "krum" / "multi_krum" / "mean"
+# 使用 robust_aggregation 中基于 N×P 参数矩阵的向量化聚合引擎
+AGGREGATION_RULE = "fedavg"
+# 传给聚合规则的额外参数，例如 {"trim_ratio": 0.2} 或 {"num_byzantine": 1}
+AGGREGATION_RULE_OPTIONS = {}
+# 非 None 时，先把每个客户端相对当前全局模型的更新量裁剪到该 L2 范数以内（仅对向量化引擎生效）
+CLIP_NORM = None
+# 分层聚合：大于 1 时 FedAvg 由至多 EDGE_AGGREGATORS 个边缘聚合进程各自归约一段连续的客户端更新，
+# 根聚合器只合并它们的加权部分和（见 edge_aggregation.py）；鲁棒聚合规则不能按部分和分解，不受影响
+EDGE_AGGREGATORS = 0
+# 部分和的合并方式："files" —— 经由部分和文件；"gloo" —— torch.distributed gloo 后端的 CPU reduce
+EDGE_COMBINE_MODE = "files"
+# 异步（FedBuff 式）聚合中陈旧更新的降权指数：基于 s 轮之前的全局模型训练的更新，
+# 权重乘以 (1 + s) ** -STALENESS_EXPONENT；同步模式下所有更新的陈旧度都是 0，不受影响
+STALENESS_EXPONENT = 0.5
+# 常驻服务模式下轮询新区块的间隔（秒）
+EVENT_POLL_INTERVAL = 0.5
+# 全局模型评估模式："sync" —— 在本轮结束前完成评估（原始行为）；
+# "async" —— 立即结束本轮，由后台评估线程稍后按轮次补记准确率与图表
+EVALUATION_MODE = "sync"
+# 是否由聚合器渲染准确率 PNG 图表（原始行为）；仪表盘可以直接用 history.csv 原生绘图，不需要 PNG 时可关闭
+RENDER_ACCURACY_PLOT = True
+
+def staleness_weight(staleness):
+    """陈旧度为 staleness 轮的更新的权重系数（多项式衰减）。"""
+    return (1.0 + max(0, staleness)) ** -STALENESS_EXPONENT
 
 class Aggregator:
     """
     聚合者，负责结束回合、聚合模型、评估、记录，并实时更新图表。
     """
-    def __init__(self, private_key: str):
-        self.w3 = Web3(Web3.HTTPProvider(RPC_URL))
+    def __init__(self, private_key: str, w3=None, contract=None, test_loader=None, model_fn=None, work_dir=None,
+                 evaluation_mode=None):
+        """
+        w3 / contract / test_loader / model_fn / work_dir 的用途与 FederatedLearningClient 中的同名参数相同（供基准测试注入）；
+        work_dir 非 None 时检查点、历史与读写记录、边缘聚合的部分和也放在该目录下。
+        evaluation_mode 为 None 时使用 EVALUATION_MODE。
+        """
+        import torch
+        from chain_reader import ChainReader, make_web3
+        from tx_manager import TransactionManager
+
+        if w3 is None:
+            self.w3, session = make_web3(RPC_URL)
+            rpc_url = RPC_URL
+        else:
+            self.w3, session, rpc_url = w3, None, None
         if not self.w3.isConnected():
             raise ConnectionError(f"无法连接到 RPC URL: {RPC_URL}")
 
         self.account = self.w3.eth.account.from_key(private_key)
-        self.contract = self._load_contract()
-        self.test_loader = load_cifar10_test()
+        self.contract = contract if contract is not None else self._load_contract()
+        self.reader = ChainReader(self.w3, self.contract, rpc_url, session)
+        self.tx_manager = TransactionManager(self.w3, self.account)
+        # 当前全局模型的 CID；为 None 时按需从合约读取
+        self.global_model_cid = None
+        if test_loader is None:
+            from data_loader import load_cifar10_test
+            test_loader = load_cifar10_test()
+        self.test_loader = test_loader
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.update_bytes_read = 0
+        self.dirs = config.artifact_dirs(work_dir)
+        self.store = ModelStore(self.dirs["store"])
+        logs_dir = self.dirs["logs"]
+        self.history_log_path = os.path.join(logs_dir, "history.csv") if logs_dir else HISTORY_LOG_PATH
+        self.update_io_log_path = os.path.join(logs_dir, "update_io.csv") if logs_dir else UPDATE_IO_LOG_PATH
+        self.edge_partials_dir = os.path.join(work_dir, "edge_partials") if work_dir else None
+        self.evaluation_mode = evaluation_mode or EVALUATION_MODE
+        # 按 (CID, 设备) 缓存最近读取/生成的全局模型，避免重复反序列化
+        self._global_model_cache = {}
+        # 评估用的模型只构建一次，每轮原地加载新权重
+        if model_fn is None:
+            from models import ComplexCNN
+            model_fn = ComplexCNN
+        self.eval_model = model_fn().to(self.device)
+        # 异步评估：(轮次, 全局模型权重) 任务队列与后台评估线程（首次提交任务时启动）
+        self._evaluation_queue = queue.Queue()
+        self._evaluation_thread = None
+        # 转发的签名更新：EIP-712 签名域，以及 (轮次, 客户端, 签名) -> 是否有效 的校验缓存
+        self._signing_domain = None
+        self._relay_checked = {}
+        # 第 n 轮开始时的全局模型 CID（即第 n - 1 轮结束时写入链上的模型），陈旧的完整模型更新以它为基准作差
+        self._round_base_cids = {}
+        # 图表在进程内增量绘制，只在第一次渲染时导入 matplotlib
+        self.plotter = AccuracyPlotter(history_path=self.history_log_path) if RENDER_ACCURACY_PLOT else None
         
         print(f"聚合者初始化成功，地址: {self.account.address}")
         print(f"成功加载合约，地址: {self.contract.address}")
@@ -48,33 +123,169 @@ class Aggregator:
     def _load_contract(self):
         with open(ABI_PATH, 'r') as f:
             abi = json.load(f)["abi"]
-        return self.w3.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
-
-    def _send_transaction(self, func_call):
-        tx = func_call.build_transaction({
-            'from': self.account.address,
-            'nonce': self.w3.eth.get_transaction_count(self.account.address),
-            'gas': 2000000,
-            'gasPrice': self.w3.eth.gas_price,
-        })
-        signed_tx = self.w3.eth.account.sign_transaction(tx, private_key=self.account.key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        tx_receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        return tx_receipt
-
-    def _federated_averaging(self, model_paths: list):
-        if not model_paths: return None
-        print("  - 开始联邦平均...")
-        all_state_dicts = [torch.load(path, map_location=self.device) for path in model_paths]
-        avg_state_dict = OrderedDict()
-        print(f"  - 正在聚合 {len(all_state_dicts)} 个模型...")
-        for key in all_state_dicts[0].keys():
-            avg_state_dict[key] = sum(state_dict[key] for state_dict in all_state_dicts) / len(all_state_dicts)
+        return self.w3.eth.contract(address=config.CONTRACT_ADDRESS, abi=abi)
+
+    def _current_global_model_cid(self):
+        return self.global_model_cid or cid_from_bytes32(self.contract.functions.globalModelCID().call())
+
+    def _load_base_model(self, map_location):
+        """按链上的 globalModelCID 读取当前全局模型，作为客户端压缩增量的基准；存储中没有时返回 None。"""
+        global_model_cid = self._current_global_model_cid()
+        cache_key = (global_model_cid, str(map_location))
+        if cache_key not in self._global_model_cache:
+            from model_io import load_state_dict
+
+            if not self.store.has(global_model_cid):
+                return None
+            state_dict = load_state_dict(self.store.path(global_model_cid), map_location=map_location, mmap=True)
+            self._global_model_cache = {cache_key: state_dict}
+        return self._global_model_cache[cache_key]
+
+    def _load_model(self, cid, map_location):
+        from model_io import load_state_dict
+
+        return load_state_dict(self.store.path(cid), map_location=map_location, mmap=True)
+
+    def _round_base_cid(self, base_round):
+        """第 base_round 轮开始时的全局模型 CID，取自第 base_round - 1 轮的 RoundFinalized 事件；第一轮返回 None。"""
+        if base_round not in self._round_base_cids:
+            base_cid = None
+            if base_round > 1:
+                events = self.contract.events.RoundFinalized.getLogs(argument_filters={'round': base_round - 1}, fromBlock=0)
+                if events:
+                    base_cid = cid_from_bytes32(events[-1].args.newGlobalModelCID)
+            self._round_base_cids[base_round] = base_cid
+        return self._round_base_cids[base_round]
+
+    def _delta_bases(self, current_round, model_cids, staleness):
+        """
+        累加器把完整模型更新换算成相对当前全局模型的增量；陈旧的完整模型必须先与它训练时基于的全局模型作差，
+        否则期间全局模型的变化也会被算作该客户端的贡献。返回可以聚合的 (model_cids, staleness, update_base_cids)：
+        update_base_cids 中为需要换算的更新所基于的全局模型 CID，其余为 None（压缩增量本来就相对其训练时的基准）。
+        基准模型已不在存储中（见 STORE_KEEP_ROUNDS）或是随机初始化的模型时，该更新无法正确换算，不计入本轮聚合。
+        """
+        from model_io import is_full_model_update
+
+        kept_cids, kept_staleness, update_base_cids = [], [], []
+        has_global_model = self.store.has(self._current_global_model_cid())
+        for cid, lag in zip(model_cids, staleness):
+            update_base_cid = None
+            if lag and has_global_model and is_full_model_update(self.store.path(cid)):
+                update_base_cid = self._round_base_cid(current_round - lag)
+                if update_base_cid is None or not self.store.has(update_base_cid):
+                    print(f"  - ⚠️  更新 {cid[:12]}... 是基于第 {current_round - lag} 轮全局模型训练的完整模型，"
+                          f"而该全局模型已不可用，无法换算为增量，不计入本轮聚合。")
+                    continue
+            kept_cids.append(cid)
+            kept_staleness.append(lag)
+            update_base_cids.append(update_base_cid)
+        return kept_cids, kept_staleness, update_base_cids
+
+    def _client_weight(self, num_samples, staleness):
+        weight = float(num_samples) if FEDAVG_WEIGHTING == "samples" else 1.0
+        return weight * staleness_weight(staleness)
+
+    def _federated_averaging(self, model_cids: list, staleness: list, update_base_cids: list = None):
+        """
+        流式联邦平均：逐个读取客户端更新并原地累加到一个预先分配的累加器中，
+        任意时刻内存中最多只有累加器和一个客户端模型，峰值内存与客户端数量无关。
+        压缩增量（fp16 / int8 / top-k）会被直接解码进累加器，不会先还原成完整模型。
+        每个更新的权重再乘以其陈旧度系数（见 staleness_weight）；update_base_cids 见 _delta_bases。
+        """
+        if not model_cids: return None
+        update_base_cids = update_base_cids or [None] * len(model_cids)
+        if EDGE_AGGREGATORS > 1 and len(model_cids) > 1:
+            return self._hierarchical_averaging(model_cids, staleness, update_base_cids)
+        from model_io import load_model_update, accumulate_update, finalize_average, rebase_update
+
+        print(f"  - 开始联邦平均（流式，加权方式: {FEDAVG_WEIGHTING}），共 {len(model_cids)} 个模型...")
+        base_state_dict = self._load_base_model(self.device)
+        accumulator = None
+        total_weight = 0.0
+        for cid, lag, update_base_cid in zip(model_cids, staleness, update_base_cids):
+            path = self.store.path(cid)
+            update, num_samples = load_model_update(path, map_location=self.device, mmap=True)
+            self.update_bytes_read += os.path.getsize(path)
+            if update_base_cid is not None:
+                update = rebase_update(update, self._load_model(update_base_cid, self.device), base_state_dict)
+            weight = self._client_weight(num_samples, lag)
+            accumulator = accumulate_update(accumulator, update, weight, base_state_dict)
+            total_weight += weight
+            print(f"  - 已累加 {cid[:12]}...（权重 {weight:g}，陈旧度 {lag}）")
+            del update
         print("  - 联邦平均完成。")
-        return avg_state_dict
+        return OrderedDict(finalize_average(accumulator, total_weight, base_state_dict))
+
+    def _hierarchical_averaging(self, model_cids: list, staleness: list, update_base_cids: list):
+        """
+        分层联邦平均：客户端更新按到达顺序切成至多 EDGE_AGGREGATORS 段，由边缘聚合进程分别读取并归约为加权部分和，
+        本进程只合并部分和（EDGE_COMBINE_MODE），不读取任何客户端更新。结果与 _federated_averaging 数值上一致。
+        """
+        from edge_aggregation import hierarchical_average
+
+        num_edges = min(EDGE_AGGREGATORS, len(model_cids))
+        print(f"  - 开始分层联邦平均（{num_edges} 个边缘聚合进程，合并方式: {EDGE_COMBINE_MODE}，"
+              f"加权方式: {FEDAVG_WEIGHTING}），共 {len(model_cids)} 个模型...")
+        global_model_cid = self._current_global_model_cid()
+        base_cid = global_model_cid if self.store.has(global_model_cid) else None
+        # 更新由边缘进程读取，仍按同样的口径计入本轮读取的字节数
+        for cid in model_cids:
+            self.update_bytes_read += os.path.getsize(self.store.path(cid, verify=False))
+        aggregated = hierarchical_average(
+            [(cid, staleness_weight(lag), update_base_cid) for cid, lag, update_base_cid in zip(model_cids, staleness, update_base_cids)],
+            self.store.root, num_edges,
+            base_cid=base_cid, combine=EDGE_COMBINE_MODE, weighting=FEDAVG_WEIGHTING, partials_dir=self.edge_partials_dir,
+        )
+        print("  - 分层联邦平均完成。")
+        return OrderedDict((key, value.to(self.device)) for key, value in aggregated.items())
+
+    def _robust_aggregation(self, model_cids: list, staleness: list, update_base_cids: list = None):
+        """
+        使用向量化聚合引擎执行鲁棒聚合：客户端更新被逐个读取并写入预分配的 N×P 矩阵，
+        再以批量张量运算完成范数裁剪与聚合规则。
+        """
+        if not model_cids: return None
+        from model_io import load_model_update, decode_update, rebase_update
+        from robust_aggregation import robust_aggregate
+
+        print(f"  - 开始鲁棒聚合（规则: {AGGREGATION_RULE}，参数: {AGGREGATION_RULE_OPTIONS}，裁剪范数: {CLIP_NORM}）...")
+        # weights 在生成器被消费时逐个填充；robust_aggregate 会先读完所有更新再执行聚合规则
+        weights = []
+
+        base_state_dict = self._load_base_model("cpu")
+        update_base_cids = update_base_cids or [None] * len(model_cids)
+
+        def iter_state_dicts():
+            for cid, lag, update_base_cid in zip(model_cids, staleness, update_base_cids):
+                path = self.store.path(cid)
+                update, num_samples = load_model_update(path, map_location="cpu", mmap=True)
+                self.update_bytes_read += os.path.getsize(path)
+                if update_base_cid is not None:
+                    update = rebase_update(update, self._load_model(update_base_cid, "cpu"), base_state_dict)
+                weights.append(self._client_weight(num_samples, lag))
+                yield decode_update(update, base_state_dict)
+
+        reference = base_state_dict if CLIP_NORM is not None else None
+        if CLIP_NORM is not None and base_state_dict is None:
+            print("  - 尚无全局模型作为裁剪基准，本轮跳过范数裁剪。")
+        aggregated = robust_aggregate(
+            iter_state_dicts(), AGGREGATION_RULE, weights=weights, clip_norm=CLIP_NORM,
+            reference_state_dict=reference, num_clients=len(model_cids), **AGGREGATION_RULE_OPTIONS
+        )
+        print("  - 鲁棒聚合完成。")
+        return OrderedDict((key, value.to(self.device)) for key, value in aggregated.items())
+
+    def _aggregate(self, model_cids: list, staleness: list = None, update_base_cids: list = None):
+        if staleness is None:
+            staleness = [0] * len(model_cids)
+        if AGGREGATION_RULE == "fedavg":
+            return self._federated_averaging(model_cids, staleness, update_base_cids)
+        return self._robust_aggregation(model_cids, staleness, update_base_cids)
 
     def _evaluate_model(self, model_weights):
-        model = ComplexCNN().to(self.device)
+        import torch
+
+        model = self.eval_model
         model.load_state_dict(model_weights)
         model.eval()
         correct, total = 0, 0
@@ -89,72 +300,323 @@ class Aggregator:
         print(f"  - 📈 模型评估完成，准确率: {accuracy:.2f}%")
         return accuracy
 
-    def _log_history(self, round_number, accuracy):
-        os.makedirs(os.path.dirname(HISTORY_LOG_PATH), exist_ok=True)
-        file_exists = os.path.isfile(HISTORY_LOG_PATH)
-        with open(HISTORY_LOG_PATH, 'a', newline='') as f:
+    def _log_update_io(self, round_number, num_updates, global_model_bytes):
+        """记录本轮读取的客户端更新字节数与写出的全局模型字节数。"""
+        os.makedirs(os.path.dirname(self.update_io_log_path), exist_ok=True)
+        file_exists = os.path.isfile(self.update_io_log_path)
+        with open(self.update_io_log_path, 'a', newline='') as f:
             writer = csv.writer(f)
             if not file_exists:
-                writer.writerow(['Round', 'Accuracy'])
-            writer.writerow([round_number, accuracy])
-        print(f"  - 📝 已将第 {round_number} 轮的准确率记录到 {HISTORY_LOG_PATH}")
+                writer.writerow(['Round', 'Updates', 'UpdateBytesRead', 'GlobalModelBytesWritten'])
+            writer.writerow([round_number, num_updates, self.update_bytes_read, global_model_bytes])
+        print(f"  - 💾 本轮读取客户端更新 {self.update_bytes_read / 1e6:.2f} MB，写出全局模型 {global_model_bytes / 1e6:.2f} MB")
 
-    # --- 新增函数 ---
-    def _update_plot(self):
+    def _log_history(self, round_number, accuracy):
+        # 整个文件重写到临时文件后原子替换：崩溃时不会留下半行记录；续跑时重复评估的轮次只保留最新结果
+        history = dict(read_history(self.history_log_path))
+        history[round_number] = accuracy
+        with atomic_write(self.history_log_path, durable=True, newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Round', 'Accuracy'])
+            writer.writerows(sorted(history.items()))
+        print(f"  - 📝 已将第 {round_number} 轮的准确率记录到 {self.history_log_path}")
+
+    def _recover_history(self, current_round):
         """
-        调用绘图脚本来更新准确率图表。
+        续跑时补齐上一轮的准确率：聚合器可能在结束上一轮之后、异步评估完成之前崩溃。
+        只有最新的全局模型仍可用，更早缺失的轮次无法补评估。
         """
+        last_round = current_round - 1
+        if last_round < 1 or last_round in dict(read_history(self.history_log_path)):
+            return
+        weights = self._load_base_model(self.device)
+        if weights is None:
+            print(f"  - ⚠️  找不到第 {last_round} 轮的全局模型，无法补记其准确率。")
+            return
+        print(f"  - 历史记录中缺少第 {last_round} 轮的准确率，正在补评估...")
+        self._submit_evaluation(last_round, weights)
+
+    def _update_plot(self, round_number, accuracy):
+        """把新的一轮追加到进程内的准确率图表并重新保存 PNG。"""
+        if self.plotter is None:
+            return
         print("  - 🎨 正在更新准确率图表...")
         try:
-            # 使用与 server.py 相同的 python 解释器来运行
-            python_executable = f"{sys.executable} -u"
-            plotter_script_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'utils', 'plotter.py'))
-            subprocess.run(
-                f"{python_executable} {plotter_script_path}",
-                shell=True, check=True, capture_output=True, text=True
-            )
+            self.plotter.add_point(round_number, accuracy)
             print("  - ✅ 图表更新成功。")
-        except subprocess.CalledProcessError as e:
-            print(f"  - ❌ 图表更新失败: {e.stderr}")
-    # --- 新增结束 ---
+        except Exception as e:
+            print(f"  - ❌ 图表更新失败: {e}")
+
+    def _evaluate_and_record(self, round_number, model_weights):
+        # 评估可能在后台线程中、下一轮已经开始后才执行，显式标明轮次
+        recorder = metrics.get_recorder()
+        with recorder.span("evaluate", round=round_number):
+            accuracy = self._evaluate_model(model_weights)
+        recorder.gauge("accuracy", accuracy, round=round_number)
+        self._log_history(round_number, accuracy)
+        self._update_plot(round_number, accuracy)
+
+    def _evaluation_worker(self):
+        while True:
+            job = self._evaluation_queue.get()
+            if job is None:
+                break
+            round_number, model_weights = job
+            print(f"  - 🔍 开始评估第 {round_number} 轮的全局模型...")
+            try:
+                self._evaluate_and_record(round_number, model_weights)
+            except Exception as e:
+                print(f"  - ❌ 第 {round_number} 轮模型评估失败: {e}")
+
+    def _submit_evaluation(self, round_number, model_weights):
+        """
+        评估某一轮的全局模型并记录准确率。异步模式下任务按提交顺序在后台线程中执行，
+        任务自带轮次编号，即使评估在下一轮开始之后才完成，准确率也会记到正确的轮次上。
+        """
+        if self.evaluation_mode == "sync":
+            self._evaluate_and_record(round_number, model_weights)
+            return
+        if self._evaluation_thread is None:
+            self._evaluation_thread = threading.Thread(target=self._evaluation_worker, daemon=True)
+            self._evaluation_thread.start()
+        self._evaluation_queue.put((round_number, model_weights))
+
+    def wait_for_evaluations(self):
+        """等待所有已提交的评估任务完成（进程退出前调用）。"""
+        if self._evaluation_thread is not None:
+            self._evaluation_queue.put(None)
+            self._evaluation_thread.join()
+            self._evaluation_thread = None
+
+    def _collect_relayed(self, current_round, onchain_clients):
+        """
+        读取本轮转发收件箱中的签名更新，返回可以放进 submitBatchAndFinalize 的那些：
+        [(client_address, model_cid, base_round, signature), ...]。
+        签名必须来自声明的客户端；客户端必须已注册、本轮尚未在链上提交过（onchain_clients），
+        任何一条不满足都会让整批交易回滚，因此在这里提前剔除。校验结果按签名缓存，轮询时不重复计算。
+        """
+        import relay
+
+        if self._signing_domain is None:
+            self._signing_domain = relay.domain_separator(self.w3.eth.chain_id, self.contract.address)
+        messages = [
+            message for message in relay.read_signed_updates(current_round, self.dirs["relay"])
+            if message[0] not in onchain_clients and message[2] <= current_round
+        ]
+        unchecked = [message for message in messages if (current_round, message[0], message[3]) not in self._relay_checked]
+        if unchecked:
+            client_states = self.reader.batch_call([self.contract.functions.clients(message[0]) for message in unchecked])
+            for (client, model_cid, base_round, signature), (is_registered, last_round) in zip(unchecked, client_states):
+                try:
+                    signer = relay.recover_signer(self._signing_domain, current_round, model_cid, base_round, signature)
+                except Exception:
+                    signer = None
+                valid = signer == client and is_registered and last_round < current_round
+                if not valid:
+                    print(f"  - ⚠️  丢弃客户端 {client} 的无效转发更新（签名不符、未注册或本轮已提交）。")
+                self._relay_checked[(current_round, client, signature)] = valid
+        return [message for message in messages if self._relay_checked[(current_round, message[0], message[3])]]
 
     def finalize_current_round(self):
-        current_round = self.contract.functions.currentRound().call()
+        # 通过 getRoundState 一次取回轮次、法定数量、全局模型 CID 和本轮全部更新
+        state = self.reader.round_state()
+        current_round = state["current_round"]
+        self.global_model_cid = state["global_model_cid"]
         print(f"\n[聚合者] 正在检查第 {current_round} 轮的状态...")
-        updates_count = self.contract.functions.getRoundUpdatesCount(current_round).call()
-        updates_needed = self.contract.functions.updatesNeeded().call()
-        print(f"  - 本轮已收到 {updates_count} 个更新，需要 {updates_needed} 个。")
+        relayed = self._collect_relayed(current_round, {address for address, _, _ in state["updates"]})
+        updates = state["updates"] + [(client, cid, base_round) for client, cid, base_round, _ in relayed]
+        updates_count = len(updates)
+        updates_needed = state["updates_needed"]
+        print(f"  - 本轮已收到 {updates_count} 个更新（其中 {len(relayed)} 个待转发），需要 {updates_needed} 个。")
 
         if updates_count < updates_needed:
-            print("  - 更新数量不足，无法结束本轮。")
-            return
+            if updates_count == 0 or not self._deadline_passed():
+                print("  - 更新数量不足，无法结束本轮。")
+                return False
+            print("  - 本轮已超过截止时间，以已到达的更新结束本轮。")
+        else:
+            print("  - 更新数量已满足要求，开始执行聚合流程...")
+        print(f"  - 成功获取模型更新 CID: {[model_cid for _, model_cid, _ in updates]}")
+        return self._aggregate_and_finalize(current_round, updates, relayed)
 
-        print("  - 更新数量已满足要求，开始执行聚合流程...")
-        model_update_paths = [self.contract.functions.roundUpdates(current_round, i).call()[1] for i in range(updates_count)]
-        print(f"  - 成功获取文件路径: {model_update_paths}")
+    def _deadline_passed(self):
+        # roundDeadline 为 0 表示合约未设置轮次超时
+        deadline = self.contract.functions.roundDeadline().call()
+        return deadline != 0 and time.time() >= deadline
 
-        new_global_weights = self._federated_averaging(model_update_paths)
-        accuracy = self._evaluate_model(new_global_weights)
-        self._log_history(current_round, accuracy)
-        
-        # --- 新增步骤：实时更新图表 ---
-        self._update_plot()
-        # --- 新增结束 ---
+    def _publish_rewards(self, current_round, client_addresses):
+        """计算本轮奖励分配表，把分配表与证明写入清单文件，返回要提交上链的 Merkle 根。"""
+        from rewards import RewardTree, allocate_rewards, write_manifest
+
+        tree = RewardTree(current_round, allocate_rewards(client_addresses))
+        path = write_manifest(tree, self.dirs["rewards"])
+        print(f"  - 本轮奖励分配表（{len(tree.accounts)} 个客户端）已写入 {path}，Merkle 根: 0x{tree.root.hex()}")
+        return tree.root
+
+    def _aggregate_and_finalize(self, current_round, updates, relayed=()):
+        """
+        聚合给定的客户端更新 [(client_address, model_cid, base_round), ...]，把新全局模型的 CID
+        与本轮奖励分配表的 Merkle 根提交上链以结束本轮，评估与准确率记录见 _submit_evaluation。
+        base_round 为各更新训练时基于的全局模型轮次，用于按陈旧度降权，陈旧的完整模型还据此换算增量（见 _delta_bases）。
+        relayed 为尚未上链的签名更新（见 _collect_relayed，它们也应包含在 updates 中），
+        非空时用 submitBatchAndFinalize 在同一笔交易中记录它们并结束本轮。
+        返回是否成功。
+        """
+        import relay
+        from model_io import write_state_dict
+
+        recorder = metrics.get_recorder()
+        recorder.set_context(round=current_round)
+        model_update_cids = [model_cid for _, model_cid, _ in updates]
+        updates_count = len(model_update_cids)
+        self.update_bytes_read = 0
+        staleness = [current_round - base_round for _, _, base_round in updates]
+        if any(staleness):
+            print(f"  - 各更新的陈旧度（轮）: {staleness}")
+        with recorder.span("aggregate", updates=updates_count):
+            new_global_weights = self._aggregate(*self._delta_bases(current_round, model_update_cids, staleness))
+            if new_global_weights is None:
+                print("  - ⚠️  本轮没有可以聚合的更新，沿用当前的全局模型。")
+                new_global_weights = OrderedDict(self._load_base_model(self.device))
+        recorder.count("model_bytes_read", self.update_bytes_read)
+
+        with recorder.span("serialise"):
+            new_global_cid, global_model_size = self.store.put_stream(lambda f: write_state_dict(f, new_global_weights))
+        recorder.count("model_bytes_written", global_model_size)
+        self._global_model_cache = {(new_global_cid, str(self.device)): new_global_weights}
+        print(f"  - 聚合完成，新的全局模型已存入本地存储，CID: {new_global_cid}")
+
+        reward_root = self._publish_rewards(current_round, [address for address, _, _ in updates])
+
+        try:
+            with recorder.span("finalise", relayed=len(relayed)):
+                if relayed:
+                    print(f"  - 正在向区块链提交 {len(relayed)} 个转发的签名更新与新模型 CID，以结束本轮...")
+                    batch = [
+                        (client, cid_to_bytes32(model_cid), base_round, signature)
+                        for client, model_cid, base_round, signature in relayed
+                    ]
+                    # 批量交易的 gas 随批大小变化，不复用按函数签名缓存的估算值
+                    finalization = self.tx_manager.send(
+                        self.contract.functions.submitBatchAndFinalize(batch, cid_to_bytes32(new_global_cid), reward_root),
+                        cache_gas_estimate=False,
+                    )
+                else:
+                    print("  - 正在向区块链提交新模型 CID，以结束本轮...")
+                    finalization = self.tx_manager.send(
+                        self.contract.functions.finalizeRound(cid_to_bytes32(new_global_cid), reward_root)
+                    )
+        except Exception as e:
+            print(f"  - ❌ 结束回合失败: {e}")
+            return False
 
-        os.makedirs(os.path.dirname(GLOBAL_MODEL_PATH), exist_ok=True)
-        torch.save(new_global_weights, GLOBAL_MODEL_PATH)
-        print(f"  - 聚合完成，新的全局模型已保存到: {GLOBAL_MODEL_PATH}")
+        self._log_update_io(current_round, updates_count, global_model_size)
+        # 同步模式下在交易确认期间完成评估；异步模式下交给后台评估线程，不阻塞本轮结束
+        self._submit_evaluation(current_round, new_global_weights)
 
-        print("  - 正在向区块链提交新模型路径，以结束本轮...")
         try:
-            func_call = self.contract.functions.finalizeRound(GLOBAL_MODEL_PATH)
-            receipt = self._send_transaction(func_call)
+            with recorder.span("confirm"):
+                receipt = finalization.result()
             print(f"  - ✅ 第 {current_round} 轮成功结束！交易哈希: {receipt.transactionHash.hex()}")
-            new_round = self.contract.functions.currentRound().call()
-            print(f"🎉 新的一轮 ({new_round}) 已经开始！")
+            print(f"🎉 新的一轮 ({current_round + 1}) 已经开始！")
+            self.global_model_cid = new_global_cid
+            self._round_base_cids[current_round + 1] = new_global_cid
+            # 链上确认后再写检查点：检查点中的轮次一定已经结束
+            write_checkpoint(current_round, new_global_cid, receipt.transactionHash.hex(), self.dirs["checkpoint"])
+            relay.discard_round(current_round, self.dirs["relay"])
+            self._relay_checked.clear()
+            self.store.tag_round(current_round, [new_global_cid] + model_update_cids)
+            removed = self.store.collect_garbage(STORE_KEEP_ROUNDS, extra_cids=[new_global_cid])
+            if removed:
+                print(f"  - 🧹 已从本地存储回收 {removed} 个旧模型对象。")
+            recorder.record_peak_rss()
+            recorder.flush()
+            return True
         except Exception as e:
             print(f"  - ❌ 结束回合失败: {e}")
+            return False
+
+    # --- 常驻服务模式 ---
+    def serve(self, from_block=0):
+        """
+        常驻服务：从 from_block 开始用区块范围过滤器订阅 UpdateSubmitted 日志，并在内存中维护游标。
+        某一轮收集到的更新达到 updatesNeeded 时立即聚合并结束该轮；更新的 CID 与基准轮次直接取自事件，
+        不再逐个调用 roundUpdates。合约设置了轮次超时时，过了截止时间也会用已到达的更新提前结束本轮
+        （异步 / FedBuff 模式下 updatesNeeded 即缓冲区大小 K）。客户端交给聚合者转发的签名更新同样计入法定数量，
+        并在结束本轮的同一笔交易中上链。测试集、评估模型与合约对象在轮次之间常驻内存。
+        从 stdin 读到 "exit" 或 EOF 时退出。
+        """
+        stop_requested = threading.Event()
+
+        def watch_stdin():
+            for command in sys.stdin:
+                if command.strip() == "exit":
+                    break
+            stop_requested.set()
+
+        threading.Thread(target=watch_stdin, daemon=True).start()
+
+        state = self.reader.round_state()
+        updates_needed, current_round = state["updates_needed"], state["current_round"]
+        self.global_model_cid = state["global_model_cid"]
+        round_deadline = self.contract.functions.roundDeadline().call()
+        # 每轮收到的 (客户端地址, CID, 基准轮次)
+        pending_updates = defaultdict(list)
+        cursor = from_block
+        print(f"\n[聚合者] 常驻服务已启动：第 {current_round} 轮，每轮需要 {updates_needed} 个更新，从区块 {cursor} 开始监听。")
+        self._recover_history(current_round)
+        _signal_server("READY")
+
+        while not stop_requested.is_set():
+            latest_block = self.w3.eth.block_number
+            if latest_block >= cursor:
+                events = self.contract.events.UpdateSubmitted.getLogs(fromBlock=cursor, toBlock=latest_block)
+                for event in events:
+                    # 已结束的轮次（包括本服务刚批量转发上链的更新）不再需要跟踪
+                    if event.args.round < current_round:
+                        continue
+                    pending_updates[event.args.round].append(
+                        (event.args.clientAddress, cid_from_bytes32(event.args.modelCID), event.args.baseRound)
+                    )
+                cursor = latest_block + 1
+
+            received = pending_updates[current_round]
+            relayed = self._collect_relayed(current_round, {address for address, _, _ in received})
+            updates = list(received) + [(client, cid, base_round) for client, cid, base_round, _ in relayed]
+            quorum_reached = len(updates) >= updates_needed
+            timed_out = bool(updates) and round_deadline != 0 and time.time() >= round_deadline
+            if quorum_reached or timed_out:
+                reason = "达到法定数量" if quorum_reached else "已超过本轮截止时间"
+                print(f"\n[聚合者] 第 {current_round} 轮已收到 {len(updates)} 个更新（其中 {len(relayed)} 个待转发），{reason}，开始聚合...")
+                if self._aggregate_and_finalize(current_round, updates, relayed):
+                    del pending_updates[current_round]
+                    _signal_server("ROUND_FINALIZED")
+                    current_round += 1
+                else:
+                    _signal_server("ROUND_FAILED")
+                    # 以链上状态为准重新同步轮次，稍后重试
+                    state = self.reader.round_state()
+                    current_round, self.global_model_cid = state["current_round"], state["global_model_cid"]
+                    stop_requested.wait(EVENT_POLL_INTERVAL)
+                # 结束一轮后合约会为新一轮重新计时
+                round_deadline = self.contract.functions.roundDeadline().call()
+            else:
+                stop_requested.wait(EVENT_POLL_INTERVAL)
+
+
+def _signal_server(*fields):
+    """向 server.py 发送一条控制信号（独占一行，带固定前缀，以便与普通日志区分）。"""
+    print(WORKER_SIGNAL_PREFIX, *fields, flush=True)
+
 
 if __name__ == "__main__":
+    config.strip_proxy_env()
+    metrics.configure("aggregator")
     aggregator = Aggregator(private_key=AGGREGATOR_PRIVATE_KEY)
-    aggregator.finalize_current_round()
\ No newline at end of file
+    try:
+        if "--serve" in sys.argv[1:]:
+            aggregator.serve()
+        else:
+            aggregator.finalize_current_round()
+    finally:
+        aggregator.wait_for_evaluations()
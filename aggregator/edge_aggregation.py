@@ -0,0 +1,201 @@
+import datetime
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+import torch
+import torch.distributed as dist
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+from model_io import (
+    load_model_update, accumulate_update, finalize_average, load_state_dict, rebase_update,
+    write_partial_sum, load_partial_sum,
+)
+from model_store import ModelStore
+from robust_aggregation import ParameterLayout
+from utils.fileio import atomic_write
+
+# --- 分层（边缘）聚合 ---
+# 客户端很多时，单个聚合器读取全部更新会让它的磁盘与内存成为瓶颈。分层模式下，按到达顺序排列的更新被切成
+# 若干段连续的分片，每个边缘聚合进程只读取自己分片中的更新，流式地累加出加权部分和 Σ w·Δ 与总权重 Σ w
+# （与扁平 FedAvg 的累加器含义相同，见 model_io.accumulate_update）；根聚合器把各部分和相加后只做一次平均。
+# 除浮点加法的结合顺序外，结果与扁平 FedAvg 相同；整数缓冲区沿用最后一个更新的值，因此分片必须保持顺序。
+# 部分和的合并方式：
+#   "files" —— 边缘把部分和写入 EDGE_PARTIALS_DIR 下的平铺张量文件，根聚合器逐个映射读取并相加
+#              （多机部署时即边缘节点把部分和文件交给根节点）；
+#   "gloo"  —— 根聚合器与各边缘进程组成 torch.distributed 进程组，在 CPU 上用 gloo 后端 reduce 到根聚合器。
+# 边缘聚合进程在每次聚合时以 spawn 方式启动，启动本身（导入 torch）约需一两秒，客户端数较少时不划算。
+COMBINE_MODES = ("files", "gloo")
+EDGE_PARTIALS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'saved_models', 'edge_partials'))
+# gloo 进程组的建立与集合通信超时（秒）
+GLOO_TIMEOUT = 600
+
+
+def split_shards(items, num_edges):
+    """把 items 切成至多 num_edges 段大小相差不超过 1 的连续分片（不产生空分片）。"""
+    num_edges = max(1, min(num_edges, len(items)))
+    size, extra = divmod(len(items), num_edges)
+    shards, start = [], 0
+    for i in range(num_edges):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(items[start:end])
+        start = end
+    return shards
+
+
+def reduce_shard(shard, store_root, base_cid=None, weighting="samples"):
+    """
+    边缘聚合：把分片 [(CID, 陈旧度系数, 换算基准 CID), ...] 中的更新逐个加权累加，返回 (部分和, 总权重)。
+    每个更新的权重为陈旧度系数乘以其样本数（weighting 为 "uniform" 时乘以 1），与 Aggregator._client_weight 一致；
+    换算基准不为 None 的完整模型先与该基准作差（见 Aggregator._delta_bases）。
+    """
+    store = ModelStore(store_root)
+    base_state_dict = load_state_dict(store.path(base_cid), mmap=True) if base_cid else None
+    accumulator, total_weight = None, 0.0
+    for cid, staleness_factor, update_base_cid in shard:
+        update, num_samples = load_model_update(store.path(cid), mmap=True)
+        if update_base_cid is not None:
+            update = rebase_update(update, load_state_dict(store.path(update_base_cid), mmap=True), base_state_dict)
+        weight = (float(num_samples) if weighting == "samples" else 1.0) * staleness_factor
+        accumulator = accumulate_update(accumulator, update, weight, base_state_dict)
+        total_weight += weight
+        del update
+    return accumulator, total_weight
+
+
+def combine_partial_sums(partials, base_state_dict=None):
+    """
+    把各边缘的 (部分和, 总权重) 按分片顺序相加后做一次平均，得到新的全局模型 state_dict。
+    partials 可以是生成器，内存中同时只有合并结果与一个部分和。
+    """
+    accumulator, total_weight = None, 0.0
+    for partial, weight in partials:
+        if accumulator is None:
+            accumulator = {key: value.clone() for key, value in partial.items()}
+        else:
+            for key, value in partial.items():
+                if value.is_floating_point():
+                    accumulator[key].add_(value)
+                else:
+                    accumulator[key].copy_(value)
+        total_weight += weight
+    return finalize_average(accumulator, total_weight, base_state_dict)
+
+
+# --- 边缘进程 ---
+
+def _edge_to_file(shard, store_root, base_cid, weighting, path):
+    accumulator, total_weight = reduce_shard(shard, store_root, base_cid, weighting)
+    with atomic_write(path, 'wb') as f:
+        write_partial_sum(f, accumulator, total_weight, len(shard))
+
+
+def _dense_keys(template):
+    return [key for key, value in template.items() if not value.is_floating_point()]
+
+
+def _pack(accumulator, total_weight, layout, dense_keys, include_dense):
+    """
+    把部分和打包成两条可 reduce 的向量：浮点参数（float32，按 ParameterLayout 展平）与
+    [总权重, 整数缓冲区...]（float64，整数缓冲区只由最后一个分片填写，其余为 0，求和后即为最后一个值）。
+    """
+    params = layout.flatten(accumulator) if accumulator is not None else torch.zeros(layout.num_parameters)
+    extras = [torch.tensor([total_weight], dtype=torch.float64)]
+    for key in dense_keys:
+        value = layout.template[key]
+        extras.append(accumulator[key].reshape(-1).to(torch.float64) if include_dense
+                      else torch.zeros(value.numel(), dtype=torch.float64))
+    return params, torch.cat(extras)
+
+
+def _init_gloo(init_file, rank, world_size):
+    dist.init_process_group(
+        "gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size,
+        timeout=datetime.timedelta(seconds=GLOO_TIMEOUT),
+    )
+
+
+def _edge_gloo(rank, world_size, init_file, shard, store_root, base_cid, weighting, is_last):
+    accumulator, total_weight = reduce_shard(shard, store_root, base_cid, weighting)
+    params, extras = _pack(accumulator, total_weight, ParameterLayout(accumulator), _dense_keys(accumulator), is_last)
+    _init_gloo(init_file, rank, world_size)
+    try:
+        dist.reduce(params, dst=0)
+        dist.reduce(extras, dst=0)
+    finally:
+        dist.destroy_process_group()
+
+
+def _start_processes(target, args_list):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=args, daemon=True) for args in args_list]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def _join_processes(processes):
+    for process in processes:
+        process.join()
+    failed = [i for i, process in enumerate(processes) if process.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"边缘聚合进程 {failed} 异常退出")
+
+
+# --- 根聚合器 ---
+
+def hierarchical_average(updates, store_root, num_edges, base_cid=None, combine="files", weighting="samples", partials_dir=None):
+    """
+    分层 FedAvg：updates 为按到达顺序排列的 [(CID, 陈旧度系数, 换算基准 CID 或 None), ...]，切成至多 num_edges 个分片，
+    分别由边缘进程归约后在本进程合并，返回新的全局模型 state_dict（CPU 张量）。
+    base_cid 为当前全局模型（客户端压缩增量的基准）在存储中的 CID，没有时传 None。
+    """
+    if combine not in COMBINE_MODES:
+        raise ValueError(f"未知的部分和合并方式: {combine}（可选: {', '.join(COMBINE_MODES)}）")
+    store = ModelStore(store_root)
+    base_state_dict = load_state_dict(store.path(base_cid), mmap=True) if base_cid else None
+    shards = split_shards(list(updates), num_edges)
+    partials_dir = partials_dir or EDGE_PARTIALS_DIR
+    os.makedirs(partials_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=partials_dir)
+    try:
+        if combine == "files":
+            paths = [os.path.join(work_dir, f"edge_{i}.safetensors") for i in range(len(shards))]
+            _join_processes(_start_processes(_edge_to_file, [
+                (shard, store_root, base_cid, weighting, path) for shard, path in zip(shards, paths)
+            ]))
+            partials = (load_partial_sum(path)[:2] for path in paths)
+            return combine_partial_sums(partials, base_state_dict)
+
+        # gloo：本进程为 0 号进程，只接收 reduce 的结果；边缘进程为 1..len(shards) 号
+        world_size = len(shards) + 1
+        init_file = os.path.join(work_dir, "rendezvous")
+        processes = _start_processes(_edge_gloo, [
+            (rank, world_size, init_file, shard, store_root, base_cid, weighting, rank == len(shards))
+            for rank, shard in enumerate(shards, start=1)
+        ])
+        try:
+            # 没有基准模型时（第一轮）以第一个更新确定参数布局，只读取文件头部
+            template = base_state_dict if base_state_dict is not None else \
+                load_model_update(store.path(shards[0][0][0], verify=False), mmap=True)[0]
+            layout, dense_keys = ParameterLayout(template), _dense_keys(template)
+            params, extras = _pack(None, 0.0, layout, dense_keys, include_dense=False)
+            _init_gloo(init_file, 0, world_size)
+            try:
+                dist.reduce(params, dst=0)
+                dist.reduce(extras, dst=0)
+            finally:
+                dist.destroy_process_group()
+        finally:
+            _join_processes(processes)
+        accumulator = layout.unflatten(params)
+        offset = 1
+        for key in dense_keys:
+            value = template[key]
+            accumulator[key] = extras[offset:offset + value.numel()].reshape(value.shape).to(value.dtype)
+            offset += value.numel()
+        return finalize_average(accumulator, extras[0].item(), base_state_dict)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
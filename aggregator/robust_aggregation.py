@@ -0,0 +1,156 @@
+import torch
+from collections import OrderedDict
+
+# 向量化的聚合引擎：把每个客户端的 state_dict 展平成一条连续的参数向量并堆叠为 N×P 矩阵，
+# 所有聚合规则都以整块张量运算完成，而不是按参数名逐个循环。
+
+
+class ParameterLayout:
+    """
+    记录 state_dict 中各浮点参数在展平向量里的位置，负责展平与还原。
+    非浮点缓冲区（如 BatchNorm 的计数器）不参与聚合，还原时从模板 state_dict 中原样拷贝。
+    """
+    def __init__(self, template_state_dict):
+        self.template = template_state_dict
+        self.entries = []
+        offset = 0
+        for key, value in template_state_dict.items():
+            if value.is_floating_point():
+                self.entries.append((key, offset, value.numel(), value.shape, value.dtype))
+                offset += value.numel()
+        self.num_parameters = offset
+
+    def flatten_into(self, out_row, state_dict):
+        for key, offset, numel, _, _ in self.entries:
+            out_row[offset:offset + numel].copy_(state_dict[key].reshape(-1))
+        return out_row
+
+    def flatten(self, state_dict):
+        return self.flatten_into(torch.empty(self.num_parameters, dtype=torch.float32), state_dict)
+
+    def unflatten(self, vector):
+        state_dict = OrderedDict()
+        entries = {key: (offset, numel, shape, dtype) for key, offset, numel, shape, dtype in self.entries}
+        for key, value in self.template.items():
+            if key in entries:
+                offset, numel, shape, dtype = entries[key]
+                state_dict[key] = vector[offset:offset + numel].reshape(shape).to(dtype).clone()
+            else:
+                state_dict[key] = value.clone()
+        return state_dict
+
+
+def stack_state_dicts(state_dicts, num_clients=None):
+    """
+    把 state_dict 序列展平并堆叠为 N×P 矩阵，返回 (matrix, layout)。
+    state_dicts 可以是生成器：矩阵按行预分配并逐行填充，内存中不需要同时保留 N 个 state_dict。
+    """
+    iterator = iter(state_dicts)
+    first = next(iterator)
+    layout = ParameterLayout(first)
+    if num_clients is None:
+        rest = list(iterator)
+        num_clients = 1 + len(rest)
+        iterator = iter(rest)
+    matrix = torch.empty(num_clients, layout.num_parameters, dtype=torch.float32)
+    layout.flatten_into(matrix[0], first)
+    for row, state_dict in enumerate(iterator, start=1):
+        layout.flatten_into(matrix[row], state_dict)
+    return matrix, layout
+
+
+# --- 聚合规则 ---
+# 每条规则接收 N×P 矩阵（以及可选的 N 维权重），返回长度为 P 的聚合向量。
+
+def weighted_mean(matrix, weights=None):
+    if weights is None:
+        return matrix.mean(dim=0)
+    weights = torch.as_tensor(weights, dtype=matrix.dtype)
+    return (weights / weights.sum()) @ matrix
+
+
+def coordinate_median(matrix, weights=None):
+    """逐坐标中位数；客户端数为偶数时取中间两个值的平均。"""
+    num_clients = matrix.shape[0]
+    sorted_values = matrix.sort(dim=0).values
+    mid = num_clients // 2
+    if num_clients % 2 == 1:
+        return sorted_values[mid]
+    return (sorted_values[mid - 1] + sorted_values[mid]) / 2
+
+
+def trimmed_mean(matrix, weights=None, trim_ratio=0.1):
+    """逐坐标截尾均值：每个坐标上去掉最大和最小的 trim_ratio 比例后取平均。"""
+    num_clients = matrix.shape[0]
+    num_trimmed = int(trim_ratio * num_clients)
+    if 2 * num_trimmed >= num_clients:
+        raise ValueError(f"trim_ratio={trim_ratio} 对 {num_clients} 个客户端来说过大。")
+    sorted_values = matrix.sort(dim=0).values
+    return sorted_values[num_trimmed:num_clients - num_trimmed].mean(dim=0)
+
+
+def krum_scores(matrix, num_byzantine):
+    """Krum 分数：每个更新到其最近的 N - f - 2 个其他更新的平方距离之和。"""
+    num_clients = matrix.shape[0]
+    num_neighbours = num_clients - num_byzantine - 2
+    if num_neighbours < 1:
+        raise ValueError(f"Krum 要求客户端数 > 2f + 2（当前 N={num_clients}, f={num_byzantine}）。")
+    distances = torch.cdist(matrix, matrix).pow_(2)
+    distances.fill_diagonal_(float('inf'))
+    return distances.topk(num_neighbours, dim=1, largest=False).values.sum(dim=1)
+
+
+def multi_krum(matrix, weights=None, num_byzantine=0, num_selected=None):
+    """Multi-Krum：选出分数最低的 num_selected 个更新并取平均（num_selected=1 即为 Krum）。"""
+    num_clients = matrix.shape[0]
+    if num_selected is None:
+        num_selected = num_clients - num_byzantine
+    selected = krum_scores(matrix, num_byzantine).topk(num_selected, largest=False).indices
+    selected_weights = None if weights is None else torch.as_tensor(weights, dtype=matrix.dtype)[selected]
+    return weighted_mean(matrix[selected], selected_weights)
+
+
+def krum(matrix, weights=None, num_byzantine=0):
+    return multi_krum(matrix, weights, num_byzantine=num_byzantine, num_selected=1)
+
+
+def clip_by_norm(matrix, max_norm, reference):
+    """
+    范数裁剪：把每个客户端相对 reference（当前全局模型）的更新量的 L2 范数限制在 max_norm 以内。
+    原地修改 matrix 并返回。
+    """
+    matrix.sub_(reference)
+    norms = matrix.norm(dim=1, keepdim=True)
+    matrix.mul_(torch.clamp(max_norm / (norms + 1e-12), max=1.0))
+    matrix.add_(reference)
+    return matrix
+
+
+AGGREGATION_RULES = {
+    "mean": weighted_mean,
+    "median": coordinate_median,
+    "trimmed_mean": trimmed_mean,
+    "krum": krum,
+    "multi_krum": multi_krum,
+}
+
+
+def aggregate_matrix(matrix, rule, weights=None, clip_norm=None, reference=None, **rule_options):
+    """对已堆叠的 N×P 矩阵执行（可选的）范数裁剪和指定的聚合规则，返回长度为 P 的向量。"""
+    if rule not in AGGREGATION_RULES:
+        raise ValueError(f"未知的聚合规则: {rule}（可选: {', '.join(AGGREGATION_RULES)}）")
+    # 裁剪的对象是相对全局模型的更新量；还没有全局模型时（第一轮）行向量是完整的模型参数，
+    # 把它们裁剪到 clip_norm 会毁掉模型，因此跳过
+    if clip_norm is not None and reference is not None:
+        clip_by_norm(matrix, clip_norm, reference)
+    return AGGREGATION_RULES[rule](matrix, weights, **rule_options)
+
+
+def robust_aggregate(state_dicts, rule, weights=None, clip_norm=None, reference_state_dict=None, num_clients=None, **rule_options):
+    """
+    对一组客户端 state_dict 执行向量化聚合，返回与输入结构相同的 state_dict（可直接加载到 ComplexCNN）。
+    """
+    matrix, layout = stack_state_dicts(state_dicts, num_clients=num_clients)
+    reference = None if reference_state_dict is None else layout.flatten(reference_state_dict)
+    vector = aggregate_matrix(matrix, rule, weights=weights, clip_norm=clip_norm, reference=reference, **rule_options)
+    return layout.unflatten(vector)
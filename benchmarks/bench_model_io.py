@@ -0,0 +1,109 @@
+"""
+模型读写基准测试：比较平铺张量格式（safetensors 布局）与旧的 torch.save（.pth）格式的写入与读取吞吐量。
+
+用法:
+    python benchmarks/bench_model_io.py [--widths 1 2 4] [--repeat 5] [--output results.json]
+
+每个模型宽度（ComplexCNN 的 width，用来构造不同大小的 state_dict）、每种格式测量：
+  - save：把 state_dict 流式写入文件（含 fsync）；
+  - load_full：读取整个 state_dict 并逐个张量访问全部数据（模拟聚合器累加）；
+  - load_one：打开文件后只取一个张量（平铺格式按需映射；.pth 必须先反序列化整个文件）。
+load_* 分别测量 mmap=True 与 mmap=False。文件刚写完，读取发生在页缓存已热的情况下，
+因此结果反映的是反序列化与拷贝开销，而不是磁盘带宽。每项取 --repeat 次中的中位数，吞吐量按文件大小计算。
+model_io 已不再读写 .pth，这里的 .pth 基线直接调用 torch.save / torch.load，仅作对比。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+from models import ComplexCNN
+from model_io import TensorFile, write_state_dict, load_state_dict
+
+FORMATS = ("safetensors", "pth")
+
+
+def median_seconds(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def save_synced(path, state_dict, model_format):
+    with open(path, 'wb') as f:
+        if model_format == "pth":
+            torch.save(state_dict, f)
+        else:
+            write_state_dict(f, state_dict)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def touch_all(state_dict):
+    # 求和会读取每个张量的全部数据，mmap 的页因此真正被读入
+    return sum(float(value.float().sum()) for value in state_dict.values())
+
+
+def load_full(path, model_format, mmap):
+    if model_format == "pth":
+        return torch.load(path, map_location="cpu", mmap=mmap)
+    return load_state_dict(path, mmap=mmap)
+
+
+def load_one(path, model_format, name, mmap):
+    if model_format == "pth":
+        return load_full(path, model_format, mmap)[name].float().sum()
+    return TensorFile(path, mmap=mmap).get_tensor(name).float().sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型读写格式基准测试")
+    parser.add_argument("--widths", type=float, nargs="+", default=[1.0, 2.0, 4.0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="可选：把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'width':>5} {'format':>11} {'MB':>8} {'save_MB/s':>10} {'full_mmap':>10} {'full_read':>10} {'one_mmap':>10} {'one_read':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for width in args.widths:
+            state_dict = ComplexCNN(width=width).state_dict()
+            # 取最小的张量，突出“只读一个张量”时两种格式的差别
+            name = min(state_dict, key=lambda key: state_dict[key].numel())
+            for model_format in FORMATS:
+                path = os.path.join(tmp_dir, f"w{width}.{model_format}")
+                save_seconds = median_seconds(lambda: save_synced(path, state_dict, model_format), args.repeat)
+                size = os.path.getsize(path)
+                row = {"width": width, "format": model_format, "bytes": size, "save_seconds": save_seconds}
+                for mmap in (True, False):
+                    suffix = "mmap" if mmap else "read"
+                    row[f"load_full_{suffix}_seconds"] = median_seconds(
+                        lambda: touch_all(load_full(path, model_format, mmap)), args.repeat)
+                    row[f"load_one_{suffix}_seconds"] = median_seconds(
+                        lambda: load_one(path, model_format, name, mmap), args.repeat)
+                for key in list(row):
+                    if key.endswith("_seconds"):
+                        row[key.replace("_seconds", "_mb_per_s")] = size / 1e6 / row[key]
+                results.append(row)
+                print(f"{width:>5g} {model_format:>11} {size / 1e6:>8.2f} {row['save_mb_per_s']:>10.0f} "
+                      f"{row['load_full_mmap_mb_per_s']:>10.0f} {row['load_full_read_mb_per_s']:>10.0f} "
+                      f"{row['load_one_mmap_mb_per_s']:>10.0f} {row['load_one_read_mb_per_s']:>10.0f}")
+    print("（单位：MB/s，按文件大小计算）")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
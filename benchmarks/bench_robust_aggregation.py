@@ -0,0 +1,89 @@
+"""
+聚合规则基准测试：测量各聚合规则在不同客户端数量 (N) 与参数量 (P) 下的耗时。
+
+用法:
+    python benchmarks/bench_robust_aggregation.py [--clients 2 10 50 100] [--params 0 100000 1000000] [--repeat 3] [--output results.json]
+
+--params 中的 0 表示使用 ComplexCNN 的真实参数量。
+作为对照，"per_key_mean" 是旧版 _federated_averaging 中按参数名逐个 sum() 的 Python 循环实现。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'aggregator')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+from robust_aggregation import aggregate_matrix, stack_state_dicts
+from models import ComplexCNN
+
+
+def make_state_dicts(num_clients, num_params):
+    """生成 num_clients 个结构相同的 state_dict；num_params 为 0 时使用 ComplexCNN 的结构。"""
+    if num_params == 0:
+        template = ComplexCNN().state_dict()
+    else:
+        # 把参数量拆成若干个大小相近的张量，模拟多层网络
+        num_tensors = 8
+        template = OrderedDict((f"layer{i}.weight", torch.empty(num_params // num_tensors)) for i in range(num_tensors))
+    return [OrderedDict((key, torch.randn_like(value)) for key, value in template.items()) for _ in range(num_clients)]
+
+
+def per_key_mean(state_dicts):
+    return OrderedDict((key, sum(sd[key] for sd in state_dicts) / len(state_dicts)) for key in state_dicts[0])
+
+
+def time_call(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="聚合规则基准测试")
+    parser.add_argument("--clients", type=int, nargs="+", default=[2, 10, 50, 100])
+    parser.add_argument("--params", type=int, nargs="+", default=[0, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="可选：把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'N':>5} {'P':>10} {'rule':>14} {'seconds':>10}")
+    for num_params in args.params:
+        for num_clients in args.clients:
+            state_dicts = make_state_dicts(num_clients, num_params)
+            matrix, layout = stack_state_dicts(state_dicts)
+            num_byzantine = max(0, (num_clients - 3) // 2)
+            # 以客户端均值充当裁剪基准（当前全局模型）
+            reference = matrix.mean(dim=0)
+            rules = {
+                "per_key_mean": lambda: per_key_mean(state_dicts),
+                "stack": lambda: stack_state_dicts(state_dicts),
+                "mean": lambda: aggregate_matrix(matrix, "mean"),
+                "median": lambda: aggregate_matrix(matrix, "median"),
+                "trimmed_mean": lambda: aggregate_matrix(matrix, "trimmed_mean", trim_ratio=0.1),
+                "clip+mean": lambda: aggregate_matrix(matrix.clone(), "mean", clip_norm=1.0, reference=reference),
+            }
+            if num_clients > 2 * num_byzantine + 2:
+                rules["krum"] = lambda: aggregate_matrix(matrix, "krum", num_byzantine=num_byzantine)
+                rules["multi_krum"] = lambda: aggregate_matrix(matrix, "multi_krum", num_byzantine=num_byzantine)
+            for rule, fn in rules.items():
+                seconds = time_call(fn, args.repeat)
+                results.append({"clients": num_clients, "params": layout.num_parameters, "rule": rule, "seconds": seconds})
+                print(f"{num_clients:>5} {layout.num_parameters:>10} {rule:>14} {seconds:>10.4f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
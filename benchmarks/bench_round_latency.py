@@ -0,0 +1,269 @@
+"""
+端到端轮次延迟基准测试：在进程内的以太坊链（eth-tester + py-evm）上部署已编译的 FederatedLearning 合约，
+用真实的 FederatedLearningClient 与 Aggregator 跑完整的联邦学习轮次，统计各阶段耗时的 p50 / p95。
+
+用法:
+    python benchmarks/bench_round_latency.py [--clients 2 4 8] [--widths 0.5 1.0] [--rounds 5] [--warmup 1]
+        [--data synthetic|cifar] [--train-samples 512] [--test-samples 512] [--output logs/bench_round_latency.json]
+
+依赖：benchmarks/requirements.txt 中的 eth-tester 与 py-evm，以及已编译的合约（cd blockchain && npx hardhat compile）。
+
+每个 (客户端数, 模型宽度) 组合使用一条全新的链与一个临时目录（内容寻址存储、转发收件箱、奖励清单、检查点
+与日志都写在其中，不会影响正在进行的实验）。统计的阶段：
+  - train：客户端本地训练一个 epoch（Trainer.train）；
+  - serialise：客户端序列化模型更新并写入内容寻址存储；
+  - submit：客户端提交更新（转发模式下为签名并投递，交易模式下为发送交易并等待回执）；
+  - aggregate：聚合者读取并聚合本轮的全部更新；
+  - evaluate：聚合者在测试集上评估新的全局模型（基准中按同步模式执行）；
+  - finalise：聚合者一次 finalize_current_round 中除聚合与评估以外的部分
+    （读取轮次状态、校验转发签名、写出全局模型与奖励清单、发送并确认结束本轮的交易、写检查点）；
+  - round：一轮从第一个客户端开始训练到本轮在链上结束的墙钟时间。
+客户端按顺序运行，因此 round 约等于各客户端阶段之和加上聚合者的各阶段。
+--data cifar 使用本地 CIFAR-10 缓存的前若干条样本（不存在时会下载并生成缓存），默认使用随机生成的合成数据。
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+from web3 import Web3
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'aggregator')))
+import config
+import client as client_module
+import aggregator as aggregator_module
+import model_store
+from data_loader import CachedCIFAR10, make_data_loader
+from models import ComplexCNN
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DATA_PATH = os.path.join(PROJECT_ROOT, 'data')
+REWARD_TOKEN_ARTIFACT = os.path.join(PROJECT_ROOT, 'blockchain', 'artifacts', 'contracts', 'RewardToken.sol', 'RewardToken.json')
+# 部署前给聚合者与每个客户端转入的测试 ETH
+FUNDING_WEI = Web3.toWei(100, 'ether')
+DEFAULT_OUTPUT = os.path.join(PROJECT_ROOT, 'logs', 'bench_round_latency.json')
+STAGES = ("train", "serialise", "submit", "aggregate", "evaluate", "finalise", "round")
+
+
+class StageTimer:
+    """
+    给对象的方法套上计时包装。同一阶段在一次测量内可能被调用多次（例如序列化与写入存储），
+    耗时先累加到 pending 中，由 commit() 作为一个样本计入该阶段。
+    """
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.pending = defaultdict(float)
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.pending[stage] += time.perf_counter() - start
+        setattr(owner, name, timed)
+
+    def commit(self, stages, record=True):
+        """把 stages 的累计耗时作为各自的一个样本记录下来（record=False 时只清空，用于预热轮）。"""
+        committed = {stage: self.pending.pop(stage, 0.0) for stage in stages}
+        if record:
+            for stage, seconds in committed.items():
+                self.samples[stage].append(seconds)
+        return committed
+
+    def record(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    def summary(self):
+        result = {}
+        for stage in STAGES:
+            values = self.samples.get(stage)
+            if not values:
+                continue
+            p50, p95 = np.percentile(values, [50, 95])
+            result[stage] = {"p50": float(p50), "p95": float(p95), "mean": float(np.mean(values)), "samples": len(values)}
+        return result
+
+
+# --- 进程内的链 ---
+def make_chain():
+    try:
+        from web3 import EthereumTesterProvider
+        w3 = Web3(EthereumTesterProvider())
+    except ImportError as e:
+        raise SystemExit(f"需要 eth-tester 与 py-evm 作为进程内的链，请先安装 benchmarks/requirements.txt ({e})")
+    return w3
+
+
+def load_artifact(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise SystemExit(f"找不到合约编译产物 {path}，请先运行: cd blockchain && npx hardhat compile")
+
+
+def deploy(w3, artifact, deployer, *args):
+    factory = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+    receipt = w3.eth.wait_for_transaction_receipt(factory.constructor(*args).transact({'from': deployer}))
+    return w3.eth.contract(address=receipt.contractAddress, abi=artifact["abi"])
+
+
+def deploy_contracts(w3, owner_address, updates_needed):
+    """与 blockchain/scripts/deploy.ts 相同：部署 RewardToken 与 FederatedLearning，并把代币的所有权交给主合约。"""
+    deployer = w3.eth.accounts[0]
+    reward_token = deploy(w3, load_artifact(REWARD_TOKEN_ARTIFACT), deployer, deployer)
+    federated_learning = deploy(
+        w3, load_artifact(config.ABI_PATH), deployer,
+        reward_token.address, model_store.EMPTY_CID_BYTES, updates_needed, owner_address,
+    )
+    w3.eth.wait_for_transaction_receipt(
+        reward_token.functions.transferOwnership(federated_learning.address).transact({'from': deployer})
+    )
+    return federated_learning
+
+
+def fund(w3, addresses):
+    for address in addresses:
+        w3.eth.wait_for_transaction_receipt(
+            w3.eth.send_transaction({'from': w3.eth.accounts[0], 'to': address, 'value': FUNDING_WEI})
+        )
+
+
+# --- 数据 ---
+def synthetic_dataset(num_samples, seed):
+    rng = np.random.default_rng(seed)
+    images = rng.integers(0, 256, size=(num_samples, 3, 32, 32), dtype=np.uint8)
+    labels = rng.integers(0, 10, size=num_samples, dtype=np.int64)
+    return CachedCIFAR10(images, labels)
+
+
+def make_datasets(kind, num_clients, train_samples, test_samples):
+    """返回 (每个客户端的训练集列表, 测试集)。"""
+    if kind == "cifar":
+        train = CachedCIFAR10.open(DATA_PATH, train=True)
+        test = CachedCIFAR10.open(DATA_PATH, train=False)
+        shards = [train.slice(i * train_samples, (i + 1) * train_samples) for i in range(num_clients)]
+        return shards, test.slice(0, test_samples)
+    shards = [synthetic_dataset(train_samples, seed=i) for i in range(num_clients)]
+    return shards, synthetic_dataset(test_samples, seed=num_clients)
+
+
+# --- 单个场景 ---
+def run_scenario(num_clients, width, args):
+    timer = StageTimer()
+    model_fn = functools.partial(ComplexCNN, width=width)
+    train_shards, test_dataset = make_datasets(args.data, num_clients, args.train_samples, args.test_samples)
+    log = io.StringIO()
+    with tempfile.TemporaryDirectory(prefix="fl_bench_") as work_dir, \
+            contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(log))
+        w3 = make_chain()
+        private_keys = [config.client_private_key(i) for i in range(num_clients)]
+        aggregator_address = w3.eth.account.from_key(config.AGGREGATOR_PRIVATE_KEY).address
+        fund(w3, [aggregator_address] + [w3.eth.account.from_key(key).address for key in private_keys])
+        contract = deploy_contracts(w3, aggregator_address, updates_needed=num_clients)
+
+        aggregator = aggregator_module.Aggregator(
+            config.AGGREGATOR_PRIVATE_KEY, w3=w3, contract=contract,
+            test_loader=make_data_loader(test_dataset, batch_size=128), model_fn=model_fn, work_dir=work_dir,
+            # 评估计入本轮的延迟，而不是交给后台线程
+            evaluation_mode="sync",
+        )
+        clients = []
+        for client_id, (key, shard) in enumerate(zip(private_keys, train_shards)):
+            fl_client = client_module.FederatedLearningClient(
+                key, client_id, num_clients, w3=w3, contract=contract, train_dataset=shard, model_fn=model_fn,
+                work_dir=work_dir,
+            )
+            fl_client.register()
+            # 训练状态在计时之外构建，与常驻工作进程的稳态一致
+            trainer = fl_client._get_trainer()
+            timer.wrap(trainer, "train", "train")
+            # put_stream 内部调用 write_model_update 流式写入，计时已包含序列化
+            timer.wrap(fl_client.store, "put_stream", "serialise")
+            timer.wrap(fl_client, "_submit_update", "submit")
+            clients.append(fl_client)
+        timer.wrap(aggregator, "_aggregate", "aggregate")
+        timer.wrap(aggregator, "_evaluate_model", "evaluate")
+        num_params = sum(p.numel() for p in model_fn().parameters())
+
+        for r in range(args.warmup + args.rounds):
+            record = r >= args.warmup
+            round_start = time.perf_counter()
+            for fl_client in clients:
+                fl_client.run_training_round()
+                timer.commit(("train", "serialise", "submit"), record)
+            finalize_start = time.perf_counter()
+            if not aggregator.finalize_current_round():
+                raise RuntimeError(f"第 {r + 1} 轮未能结束，日志:\n{log.getvalue()[-4000:]}")
+            finalize_seconds = time.perf_counter() - finalize_start
+            round_seconds = time.perf_counter() - round_start
+            committed = timer.commit(("aggregate", "evaluate"), record)
+            if record:
+                timer.record("finalise", finalize_seconds - committed["aggregate"] - committed["evaluate"])
+                timer.record("round", round_seconds)
+
+        for fl_client in clients:
+            fl_client.tx_manager.shutdown()
+        aggregator.tx_manager.shutdown()
+    return {
+        "clients": num_clients, "width": width, "model_params": num_params,
+        "rounds": args.rounds, "warmup_rounds": args.warmup, "stages": timer.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端轮次延迟基准测试")
+    parser.add_argument("--clients", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--widths", type=float, nargs="+", default=[0.5, 1.0], help="ComplexCNN 的宽度系数（模型大小）")
+    parser.add_argument("--rounds", type=int, default=5, help="每个组合计入统计的轮数")
+    parser.add_argument("--warmup", type=int, default=1, help="每个组合开始时不计入统计的预热轮数")
+    parser.add_argument("--data", choices=["synthetic", "cifar"], default="synthetic")
+    parser.add_argument("--train-samples", type=int, default=512, help="每个客户端的训练样本数")
+    parser.add_argument("--test-samples", type=int, default=512)
+    parser.add_argument("--verbose", action="store_true", help="显示客户端与聚合者的日志")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果 JSON 文件，便于对比不同提交之间的回归")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    results = []
+    print(f"{'N':>4} {'width':>6} {'params':>10} {'stage':>10} {'p50 (s)':>10} {'p95 (s)':>10}")
+    for width in args.widths:
+        for num_clients in args.clients:
+            result = run_scenario(num_clients, width, args)
+            results.append(result)
+            for stage, stats in result["stages"].items():
+                print(f"{num_clients:>4} {width:>6g} {result['model_params']:>10} {stage:>10} {stats['p50']:>10.4f} {stats['p95']:>10.4f}")
+
+    report = {
+        "environment": {
+            "python": platform.python_version(), "torch": torch.__version__, "cpu_count": os.cpu_count(),
+            "device": "cuda" if torch.cuda.is_available() else "cpu", "data": args.data,
+            "train_samples": args.train_samples, "test_samples": args.test_samples,
+            "submission_mode": client_module.SUBMISSION_MODE, "training_mode": client_module.TRAINING_MODE,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+冷启动基准测试：测量各入口模块（不执行 main）在全新解释器中的导入耗时，并与预算比较。
+
+用法:
+    python benchmarks/bench_startup.py [--entry client aggregator] [--repeat 5] [--budget client=4.0] [--top 10] [--output results.json]
+
+每个入口在全新的 python -X importtime 子进程中导入 --repeat 次：
+  - wall_seconds：子进程从启动到退出的墙钟时间（取中位数），包含解释器本身的启动；
+  - import_seconds：-X importtime 报告的顶层模块累计导入时间之和；
+  - slowest：累计导入时间最长的若干个顶层模块，便于定位拖慢启动的依赖。
+任何入口的 wall_seconds 超出预算时以退出码 1 结束。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+ENTRY_POINTS = {
+    "client": os.path.join(PROJECT_ROOT, 'client', 'client.py'),
+    "aggregator": os.path.join(PROJECT_ROOT, 'aggregator', 'aggregator.py'),
+}
+# 各入口的默认冷启动预算（秒）：torch 与 web3 按需导入后两个入口实测约 0.1 秒，预算留出约 5 倍余量；
+# 任何一个重量级依赖重新回到模块顶层（torch 约 2 秒、web3 约 0.5 秒）都会超出预算
+DEFAULT_BUDGETS = {
+    "client": 0.5,
+    "aggregator": 0.5,
+}
+
+# 以模块而不是 __main__ 的身份执行入口文件：只运行顶层导入，不进入 main。
+# 与直接运行脚本一样，把入口所在目录放在 sys.path 最前面
+IMPORT_SNIPPET = (
+    "import importlib.util, os, sys; "
+    "sys.path.insert(0, os.path.dirname(sys.argv[1])); "
+    "spec = importlib.util.spec_from_file_location('fl_entry', sys.argv[1]); "
+    "spec.loader.exec_module(importlib.util.module_from_spec(spec))"
+)
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 {顶层模块: 累计耗时（秒）}。"""
+    top_level = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # 嵌套导入的模块名带有额外的缩进，顶层模块只有一个前导空格
+        if not name.startswith("  "):
+            top_level[name.strip()] = int(cumulative) / 1e6
+    return top_level
+
+
+def measure(entry_path, repeat):
+    wall_times, import_times, last_profile = [], [], {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET, entry_path],
+            cwd=PROJECT_ROOT, capture_output=True, text=True,
+        )
+        wall_times.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"导入 {entry_path} 失败:\n{result.stderr[-2000:]}")
+        last_profile = parse_importtime(result.stderr)
+        import_times.append(sum(last_profile.values()))
+    return statistics.median(wall_times), statistics.median(import_times), last_profile
+
+
+def parse_budgets(items):
+    budgets = dict(DEFAULT_BUDGETS)
+    for item in items or []:
+        name, _, seconds = item.partition("=")
+        budgets[name] = float(seconds)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入口冷启动基准测试")
+    parser.add_argument("--entry", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", nargs="*", help="覆盖默认预算，格式为 name=seconds")
+    parser.add_argument("--top", type=int, default=10, help="列出累计导入时间最长的顶层模块数")
+    parser.add_argument("--output", help="可选：把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    budgets = parse_budgets(args.budget)
+    results, over_budget = [], []
+    for name in args.entry:
+        wall_seconds, import_seconds, profile = measure(ENTRY_POINTS[name], args.repeat)
+        slowest = sorted(profile.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        budget = budgets.get(name)
+        within_budget = budget is None or wall_seconds <= budget
+        if not within_budget:
+            over_budget.append(name)
+        results.append({
+            "entry": name, "wall_seconds": wall_seconds, "import_seconds": import_seconds,
+            "budget_seconds": budget, "within_budget": within_budget,
+            "slowest": [{"module": module, "seconds": seconds} for module, seconds in slowest],
+        })
+        status = "OK" if within_budget else "超出预算"
+        print(f"{name:>12}: 墙钟 {wall_seconds:.3f}s，导入 {import_seconds:.3f}s，预算 {budget}s —— {status}")
+        for module, seconds in slowest:
+            print(f"{'':>14}{module:<30} {seconds:.3f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if over_budget:
+        print(f"❌ 以下入口超出冷启动预算: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
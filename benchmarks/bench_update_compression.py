@@ -0,0 +1,123 @@
+"""
+模型更新压缩基准测试：比较各压缩方案的写入/读取字节数、编解码耗时、重建误差和准确率损失。
+
+用法:
+    python benchmarks/bench_update_compression.py [--topk-ratio 0.01] [--train-batches 0] [--evaluate] [--output results.json]
+
+默认用 "基准模型 + 高斯增量" 模拟一轮本地训练；--train-batches N 会在客户端 0 的 CIFAR-10 分片上真实训练 N 个批次。
+--evaluate 会在 CIFAR-10 测试集上评估解码后的模型，并与未压缩模型的准确率对比。
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import torch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+from models import ComplexCNN
+from model_io import COMPRESSION_SCHEMES, compress_update, decode_update, save_model_update, load_model_update
+
+
+def make_trained_state_dict(base_model, train_batches):
+    model = ComplexCNN()
+    model.load_state_dict(base_model.state_dict())
+    if train_batches == 0:
+        with torch.no_grad():
+            for param in model.parameters():
+                param.add_(torch.randn_like(param) * 1e-2)
+        return model.state_dict()
+
+    from data_loader import load_cifar10, make_data_loader
+    loader = make_data_loader(load_cifar10(client_id=0, num_clients=1), batch_size=64, shuffle=True)
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+    criterion = torch.nn.CrossEntropyLoss()
+    model.train()
+    for i, (inputs, labels) in enumerate(loader):
+        if i >= train_batches:
+            break
+        optimizer.zero_grad()
+        criterion(model(inputs), labels).backward()
+        optimizer.step()
+    return model.state_dict()
+
+
+def evaluate(state_dict, test_loader):
+    model = ComplexCNN()
+    model.load_state_dict(state_dict)
+    model.eval()
+    correct, total = 0, 0
+    with torch.no_grad():
+        for images, labels in test_loader:
+            correct += (model(images).argmax(dim=1) == labels).sum().item()
+            total += labels.size(0)
+    return 100 * correct / total
+
+
+def relative_error(state_dict, reference):
+    num = sum((state_dict[k].float() - reference[k].float()).pow(2).sum().item() for k in reference if reference[k].is_floating_point())
+    den = sum(reference[k].float().pow(2).sum().item() for k in reference if reference[k].is_floating_point())
+    return (num / den) ** 0.5
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型更新压缩基准测试")
+    parser.add_argument("--topk-ratio", type=float, default=0.01)
+    parser.add_argument("--train-batches", type=int, default=0)
+    parser.add_argument("--evaluate", action="store_true")
+    parser.add_argument("--output", help="可选：把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    base_model = ComplexCNN()
+    base_state_dict = base_model.state_dict()
+    trained_state_dict = make_trained_state_dict(base_model, args.train_batches)
+    delta_reference = {k: trained_state_dict[k].float() - base_state_dict[k].float() for k in base_state_dict}
+
+    test_loader = None
+    if args.evaluate:
+        from data_loader import load_cifar10_test
+        test_loader = load_cifar10_test()
+        baseline_accuracy = evaluate(trained_state_dict, test_loader)
+
+    results = []
+    print(f"{'scheme':>6} {'bytes':>12} {'ratio':>7} {'encode_s':>9} {'decode_s':>9} {'delta_rel_err':>14} {'accuracy':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scheme in COMPRESSION_SCHEMES:
+            path = os.path.join(tmp_dir, f"{scheme}.safetensors")
+            start = time.perf_counter()
+            update, _ = compress_update(trained_state_dict, base_state_dict, scheme, topk_ratio=args.topk_ratio)
+            bytes_written = save_model_update(path, update, num_samples=1)
+            encode_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded, _ = load_model_update(path)
+            decoded = decode_update(loaded, base_state_dict)
+            decode_seconds = time.perf_counter() - start
+
+            decoded_delta = {k: decoded[k].float() - base_state_dict[k].float() for k in base_state_dict}
+            row = {
+                "scheme": scheme, "bytes": bytes_written, "encode_seconds": encode_seconds,
+                "decode_seconds": decode_seconds, "delta_relative_error": relative_error(decoded_delta, delta_reference),
+            }
+            if test_loader is not None:
+                row["accuracy"] = evaluate(decoded, test_loader)
+                row["accuracy_drop"] = baseline_accuracy - row["accuracy"]
+            results.append(row)
+
+    full_bytes = results[0]["bytes"]
+    for row in results:
+        accuracy = f"{row['accuracy']:.2f}" if "accuracy" in row else "-"
+        print(f"{row['scheme']:>6} {row['bytes']:>12} {full_bytes / row['bytes']:>6.1f}x {row['encode_seconds']:>9.4f} "
+              f"{row['decode_seconds']:>9.4f} {row['delta_relative_error']:>14.4f} {accuracy:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
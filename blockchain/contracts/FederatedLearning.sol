@@ -3,19 +3,32 @@ pragma solidity ^0.8.28;
 
 import {RewardToken} from "./RewardToken.sol";
 import {Ownable} from "@openzeppelin/contracts/access/Ownable.sol";
+import {MerkleProof} from "@openzeppelin/contracts/utils/cryptography/MerkleProof.sol";
+import {EIP712} from "@openzeppelin/contracts/utils/cryptography/EIP712.sol";
+import {ECDSA} from "@openzeppelin/contracts/utils/cryptography/ECDSA.sol";
 /**
  * @title FederatedLearning (联邦学习)
  * @dev 用于协调联邦学习流程的主合约。
  */
-// 继承自 Ownable 合约，意味着 FederatedLearning 合约本身也具有所有权管理功能
-contract FederatedLearning is Ownable {
+// 继承自 Ownable 合约，意味着 FederatedLearning 合约本身也具有所有权管理功能；
+// 继承 EIP712 以便校验客户端在链下签名、由聚合者批量转发的模型更新
+contract FederatedLearning is Ownable, EIP712 {
     // --- 状态变量 (State Variables) ---
     // 这些变量像合约的“记忆”，它们的值被永久存储在区块链上。
 
     RewardToken public rewardToken; // 指向我们部署的 RewardToken 合约的实例
     uint256 public currentRound;    // 记录当前是第几轮训练
-    string public globalModelCID;   // 存储当前全局模型的 IPFS 内容标识符 (CID)
-    uint256 public updatesNeeded;   // 每轮需要多少个客户端更新才能触发聚合
+    bytes32 public globalModelCID;  // 当前全局模型的 CID（模型文件的 SHA-256 摘要）；全零表示尚无全局模型
+    uint256 public updatesNeeded;   // 每轮需要多少个客户端更新才能触发聚合（异步模式下即缓冲区大小 K）
+    uint256 public roundTimeout;    // 轮次超时（秒）；为 0 表示不设超时，只能凑满 updatesNeeded 后结束
+    uint256 public roundDeadline;   // 当前轮次的截止时间戳；过了截止时间，只要收到过更新即可提前结束本轮
+
+    // 每轮奖励总额上限。各客户端的份额由聚合者在链下计算，只把分配表的 Merkle 根提交上链
+    uint256 public constant ROUND_REWARD = 100 * 1e18;
+
+    // 客户端链下签名的更新消息类型：客户端授权在第 round 轮提交基于 baseRound 训练的 modelCID
+    bytes32 public constant UPDATE_SUBMISSION_TYPEHASH =
+        keccak256("UpdateSubmission(uint256 round,bytes32 modelCID,uint256 baseRound)");
 
     // --- 数据结构 (Data Structures) ---
     // 自定义的数据类型，用于更好地组织和管理复杂数据。
@@ -29,7 +42,16 @@ contract FederatedLearning is Ownable {
     // 代表一次客户端提交的模型更新
     struct ModelUpdate {
         address clientAddress; // 提交更新的客户端地址
-        string modelCID;       // 该更新对应的模型文件的 IPFS CID
+        bytes32 modelCID;      // 该更新对应的模型文件的 CID
+        uint256 baseRound;     // 客户端训练时所基于的全局模型版本（轮次），用于计算陈旧度
+    }
+
+    // 由聚合者转发的一条签名更新
+    struct SignedUpdate {
+        address clientAddress; // 签名的客户端地址
+        bytes32 modelCID;      // 模型更新的 CID
+        uint256 baseRound;     // 训练时所基于的全局模型轮次
+        bytes signature;       // 客户端对 UpdateSubmission(currentRound, modelCID, baseRound) 的 EIP-712 签名
     }
 
     // --- 映射 (Mappings) ---
@@ -43,22 +65,30 @@ contract FederatedLearning is Ownable {
     // mapping(uint256 => ModelUpdate[]) 表示从一个轮次编号可以查询到该轮次所有模型更新组成的数组。
     mapping(uint256 => ModelUpdate[]) public roundUpdates;
 
+    // 每轮奖励分配表的 Merkle 根；叶子为 keccak256(keccak256(abi.encode(round, account, amount)))
+    mapping(uint256 => bytes32) public rewardRoots;
+    // 每轮每个地址是否已领取奖励，以及每轮已领取的奖励总额（不能超过 ROUND_REWARD）
+    mapping(uint256 => mapping(address => bool)) public rewardClaimed;
+    mapping(uint256 => uint256) public rewardsClaimedInRound;
+
     // --- 事件 (Events) ---
     // 用于向区块链外部的应用程序（如我们的Python脚本）广播合约内部发生的重要事情。
     // 外部应用可以监听这些事件并作出反应。`indexed` 关键字可以更快地按该参数搜索事件。
 
     event ClientRegistered(address indexed clientAddress);
-    event UpdateSubmitted(uint256 indexed round, address indexed clientAddress, string modelCID);
-    event RoundFinalized(uint256 indexed round, string newGlobalModelCID);
+    event UpdateSubmitted(uint256 indexed round, address indexed clientAddress, bytes32 modelCID, uint256 baseRound);
+    event RoundFinalized(uint256 indexed round, bytes32 newGlobalModelCID, bytes32 rewardRoot);
+    event RewardClaimed(uint256 indexed round, address indexed clientAddress, uint256 amount);
+    event RoundTimeoutUpdated(uint256 timeout, uint256 deadline);
 
     // --- 构造函数 (Constructor) ---
     // 在合约部署时仅执行一次的特殊函数，用于初始化合约的初始状态。
     constructor(
         address _rewardTokenAddress, // 奖励代币合约的地址
-        string memory _initialModelCID, // 初始全局模型的 IPFS CID
+        bytes32 _initialModelCID,    // 初始全局模型的 CID（全零表示从随机初始化开始）
         uint256 _updatesNeeded,      // 每轮需要的更新数量
         address initialOwner         // 本合约的初始所有者地址
-    ) Ownable(initialOwner) { // 调用 Ownable 的构造函数来设置所有者
+    ) Ownable(initialOwner) EIP712("FederatedLearning", "1") { // 设置所有者与 EIP-712 签名域
         rewardToken = RewardToken(_rewardTokenAddress);
         globalModelCID = _initialModelCID;
         updatesNeeded = _updatesNeeded;
@@ -85,65 +115,148 @@ contract FederatedLearning is Ownable {
     }
 
     /**
-     * @dev 为当前轮次提交一个模型更新。
-     * @param _modelCID 客户端本地训练后生成的模型更新的 IPFS CID。
+     * @dev 设置轮次超时，并从现在开始为当前轮次计时。
+     * @param _timeout 超时时长（秒）；为 0 时取消超时。
+     */
+    function setRoundTimeout(uint256 _timeout) public onlyOwner {
+        roundTimeout = _timeout;
+        roundDeadline = _timeout == 0 ? 0 : block.timestamp + _timeout;
+        emit RoundTimeoutUpdated(_timeout, roundDeadline);
+    }
+
+    /**
+     * @dev 为当前轮次提交一个基于当前全局模型训练的模型更新。
+     * @param _modelCID 客户端本地训练后生成的模型更新的 CID。
      * 前提条件：
      * 1. 调用者必须是一个已注册的客户端。
      * 2. 该客户端在本轮中尚未提交过更新。
      */
-    function submitUpdate(string memory _modelCID) public {
-        require(clients[msg.sender].isRegistered, "Client not registered.");
-        require(clients[msg.sender].lastSubmittedRound < currentRound, "Update already submitted for this round.");
+    function submitUpdate(bytes32 _modelCID) public {
+        _recordUpdate(msg.sender, _modelCID, currentRound);
+    }
+
+    /**
+     * @dev 提交一个标明了训练基准版本的模型更新（异步 / FedBuff 模式）。
+     * 客户端可能基于较早的全局模型训练，而在它训练期间全局模型已经前进了若干轮；
+     * 更新仍计入当前轮次，聚合者根据 currentRound - _baseRound 的陈旧度为其降权。
+     * @param _modelCID 模型更新的 CID。
+     * @param _baseRound 客户端训练时所基于的全局模型轮次，不能晚于当前轮次。
+     */
+    function submitVersionedUpdate(bytes32 _modelCID, uint256 _baseRound) public {
+        _recordUpdate(msg.sender, _modelCID, _baseRound);
+    }
+
+    /**
+     * @dev 记录一条客户端更新。无论更新是客户端直接提交的还是由聚合者转发的，都要求：
+     * 客户端已注册、本轮尚未提交过，且基准轮次不晚于当前轮次。
+     */
+    function _recordUpdate(address _client, bytes32 _modelCID, uint256 _baseRound) internal {
+        require(clients[_client].isRegistered, "Client not registered.");
+        require(clients[_client].lastSubmittedRound < currentRound, "Update already submitted for this round.");
+        require(_baseRound <= currentRound, "Base round is in the future.");
 
         // 更新客户端状态，记录它已经在本轮提交过了
-        clients[msg.sender].lastSubmittedRound = currentRound;
+        clients[_client].lastSubmittedRound = currentRound;
 
         // 将本次更新信息（一个 ModelUpdate 结构体）添加到当前轮次的更新数组中
         roundUpdates[currentRound].push(ModelUpdate({
-            clientAddress: msg.sender,
-            modelCID: _modelCID
+            clientAddress: _client,
+            modelCID: _modelCID,
+            baseRound: _baseRound
         }));
 
         // 触发 UpdateSubmitted 事件，广播这次提交的详细信息
-        emit UpdateSubmitted(currentRound, msg.sender, _modelCID);
+        emit UpdateSubmitted(currentRound, _client, _modelCID, _baseRound);
     }
 
     /**
-     * @dev 结束当前轮次，进行聚合、发奖，并开启下一轮。
-     * @param _newGlobalModelCID 聚合者在链下计算出的新全局模型的 IPFS CID。
+     * @dev 结束当前轮次：记录新的全局模型和本轮奖励分配表的 Merkle 根，并开启下一轮。
+     * 不再遍历本轮的更新逐个铸币、也不再删除更新数组，Gas 与参与的客户端数量无关；
+     * 客户端之后凭 Merkle 证明通过 claimReward 自行领取奖励。
+     * @param _newGlobalModelCID 聚合者在链下计算出的新全局模型的 CID。
+     * @param _rewardRoot 本轮奖励分配表的 Merkle 根（见 claimReward 中的叶子格式）。
      * 前提条件：
      * 1. 只有本合约的所有者（我们指定的聚合者）才能调用此函数。
-     * 2. 当前轮次收到的更新数量必须达到或超过 `updatesNeeded` 的要求。
+     * 2. 当前轮次收到的更新数量必须达到或超过 `updatesNeeded` 的要求；
+     *    或者已过本轮截止时间，且至少收到了一个更新（超时后以已到达的更新结束本轮）。
      */
-    function finalizeRound(string memory _newGlobalModelCID) public onlyOwner {
-        // `storage` 关键字表示 `updates` 是一个指向区块链存储中原始数据的指针，而不是内存中的副本。
-        // 对它的修改会直接改变区块链的状态。
-        ModelUpdate[] storage updates = roundUpdates[currentRound];
+    function finalizeRound(bytes32 _newGlobalModelCID, bytes32 _rewardRoot) public onlyOwner {
+        _finalizeRound(_newGlobalModelCID, _rewardRoot);
+    }
 
-        require(updates.length >= updatesNeeded, "Not enough updates to finalize the round.");
+    /**
+     * @dev 在一笔交易中记录一批由客户端链下签名、聚合者转发的更新，并结束当前轮次。
+     * 每条更新都必须带有对应客户端对 UpdateSubmission(currentRound, modelCID, baseRound) 的有效签名，
+     * 并与直接提交一样满足注册与“每轮只提交一次”的要求；任何一条不满足时整批回滚。
+     * 本轮此前直接提交的更新同样计入法定数量。
+     * @param _updates 签名更新列表。
+     * @param _newGlobalModelCID 聚合后新全局模型的 CID（聚合包含本批与本轮已有的全部更新）。
+     * @param _rewardRoot 本轮奖励分配表的 Merkle 根。
+     */
+    function submitBatchAndFinalize(
+        SignedUpdate[] calldata _updates,
+        bytes32 _newGlobalModelCID,
+        bytes32 _rewardRoot
+    ) public onlyOwner {
+        for (uint i = 0; i < _updates.length; i++) {
+            SignedUpdate calldata update = _updates[i];
+            bytes32 digest = _hashTypedDataV4(keccak256(abi.encode(
+                UPDATE_SUBMISSION_TYPEHASH, currentRound, update.modelCID, update.baseRound
+            )));
+            require(ECDSA.recover(digest, update.signature) == update.clientAddress, "Invalid update signature.");
+            _recordUpdate(update.clientAddress, update.modelCID, update.baseRound);
+        }
+        _finalizeRound(_newGlobalModelCID, _rewardRoot);
+    }
 
-        // --- 奖励分发 ---
-        // 在真实的论文项目中，这是可以重点创新的部分，例如根据模型质量、数据量等设计复杂的贡献度评估算法。
-        uint256 totalReward = 100 * 1e18; // 简单设定每轮总奖励为 100 个代币。`1e18` 是因为代币通常有18位小数。
-        uint256 rewardPerClient = totalReward / updates.length; // 简单地将总奖励平分给所有参与者。
+    function _finalizeRound(bytes32 _newGlobalModelCID, bytes32 _rewardRoot) internal {
+        uint256 updatesCount = roundUpdates[currentRound].length;
 
-        // 遍历本轮的所有更新，为每个做出贡献的客户端铸造并发送奖励代币
-        for (uint i = 0; i < updates.length; i++) {
-            rewardToken.mint(updates[i].clientAddress, rewardPerClient);
-        }
+        bool deadlinePassed = roundDeadline != 0 && block.timestamp >= roundDeadline;
+        require(
+            updatesCount >= updatesNeeded || (deadlinePassed && updatesCount > 0),
+            "Not enough updates to finalize the round."
+        );
+
+        // --- 奖励分配 ---
+        // 在真实的论文项目中，这是可以重点创新的部分，例如根据模型质量、数据量等设计复杂的贡献度评估算法。
+        // 分配表由聚合者在链下计算，这里只保存它的 Merkle 根；每轮发放总额以 ROUND_REWARD 为上限。
+        rewardRoots[currentRound] = _rewardRoot;
 
         // --- 更新全局状态 ---
         globalModelCID = _newGlobalModelCID; // 更新全局模型
         currentRound++; // 轮次加一，开启下一轮
+        if (roundTimeout != 0) {
+            roundDeadline = block.timestamp + roundTimeout; // 为新一轮重新计时
+        }
+
+        // 触发 RoundFinalized 事件，广播本轮已结束，并提供新的全局模型 CID 与奖励分配表的根
+        emit RoundFinalized(currentRound - 1, _newGlobalModelCID, _rewardRoot);
+    }
 
-        // （可选但推荐）删除上一轮的更新数据，可以释放存储空间，节省后续交易的 Gas 费用。
-        delete roundUpdates[currentRound - 1];
+    /**
+     * @dev 凭 Merkle 证明领取某一轮分配给调用者的奖励。
+     * @param _round 已结束的轮次。
+     * @param _amount 分配表中调用者在该轮的奖励数量。
+     * @param _proof 叶子 keccak256(keccak256(abi.encode(_round, msg.sender, _amount))) 到该轮根的证明
+     *               （相邻节点按大小排序后哈希，与 OpenZeppelin MerkleProof 一致）。
+     */
+    function claimReward(uint256 _round, uint256 _amount, bytes32[] calldata _proof) public {
+        bytes32 root = rewardRoots[_round];
+        require(root != bytes32(0), "No rewards for this round.");
+        require(!rewardClaimed[_round][msg.sender], "Reward already claimed.");
 
-        // 触发 RoundFinalized 事件，广播本轮已结束，并提供新的全局模型 CID
-        emit RoundFinalized(currentRound - 1, _newGlobalModelCID);
+        bytes32 leaf = keccak256(bytes.concat(keccak256(abi.encode(_round, msg.sender, _amount))));
+        require(MerkleProof.verifyCalldata(_proof, root, leaf), "Invalid reward proof.");
+        require(rewardsClaimedInRound[_round] + _amount <= ROUND_REWARD, "Round reward exceeded.");
+
+        rewardClaimed[_round][msg.sender] = true;
+        rewardsClaimedInRound[_round] += _amount;
+        rewardToken.mint(msg.sender, _amount);
+        emit RewardClaimed(_round, msg.sender, _amount);
     }
 
-        /**
+    /**
      * @dev 获取指定轮次收到的模型更新数量。
      * @param _round 要查询的轮次编号。
      * @return uint256 该轮次的更新数量。
@@ -151,4 +264,19 @@ contract FederatedLearning is Ownable {
     function getRoundUpdatesCount(uint256 _round) public view returns (uint256) {
         return roundUpdates[_round].length;
     }
+
+    /**
+     * @dev 一次性返回当前轮次的完整状态，供链下程序用一次 eth_call 取代多次单字段查询。
+     * @return round 当前轮次编号。
+     * @return needed 每轮需要的更新数量。
+     * @return modelCID 当前全局模型的 CID。
+     * @return updates 当前轮次已提交的全部模型更新（含各自的 baseRound）。
+     */
+    function getRoundState()
+        public
+        view
+        returns (uint256 round, uint256 needed, bytes32 modelCID, ModelUpdate[] memory updates)
+    {
+        return (currentRound, updatesNeeded, globalModelCID, roundUpdates[currentRound]);
+    }
 }
\ No newline at end of file
@@ -3,6 +3,14 @@ import "@nomicfoundation/hardhat-toolbox";
 
 const config: HardhatUserConfig = {
   solidity: "0.8.28",
+  networks: {
+    hardhat: {
+      // 预置账户数量：账户 0 为聚合者，其余依次分配给客户端（server.py 按客户端数设置）
+      accounts: {
+        count: Number(process.env.HARDHAT_ACCOUNT_COUNT ?? 20),
+      },
+    },
+  },
 };
 
 export default config;
@@ -22,8 +22,9 @@ async function main() {
   console.log(`✅ RewardToken deployed to: ${rewardTokenAddress}`);
 
   // 3. 部署 FederatedLearning 主合约
-  const initialModelCID = "Qm_Initial_Model_CID_Placeholder"; // 初始模型的IPFS哈希占位符
-  const updatesNeeded = 2; // 每轮需要2个更新
+  const initialModelCID = ethers.ZeroHash; // 初始全局模型的 CID（bytes32）；全零表示客户端从随机初始化开始
+  // 每轮需要的更新数量，由 server.py 通过环境变量 UPDATES_NEEDED 传入（默认 2）
+  const updatesNeeded = Number(process.env.UPDATES_NEEDED ?? 2);
   // 获取 FederatedLearning 合约工厂，即用于部署合约的抽象
   const federatedLearningFactory = await ethers.getContractFactory("FederatedLearning");
   // 使用合约工厂部署 FederatedLearning 合约实例，即创建合约
@@ -37,6 +38,13 @@ async function main() {
   const federatedLearningAddress = await federatedLearning.getAddress();
   console.log(`✅ FederatedLearning deployed to: ${federatedLearningAddress}`);
 
+  // 异步（缓冲）模式下由 server.py 通过 ROUND_TIMEOUT 传入轮次超时（秒），超时后聚合者可以用已到达的更新结束本轮
+  const roundTimeout = Number(process.env.ROUND_TIMEOUT ?? 0);
+  if (roundTimeout > 0) {
+    await (await federatedLearning.setRoundTimeout(roundTimeout)).wait();
+    console.log(`⏱️  Round timeout set to ${roundTimeout}s`);
+  }
+
   // 4. 将 RewardToken 的所有权转移给 FederatedLearning 合约，这是为了让主合约能够管理奖励发放
   console.log("\n🔄 Transferring ownership of RewardToken to FederatedLearning contract...");
   const tx = await rewardToken.transferOwnership(federatedLearningAddress);
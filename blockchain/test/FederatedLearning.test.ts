@@ -3,6 +3,7 @@ import { expect } from "chai"; // "chai" 是一个断言库，用来写 "期望
 import { ethers } from "hardhat"; // "ethers" 是一个与以太坊交互的库
 import { FederatedLearning, RewardToken } from "../typechain-types"; // 这是 Hardhat 编译后自动生成的合约类型定义
 import { HardhatEthersSigner } from "@nomicfoundation/hardhat-ethers/signers";
+import { RewardTree, equalSplit } from "./helpers/rewardTree";
 
 // `describe` 用来组织一组相关的测试，我们为 `FederatedLearning` 合约创建一个测试套件
 describe("FederatedLearning Contract Tests", function () {
@@ -14,7 +15,8 @@ describe("FederatedLearning Contract Tests", function () {
   let client2: HardhatEthersSigner; // 模拟第二个客户端
 
   // 定义一些在部署合约时需要用到的常量
-  const initialModelCID = "initial_model_cid_v1";
+  // CID 在链上以 bytes32 保存（模型文件的 SHA-256 摘要），测试中用任意字符串的哈希代替
+  const initialModelCID = ethers.id("initial_model_cid_v1");
   const updatesNeeded = 2;
 
   // `beforeEach` 是一个钩子函数，它会在每一个 `it(...)` 测试用例运行之前执行
@@ -75,7 +77,7 @@ describe("FederatedLearning Contract Tests", function () {
 
     // --- 第二个测试分组：测试模型更新提交功能 ---
   describe("Model Update Submission", function () {
-    const modelCID = "client1_model_update_cid";
+    const modelCID = ethers.id("client1_model_update_cid");
 
     // 在这个分组的每个测试用例开始前，我们先确保 client1 已经注册
     beforeEach(async function () {
@@ -86,7 +88,7 @@ describe("FederatedLearning Contract Tests", function () {
       // ... (the expect(...).to.emit(...) part remains the same) ...
       await expect(federatedLearning.connect(client1).submitUpdate(modelCID))
         .to.emit(federatedLearning, "UpdateSubmitted")
-        .withArgs(1, client1.address, modelCID);
+        .withArgs(1, client1.address, modelCID, 1);
 
       // 检查合约状态是否正确更新
       const clientInfo = await federatedLearning.clients(client1.address);
@@ -103,6 +105,33 @@ describe("FederatedLearning Contract Tests", function () {
       expect(firstUpdate.modelCID).to.equal(modelCID);
     });
 
+    it("Should return the whole round state in a single view call", async function () {
+      await federatedLearning.connect(client1).submitUpdate(modelCID);
+
+      const [round, needed, globalCID, updates] = await federatedLearning.getRoundState();
+      expect(round).to.equal(1);
+      expect(needed).to.equal(updatesNeeded);
+      expect(globalCID).to.equal(initialModelCID);
+      expect(updates.length).to.equal(1);
+      expect(updates[0].clientAddress).to.equal(client1.address);
+      expect(updates[0].modelCID).to.equal(modelCID);
+      expect(updates[0].baseRound).to.equal(1);
+    });
+
+    it("Should record the base round of a versioned update", async function () {
+      await expect(federatedLearning.connect(client1).submitVersionedUpdate(modelCID, 1))
+        .to.emit(federatedLearning, "UpdateSubmitted")
+        .withArgs(1, client1.address, modelCID, 1);
+
+      const firstUpdate = await federatedLearning.roundUpdates(1, 0);
+      expect(firstUpdate.baseRound).to.equal(1);
+    });
+
+    it("Should reject a versioned update based on a future round", async function () {
+      await expect(federatedLearning.connect(client1).submitVersionedUpdate(modelCID, 2))
+        .to.be.revertedWith("Base round is in the future.");
+    });
+
     it("Should prevent an unregistered client from submitting an update", async function () {
       // 断言：期望一个未注册的 client2 提交更新时，交易会失败
       await expect(federatedLearning.connect(client2).submitUpdate(modelCID))
@@ -114,59 +143,91 @@ describe("FederatedLearning Contract Tests", function () {
       await federatedLearning.connect(client1).submitUpdate(modelCID);
 
       // 断言：期望当 client1 尝试第二次提交时，交易会失败
-      await expect(federatedLearning.connect(client1).submitUpdate("another_cid"))
+      await expect(federatedLearning.connect(client1).submitUpdate(ethers.id("another_cid")))
         .to.be.revertedWith("Update already submitted for this round.");
     });
   });
 
   // --- 第三个测试分组：测试回合结束功能 ---
   describe("Round Finalization", function () {
-    const newGlobalModelCID = "new_global_model_cid_round_1";
+    const newGlobalModelCID = ethers.id("new_global_model_cid_round_1");
 
     // 在这个分组的每个测试用例开始前，我们先模拟一个完整的、已准备好结束的回合
     // 即：client1 和 client2 都已注册并提交了更新
     beforeEach(async function () {
       await federatedLearning.connect(client1).registerClient();
       await federatedLearning.connect(client2).registerClient();
-      await federatedLearning.connect(client1).submitUpdate("client1_update");
-      await federatedLearning.connect(client2).submitUpdate("client2_update");
+      await federatedLearning.connect(client1).submitUpdate(ethers.id("client1_update"));
+      await federatedLearning.connect(client2).submitUpdate(ethers.id("client2_update"));
 
       // 为了能给 client 发放奖励，我们需要先让 FederatedLearning 合约成为 RewardToken 的“所有者”
       // 这样它才有权限调用 mint 函数
       await rewardToken.transferOwnership(await federatedLearning.getAddress());
     });
 
-    it("Should allow the owner to finalize the round and distribute rewards", async function () {
-      // 检查 client1 和 client2 在收到奖励前的余额
-      const client1BalanceBefore = await rewardToken.balanceOf(client1.address);
-      const client2BalanceBefore = await rewardToken.balanceOf(client2.address);
-      expect(client1BalanceBefore).to.equal(0);
-      expect(client2BalanceBefore).to.equal(0);
+    it("Should allow the owner to finalize the round and let clients claim their rewards", async function () {
+      // 本轮总奖励为 100，平分给 2 个客户端，每人 50
+      const tree = equalSplit(1, [client1.address, client2.address]);
 
-      // 由 owner 调用 finalizeRound
-      await expect(federatedLearning.connect(owner).finalizeRound(newGlobalModelCID))
+      // 由 owner 调用 finalizeRound：只提交新全局模型和奖励分配表的 Merkle 根，不直接发奖
+      await expect(federatedLearning.connect(owner).finalizeRound(newGlobalModelCID, tree.root))
         .to.emit(federatedLearning, "RoundFinalized")
-        .withArgs(1, newGlobalModelCID);
+        .withArgs(1, newGlobalModelCID, tree.root);
 
       // 检查合约状态是否更新
       expect(await federatedLearning.globalModelCID()).to.equal(newGlobalModelCID);
       expect(await federatedLearning.currentRound()).to.equal(2);
+      expect(await federatedLearning.rewardRoots(1)).to.equal(tree.root);
+      expect(await rewardToken.balanceOf(client1.address)).to.equal(0);
 
-      // 检查奖励是否已正确分发
-      const client1BalanceAfter = await rewardToken.balanceOf(client1.address);
-      const client2BalanceAfter = await rewardToken.balanceOf(client2.address);
-      
-      // 您的合约中设定每轮总奖励为 100，平分给 2 个客户端，每人 50
+      // 客户端凭证明领取奖励
       // ethers.parseUnits("50", 18) 用来处理代币的18位小数
-      const expectedReward = ethers.parseUnits("50", 18); 
-      expect(client1BalanceAfter).to.equal(expectedReward);
-      expect(client2BalanceAfter).to.equal(expectedReward);
+      const expectedReward = ethers.parseUnits("50", 18);
+      for (const client of [client1, client2]) {
+        await expect(federatedLearning.connect(client).claimReward(1, expectedReward, tree.proof(client.address)))
+          .to.emit(federatedLearning, "RewardClaimed")
+          .withArgs(1, client.address, expectedReward);
+        expect(await rewardToken.balanceOf(client.address)).to.equal(expectedReward);
+      }
+    });
+
+    it("Should prevent claiming a reward twice", async function () {
+      const tree = equalSplit(1, [client1.address, client2.address]);
+      await federatedLearning.connect(owner).finalizeRound(newGlobalModelCID, tree.root);
+      const reward = ethers.parseUnits("50", 18);
+
+      await federatedLearning.connect(client1).claimReward(1, reward, tree.proof(client1.address));
+      await expect(federatedLearning.connect(client1).claimReward(1, reward, tree.proof(client1.address)))
+        .to.be.revertedWith("Reward already claimed.");
+    });
+
+    it("Should reject a claim with a wrong amount or someone else's proof", async function () {
+      const tree = equalSplit(1, [client1.address, client2.address]);
+      await federatedLearning.connect(owner).finalizeRound(newGlobalModelCID, tree.root);
+
+      await expect(federatedLearning.connect(client1).claimReward(1, ethers.parseUnits("100", 18), tree.proof(client1.address)))
+        .to.be.revertedWith("Invalid reward proof.");
+      await expect(federatedLearning.connect(owner).claimReward(1, ethers.parseUnits("50", 18), tree.proof(client1.address)))
+        .to.be.revertedWith("Invalid reward proof.");
+      await expect(federatedLearning.connect(client1).claimReward(2, ethers.parseUnits("50", 18), tree.proof(client1.address)))
+        .to.be.revertedWith("No rewards for this round.");
+    });
+
+    it("Should cap the total claimed in a round at the round reward", async function () {
+      // 分配表总额超过 ROUND_REWARD 时，超出部分无法领取
+      const share = ethers.parseUnits("60", 18);
+      const tree = new RewardTree(1, [[client1.address, share], [client2.address, share]]);
+      await federatedLearning.connect(owner).finalizeRound(newGlobalModelCID, tree.root);
+
+      await federatedLearning.connect(client1).claimReward(1, share, tree.proof(client1.address));
+      await expect(federatedLearning.connect(client2).claimReward(1, share, tree.proof(client2.address)))
+        .to.be.revertedWith("Round reward exceeded.");
     });
 
     it("Should prevent a non-owner from finalizing the round", async function () {
       // 断言：期望当 client1 (非所有者) 尝试调用时，交易会失败
       // 注意：错误信息来自 OpenZeppelin 的 Ownable 合约
-      await expect(federatedLearning.connect(client1).finalizeRound(newGlobalModelCID))
+      await expect(federatedLearning.connect(client1).finalizeRound(newGlobalModelCID, ethers.ZeroHash))
         .to.be.revertedWithCustomError(federatedLearning, "OwnableUnauthorizedAccount")
         .withArgs(client1.address);
     });
@@ -185,12 +246,171 @@ describe("FederatedLearning Contract Tests", function () {
       // 让 client1 和 client2 在这个新合约中注册并提交 (总共只有 2 个更新)
       await fl2.connect(client1).registerClient();
       await fl2.connect(client2).registerClient();
-      await fl2.connect(client1).submitUpdate("c1_update");
-      await fl2.connect(client2).submitUpdate("c2_update");
+      await fl2.connect(client1).submitUpdate(ethers.id("c1_update"));
+      await fl2.connect(client2).submitUpdate(ethers.id("c2_update"));
 
       // 断言：期望当 owner 尝试结束回合时，交易会失败，因为更新数量不足
-      await expect(fl2.connect(owner).finalizeRound(newGlobalModelCID))
+      await expect(fl2.connect(owner).finalizeRound(newGlobalModelCID, ethers.ZeroHash))
         .to.be.revertedWith("Not enough updates to finalize the round.");
     });
   });
+
+  // --- 测试分组：由聚合者转发的签名更新 ---
+  describe("Relayed Batch Submission", function () {
+    const newGlobalModelCID = ethers.id("relayed_global_model");
+    const types = {
+      UpdateSubmission: [
+        { name: "round", type: "uint256" },
+        { name: "modelCID", type: "bytes32" },
+        { name: "baseRound", type: "uint256" },
+      ],
+    };
+
+    // 客户端在链下对 UpdateSubmission 做 EIP-712 签名，返回可直接传给 submitBatchAndFinalize 的结构
+    async function signUpdate(client: HardhatEthersSigner, round: number, modelCID: string, baseRound = round) {
+      const domain = {
+        name: "FederatedLearning",
+        version: "1",
+        chainId: (await ethers.provider.getNetwork()).chainId,
+        verifyingContract: await federatedLearning.getAddress(),
+      };
+      const signature = await client.signTypedData(domain, types, { round, modelCID, baseRound });
+      return { clientAddress: client.address, modelCID, baseRound, signature };
+    }
+
+    beforeEach(async function () {
+      await federatedLearning.connect(client1).registerClient();
+      await federatedLearning.connect(client2).registerClient();
+      await rewardToken.transferOwnership(await federatedLearning.getAddress());
+    });
+
+    it("Should record a signed batch and finalize the round in one transaction", async function () {
+      const batch = [
+        await signUpdate(client1, 1, ethers.id("client1_update")),
+        await signUpdate(client2, 1, ethers.id("client2_update")),
+      ];
+      const tree = equalSplit(1, [client1.address, client2.address]);
+
+      await expect(federatedLearning.connect(owner).submitBatchAndFinalize(batch, newGlobalModelCID, tree.root))
+        .to.emit(federatedLearning, "UpdateSubmitted")
+        .withArgs(1, client2.address, ethers.id("client2_update"), 1)
+        .and.to.emit(federatedLearning, "RoundFinalized")
+        .withArgs(1, newGlobalModelCID, tree.root);
+
+      expect(await federatedLearning.currentRound()).to.equal(2);
+      expect(await federatedLearning.getRoundUpdatesCount(1)).to.equal(2);
+      expect((await federatedLearning.clients(client1.address)).lastSubmittedRound).to.equal(1);
+    });
+
+    it("Should count updates already submitted directly towards the quorum", async function () {
+      await federatedLearning.connect(client1).submitUpdate(ethers.id("client1_update"));
+      const batch = [await signUpdate(client2, 1, ethers.id("client2_update"))];
+      await federatedLearning.connect(owner).submitBatchAndFinalize(batch, newGlobalModelCID, ethers.ZeroHash);
+      expect(await federatedLearning.currentRound()).to.equal(2);
+    });
+
+    it("Should reject a signature from a different account", async function () {
+      const forged = await signUpdate(client1, 1, ethers.id("client2_update"));
+      forged.clientAddress = client2.address;
+      const batch = [await signUpdate(client1, 1, ethers.id("client1_update")), forged];
+      await expect(federatedLearning.connect(owner).submitBatchAndFinalize(batch, newGlobalModelCID, ethers.ZeroHash))
+        .to.be.revertedWith("Invalid update signature.");
+    });
+
+    it("Should reject a signature made for another round", async function () {
+      const batch = [
+        await signUpdate(client1, 2, ethers.id("client1_update"), 1),
+        await signUpdate(client2, 1, ethers.id("client2_update")),
+      ];
+      await expect(federatedLearning.connect(owner).submitBatchAndFinalize(batch, newGlobalModelCID, ethers.ZeroHash))
+        .to.be.revertedWith("Invalid update signature.");
+    });
+
+    it("Should still enforce registration for relayed updates", async function () {
+      const [, , , outsider] = await ethers.getSigners();
+      const batch = [
+        await signUpdate(client1, 1, ethers.id("client1_update")),
+        await signUpdate(outsider, 1, ethers.id("outsider_update")),
+      ];
+      await expect(federatedLearning.connect(owner).submitBatchAndFinalize(batch, newGlobalModelCID, ethers.ZeroHash))
+        .to.be.revertedWith("Client not registered.");
+    });
+
+    it("Should still enforce one submission per client per round", async function () {
+      await federatedLearning.connect(client1).submitUpdate(ethers.id("client1_update"));
+      const batch = [
+        await signUpdate(client1, 1, ethers.id("client1_again")),
+        await signUpdate(client2, 1, ethers.id("client2_update")),
+      ];
+      await expect(federatedLearning.connect(owner).submitBatchAndFinalize(batch, newGlobalModelCID, ethers.ZeroHash))
+        .to.be.revertedWith("Update already submitted for this round.");
+    });
+
+    it("Should only let the owner relay a batch", async function () {
+      const batch = [await signUpdate(client1, 1, ethers.id("client1_update"))];
+      await expect(federatedLearning.connect(client1).submitBatchAndFinalize(batch, newGlobalModelCID, ethers.ZeroHash))
+        .to.be.revertedWithCustomError(federatedLearning, "OwnableUnauthorizedAccount")
+        .withArgs(client1.address);
+    });
+  });
+
+  // --- 第四个测试分组：测试异步（缓冲）模式下的超时结束 ---
+  describe("Round Timeout", function () {
+    const timeout = 60;
+
+    beforeEach(async function () {
+      await federatedLearning.connect(client1).registerClient();
+      await federatedLearning.connect(client2).registerClient();
+      await rewardToken.transferOwnership(await federatedLearning.getAddress());
+      await federatedLearning.connect(owner).setRoundTimeout(timeout);
+    });
+
+    it("Should only let the owner set the round timeout", async function () {
+      await expect(federatedLearning.connect(client1).setRoundTimeout(timeout))
+        .to.be.revertedWithCustomError(federatedLearning, "OwnableUnauthorizedAccount")
+        .withArgs(client1.address);
+    });
+
+    it("Should not finalize a partial round before the deadline", async function () {
+      await federatedLearning.connect(client1).submitUpdate(ethers.id("client1_update"));
+      await expect(federatedLearning.connect(owner).finalizeRound(ethers.id("partial_cid"), ethers.ZeroHash))
+        .to.be.revertedWith("Not enough updates to finalize the round.");
+    });
+
+    it("Should finalize with the updates that arrived once the deadline has passed", async function () {
+      await federatedLearning.connect(client1).submitVersionedUpdate(ethers.id("client1_update"), 1);
+      // 推进区块时间，越过本轮截止时间
+      await ethers.provider.send("evm_increaseTime", [timeout]);
+      await ethers.provider.send("evm_mine", []);
+
+      const tree = equalSplit(1, [client1.address]);
+      await expect(federatedLearning.connect(owner).finalizeRound(ethers.id("partial_cid"), tree.root))
+        .to.emit(federatedLearning, "RoundFinalized")
+        .withArgs(1, ethers.id("partial_cid"), tree.root);
+      // 唯一的贡献者可以领取整轮奖励，新一轮重新计时
+      await federatedLearning.connect(client1).claimReward(1, ethers.parseUnits("100", 18), tree.proof(client1.address));
+      expect(await rewardToken.balanceOf(client1.address)).to.equal(ethers.parseUnits("100", 18));
+      expect(await federatedLearning.currentRound()).to.equal(2);
+      const latest = await ethers.provider.getBlock("latest");
+      expect(await federatedLearning.roundDeadline()).to.equal(BigInt(latest!.timestamp + timeout));
+    });
+
+    it("Should still require at least one update after the deadline", async function () {
+      await ethers.provider.send("evm_increaseTime", [timeout]);
+      await ethers.provider.send("evm_mine", []);
+      await expect(federatedLearning.connect(owner).finalizeRound(ethers.id("empty_cid"), ethers.ZeroHash))
+        .to.be.revertedWith("Not enough updates to finalize the round.");
+    });
+
+    it("Should accept a stale update in a later round", async function () {
+      await federatedLearning.connect(client1).submitUpdate(ethers.id("client1_update"));
+      await federatedLearning.connect(client2).submitUpdate(ethers.id("client2_update"));
+      await federatedLearning.connect(owner).finalizeRound(ethers.id("round1_cid"), equalSplit(1, [client1.address, client2.address]).root);
+
+      // client1 仍基于第 1 轮的全局模型训练，在第 2 轮提交
+      await expect(federatedLearning.connect(client1).submitVersionedUpdate(ethers.id("stale_update"), 1))
+        .to.emit(federatedLearning, "UpdateSubmitted")
+        .withArgs(2, client1.address, ethers.id("stale_update"), 1);
+    });
+  });
 });
\ No newline at end of file
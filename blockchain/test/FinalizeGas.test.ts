@@ -0,0 +1,62 @@
+// finalizeRound 的 Gas 基准：分别让 2、50、500 个客户端提交更新后结束一轮，记录 finalizeRound 与单次 claimReward 的 Gas。
+// finalizeRound 只写入新的全局模型 CID 与奖励分配表的 Merkle 根，Gas 应与客户端数量无关；
+// claimReward 的证明长度为 log2(客户端数)，只随客户端数对数增长。
+import { expect } from "chai";
+import { ethers } from "hardhat";
+import { equalSplit } from "./helpers/rewardTree";
+
+const CLIENT_COUNTS = [2, 50, 500];
+// 不同客户端数之间 finalizeRound Gas 的允许偏差
+const GAS_TOLERANCE_PERCENT = 1n;
+
+describe("Finalization Gas Benchmark", function () {
+  // 500 个客户端的注册与提交需要上千笔交易
+  this.timeout(600_000);
+
+  const finalizeGas = new Map<number, bigint>();
+  const claimGas = new Map<number, bigint>();
+
+  for (const numClients of CLIENT_COUNTS) {
+    it(`Should finalize a round with ${numClients} updates`, async function () {
+      const [owner] = await ethers.getSigners();
+      const rewardToken = await (await ethers.getContractFactory("RewardToken")).deploy(owner.address);
+      const federatedLearning = await (await ethers.getContractFactory("FederatedLearning")).deploy(
+        await rewardToken.getAddress(), ethers.ZeroHash, numClients, owner.address
+      );
+      await rewardToken.transferOwnership(await federatedLearning.getAddress());
+
+      // 预置账户不够用，临时生成钱包并直接设置余额
+      const clients = [];
+      for (let i = 0; i < numClients; i++) {
+        const wallet = ethers.Wallet.createRandom().connect(ethers.provider);
+        await ethers.provider.send("hardhat_setBalance", [wallet.address, "0x56BC75E2D63100000"]);
+        await federatedLearning.connect(wallet).registerClient();
+        await federatedLearning.connect(wallet).submitUpdate(ethers.id(`update_${numClients}_${i}`));
+        clients.push(wallet);
+      }
+
+      const tree = equalSplit(1, clients.map((client) => client.address));
+      const finalizeReceipt = await (await federatedLearning.finalizeRound(ethers.id(`global_${numClients}`), tree.root)).wait();
+      finalizeGas.set(numClients, finalizeReceipt!.gasUsed);
+
+      const share = ethers.parseUnits("100", 18) / BigInt(numClients);
+      const lastClient = clients[clients.length - 1];
+      const claimReceipt = await (
+        await federatedLearning.connect(lastClient).claimReward(1, share, tree.proof(lastClient.address))
+      ).wait();
+      claimGas.set(numClients, claimReceipt!.gasUsed);
+      expect(await rewardToken.balanceOf(lastClient.address)).to.equal(share);
+    });
+  }
+
+  it("Should keep finalizeRound gas independent of the number of clients", async function () {
+    console.log("\n      客户端数 | finalizeRound Gas | claimReward Gas");
+    for (const numClients of CLIENT_COUNTS) {
+      console.log(`      ${String(numClients).padStart(8)} | ${String(finalizeGas.get(numClients)).padStart(17)} | ${claimGas.get(numClients)}`);
+    }
+    const baseline = finalizeGas.get(CLIENT_COUNTS[0])!;
+    for (const numClients of CLIENT_COUNTS) {
+      expect(finalizeGas.get(numClients)!).to.be.lessThanOrEqual(baseline + (baseline * GAS_TOLERANCE_PERCENT) / 100n);
+    }
+  });
+});
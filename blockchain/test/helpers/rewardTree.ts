@@ -0,0 +1,55 @@
+import { ethers } from "hardhat";
+
+// 与 client/rewards.py 相同的奖励分配表 Merkle 树，供测试构造 finalizeRound 的根与 claimReward 的证明：
+//   leaf = keccak256(keccak256(abi.encode(round, account, amount)))
+//   parent = keccak256(min(a, b) ++ max(a, b))（与 OpenZeppelin MerkleProof 一致）
+const coder = ethers.AbiCoder.defaultAbiCoder();
+
+export function rewardLeaf(round: bigint | number, account: string, amount: bigint): string {
+  return ethers.keccak256(ethers.keccak256(coder.encode(["uint256", "address", "uint256"], [round, account, amount])));
+}
+
+function hashPair(a: string, b: string): string {
+  return BigInt(a) < BigInt(b) ? ethers.keccak256(ethers.concat([a, b])) : ethers.keccak256(ethers.concat([b, a]));
+}
+
+export class RewardTree {
+  readonly levels: string[][];
+
+  constructor(readonly round: number, readonly allocations: [string, bigint][]) {
+    let level = allocations.map(([account, amount]) => rewardLeaf(round, account, amount));
+    this.levels = [level];
+    while (level.length > 1) {
+      const next: string[] = [];
+      for (let i = 0; i < level.length; i += 2) {
+        // 奇数个节点时最后一个直接升到上一层
+        next.push(i + 1 < level.length ? hashPair(level[i], level[i + 1]) : level[i]);
+      }
+      level = next;
+      this.levels.push(level);
+    }
+  }
+
+  get root(): string {
+    return this.levels[this.levels.length - 1][0] ?? ethers.ZeroHash;
+  }
+
+  proof(account: string): string[] {
+    let index = this.allocations.findIndex(([a]) => a === account);
+    const proof: string[] = [];
+    for (const level of this.levels.slice(0, -1)) {
+      const sibling = index ^ 1;
+      if (sibling < level.length) proof.push(level[sibling]);
+      index = Math.floor(index / 2);
+    }
+    return proof;
+  }
+}
+
+// 与旧版合约相同的规则：每轮 100 个代币平分给本轮的贡献者
+export const ROUND_REWARD = ethers.parseUnits("100", 18);
+
+export function equalSplit(round: number, accounts: string[]): RewardTree {
+  const share = ROUND_REWARD / BigInt(accounts.length);
+  return new RewardTree(round, accounts.map((account) => [account, share] as [string, bigint]));
+}
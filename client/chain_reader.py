@@ -0,0 +1,101 @@
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+from utils.metrics import count_rpc_calls, get_recorder
+from model_store import cid_from_bytes32
+
+# --- 共享的链上只读层 ---
+# 所有进程通过连接池化的 HTTP 会话访问节点，并把一次查询需要的多个 eth_call
+# 合并成一个 JSON-RPC 批量请求，避免每个状态字段都单独往返一次。
+
+HTTP_POOL_SIZE = 16
+
+
+def make_session(pool_size=HTTP_POOL_SIZE):
+    """创建带连接池（keep-alive）的 HTTP 会话。"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def make_web3(rpc_url, session=None):
+    """创建复用连接池会话的 Web3 实例，返回 (w3, session)。"""
+    session = session or make_session()
+    w3 = Web3(Web3.HTTPProvider(rpc_url, session=session))
+    w3.middleware_onion.add(count_rpc_calls, name="count_rpc_calls")
+    return w3, session
+
+
+class ChainReader:
+    """
+    合约状态的批量读取器。
+    batch_call 接受一组已绑定参数的合约函数（如 contract.functions.clients(addr)），
+    或 (method, params) 形式的原始 RPC 调用（如 ("eth_blockNumber", [])），
+    以一个 JSON-RPC 批量请求发出，并按顺序返回解码后的结果。
+    rpc_url 为 None 时（例如注入了进程内的 EthereumTesterProvider，没有 HTTP 端点）逐个调用，返回值相同。
+    """
+    def __init__(self, w3, contract, rpc_url, session=None):
+        self.w3 = w3
+        self.contract = contract
+        self.rpc_url = rpc_url
+        self.session = session or (make_session() if rpc_url is not None else None)
+
+    def _to_request(self, request_id, call, block_identifier):
+        if isinstance(call, tuple):
+            method, params = call
+        else:
+            method = "eth_call"
+            params = [{"to": self.contract.address, "data": call._encode_transaction_data()}, block_identifier]
+        return {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+
+    def _decode(self, call, result):
+        if isinstance(call, tuple):
+            return result
+        output_types = get_abi_output_types(call.abi)
+        decoded = self.w3.codec.decode_abi(output_types, Web3.toBytes(hexstr=result))
+        normalized = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decoded)
+        return normalized[0] if len(normalized) == 1 else list(normalized)
+
+    def _call_one(self, call, block_identifier):
+        if isinstance(call, tuple):
+            method, params = call
+            return self.w3.provider.make_request(method, params)["result"]
+        return call.call(block_identifier=block_identifier)
+
+    def batch_call(self, calls, block_identifier="latest"):
+        if not calls:
+            return []
+        get_recorder().count("rpc_calls", len(calls), method="batch")
+        if self.rpc_url is None:
+            return [self._call_one(call, block_identifier) for call in calls]
+        payload = [self._to_request(i, call, block_identifier) for i, call in enumerate(calls)]
+        response = self.session.post(self.rpc_url, json=payload, timeout=30)
+        response.raise_for_status()
+        replies = {reply["id"]: reply for reply in response.json()}
+        results = []
+        for i, call in enumerate(calls):
+            reply = replies[i]
+            if "error" in reply:
+                raise RuntimeError(f"JSON-RPC 调用失败 ({payload[i]['method']}): {reply['error']}")
+            results.append(self._decode(call, reply["result"]))
+        return results
+
+    def round_state(self):
+        """
+        通过合约的 getRoundState 视图函数一次取回整轮状态，返回字典：
+        current_round, updates_needed, global_model_cid,
+        updates（[(client_address, model_cid, base_round), ...]，base_round 为该更新训练时基于的全局模型轮次）。
+        链上的 bytes32 CID 会被转换回十六进制字符串（尚无全局模型时 global_model_cid 为 None）。
+        """
+        current_round, updates_needed, global_model_cid, updates = self.contract.functions.getRoundState().call()
+        return {
+            "current_round": current_round,
+            "updates_needed": updates_needed,
+            "global_model_cid": cid_from_bytes32(global_model_cid),
+            "updates": [(address, cid_from_bytes32(cid), base_round) for address, cid, base_round in updates],
+        }
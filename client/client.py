@@ -1,45 +1,100 @@
+import argparse
 import os
 import json
-import torch
-from web3 import Web3
+import signal
+import time
 import sys
 
-# --- 解决代理问题 ---
-if 'http_proxy' in os.environ:
-    del os.environ['http_proxy']
-if 'https_proxy' in os.environ:
-    del os.environ['https_proxy']
-# --------------------
-
-# 动态添加 client 目录到 sys.path
+# 动态添加 client 目录与项目根目录（utils 包）到 sys.path
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import config
 from config import (
     RPC_URL,
-    CONTRACT_ADDRESS,
     ABI_PATH,
-    CLIENT1_PRIVATE_KEY,
-    CLIENT2_PRIVATE_KEY
+    client_private_key,
+    WORKER_SIGNAL_PREFIX,
+    PARTITION_STRATEGY,
+    PARTITION_SEED,
+    PARTITION_OPTIONS,
 )
-from models import ComplexCNN
-from data_loader import load_cifar10
-from trainer import Trainer
+from model_store import ModelStore, cid_to_bytes32, cid_from_bytes32
+from utils import metrics
+from utils.fileio import atomic_write
+# torch（约 2 秒）与 web3（约 0.5 秒）以及依赖它们的模块在首次使用时才导入，
+# 导入本模块（例如 --help、基准测试、server.py 的检查）不必承担这部分启动开销
 
 # --- 全局参数 ---
+# 客户端总数的默认值（server.py 通过 --num-clients 传入实际值）
 TOTAL_CLIENTS = 2
-# 全局模型将从这个固定的绝对路径加载
-GLOBAL_MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'saved_models', 'global_model.pth'))
+SAVED_MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'saved_models'))
+# 模型更新的压缩方案："none" / "fp16" / "int8" / "topk"（见 model_io.COMPRESSION_SCHEMES）
+UPDATE_COMPRESSION = "none"
+# "topk" 方案下每个张量保留的增量比例
+TOPK_RATIO = 0.01
+# 训练模式："default" 使用 Trainer 的默认参数（原始行为）；"performance" 使用 trainer.PERFORMANCE_OPTIONS
+# （channels_last、后台预取批次等），可在此基础上覆盖单个选项，例如 {"use_bf16": True}
+TRAINING_MODE = "default"
+TRAINER_OPTION_OVERRIDES = {}
+# 异步（FedBuff 式）调度下，本轮已提交过更新的客户端轮询新一轮开始的间隔（秒）
+ROUND_POLL_INTERVAL = 0.5
+# 更新的提交方式："relay" —— 对更新做 EIP-712 签名后交给聚合者，由它在结束本轮的同一笔交易中批量上链；
+# "transaction" —— 客户端自己发送 submitVersionedUpdate 交易并等待确认（原始行为）
+SUBMISSION_MODE = "transaction"
 
 
 class FederatedLearningClient:
-    def __init__(self, private_key: str, client_id: int):
-        self.w3 = Web3(Web3.HTTPProvider(RPC_URL))
+    def __init__(self, private_key: str, client_id: int, num_clients: int = TOTAL_CLIENTS,
+                 w3=None, contract=None, train_dataset=None, model_fn=None, work_dir=None):
+        """
+        w3 / contract / train_dataset / model_fn 供基准测试注入进程内的链、已部署的合约、合成数据与不同大小的模型；
+        默认连接 RPC_URL 上 .env 中的合约，按划分策略加载 CIFAR-10 分片，并使用 ComplexCNN。
+        work_dir 非 None 时，内容寻址存储、转发收件箱、奖励清单与误差反馈文件都放在该目录下（目录结构见 config.artifact_dirs）。
+        """
+        import torch
+        from chain_reader import ChainReader, make_web3
+        from tx_manager import TransactionManager
+
+        if w3 is None:
+            self.w3, session = make_web3(RPC_URL)
+            rpc_url = RPC_URL
+        else:
+            self.w3, session, rpc_url = w3, None, None
         if not self.w3.isConnected():
             raise ConnectionError(f"无法连接到 RPC URL: {RPC_URL}")
 
         self.account = self.w3.eth.account.from_key(private_key)
         self.client_id = client_id
-        self.contract = self._load_contract()
+        self.num_clients = num_clients
+        self.contract = contract if contract is not None else self._load_contract()
+        self.reader = ChainReader(self.w3, self.contract, rpc_url, session)
+        # 交易在本地分配 nonce 后立即广播，回执在后台确认
+        self.tx_manager = TransactionManager(self.w3, self.account)
+        # 注册交易的 Future；注册在后台确认，训练不必等待它上链
+        self.registration = None
+        # 训练状态（数据集分片、模型、优化器）在首次训练时构建，常驻工作进程会在后续轮次中复用
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.trainer = None
+        self.train_dataset = train_dataset
+        if model_fn is None:
+            from models import ComplexCNN
+            model_fn = ComplexCNN
+        self.model_fn = model_fn
+        # 压缩误差反馈：常驻工作进程保存在内存中，一次性进程通过 residual 文件跨轮次保留
+        self.dirs = config.artifact_dirs(work_dir)
+        self.residual_path = os.path.join(self.dirs["saved_models"] or SAVED_MODELS_DIR, f"client_{client_id}_residual.safetensors")
+        self.residual = None
+        # 全局模型与模型更新都按 CID 存放在本地内容寻址存储中
+        self.store = ModelStore(self.dirs["store"])
+        # 奖励按需领取：已提交过更新、尚未领取奖励的轮次，以及扫描 UpdateSubmitted 日志的区块游标
+        self.unclaimed_rounds = set()
+        self._claim_cursor = 0
+        # 转发模式：EIP-712 签名域（首次签名时计算），最近一次交给聚合者转发的轮次，
+        # 以及该轮结束前尚未确认上链的转发更新 (update_cid, base_round)
+        self._signing_domain = None
+        self.relayed_round = 0
+        self._pending_relay = None
         
         print(f"客户端 {client_id} 初始化成功，地址: {self.account.address}")
         print(f"成功加载合约，地址: {self.contract.address}")
@@ -47,91 +102,345 @@ class FederatedLearningClient:
     def _load_contract(self):
         with open(ABI_PATH, 'r') as f:
             abi = json.load(f)["abi"]
-        return self.w3.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
-
-    def _send_transaction(self, func_call):
-        tx = func_call.build_transaction({
-            'from': self.account.address,
-            'nonce': self.w3.eth.get_transaction_count(self.account.address),
-            'gas': 2000000,
-            'gasPrice': self.w3.eth.gas_price,
-        })
-        signed_tx = self.w3.eth.account.sign_transaction(tx, private_key=self.account.key)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        tx_receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        return tx_receipt
+        return self.w3.eth.contract(address=config.CONTRACT_ADDRESS, abi=abi)
+
+    def _get_trainer(self):
+        """
+        返回本客户端的 Trainer，首次调用时加载数据分片并构建模型与优化器。
+        之后的调用直接复用内存中的对象，避免每轮重复加载 CIFAR-10 和重建模型。
+        """
+        if self.trainer is None:
+            from data_loader import load_cifar10
+            from trainer import Trainer, PERFORMANCE_OPTIONS
+
+            # 加载本客户端的本地数据 (返回 Dataset)
+            train_dataset = self.train_dataset
+            if train_dataset is None:
+                train_dataset = load_cifar10(
+                    client_id=self.client_id, num_clients=self.num_clients,
+                    strategy=PARTITION_STRATEGY, seed=PARTITION_SEED, **PARTITION_OPTIONS,
+                )
+            print(f"  - 使用设备: {self.device}")
+            options = dict(PERFORMANCE_OPTIONS) if TRAINING_MODE == "performance" else {}
+            options.update(TRAINER_OPTION_OVERRIDES)
+            self.trainer = Trainer(self.model_fn(), train_dataset, test_dataset=train_dataset, device=self.device, **options)
+        return self.trainer
+
+    def _compress_update(self, state_dict, base_state_dict):
+        """按 UPDATE_COMPRESSION 编码本轮更新，并更新误差反馈的残差。"""
+        if UPDATE_COMPRESSION == "none" or base_state_dict is None:
+            if UPDATE_COMPRESSION != "none":
+                print("  - 尚无全局模型作为基准，本轮提交完整模型。")
+            return state_dict
+        from model_io import TensorFile, compress_update, write_tensors
+
+        if self.residual is None and os.path.exists(self.residual_path):
+            self.residual = TensorFile(self.residual_path, mmap=False).tensors(self.device)
+        update, self.residual = compress_update(
+            state_dict, base_state_dict, UPDATE_COMPRESSION, topk_ratio=TOPK_RATIO, residual=self.residual
+        )
+        # 原子写入：进程在保存途中崩溃时，续跑读到的仍是上一轮完整的残差
+        with atomic_write(self.residual_path, 'wb') as f:
+            write_tensors(f, self.residual)
+        print(f"  - 已按 {UPDATE_COMPRESSION} 方案压缩模型增量。")
+        return update
 
     def register(self):
+        """
+        发送注册交易后立即返回，不等待其上链：训练与注册确认并行进行，
+        本地 nonce 保证注册交易先于之后的提交交易被打包。
+        """
         print(f"\n[客户端 {self.client_id} | 步骤 1/3] 正在尝试注册...")
         try:
             client_info = self.contract.functions.clients(self.account.address).call()
             if client_info[0]: # client_info[0] is 'isRegistered'
                 print("  - 客户端已经注册过了。")
                 return
-            func_call = self.contract.functions.registerClient()
-            receipt = self._send_transaction(func_call)
+            self.registration = self.tx_manager.send(self.contract.functions.registerClient())
+            self.registration.add_done_callback(self._report_registration)
+        except Exception as e:
+            print(f"  - ❌ 注册失败: {e}")
+
+    def _report_registration(self, future):
+        try:
+            receipt = future.result()
             print(f"  - ✅ 注册成功！交易哈希: {receipt.transactionHash.hex()}")
         except Exception as e:
             print(f"  - ❌ 注册失败: {e}")
 
-    def run_training_round(self):
-        current_round = self.contract.functions.currentRound().call()
+    def _wait_for_registration(self):
+        """提交更新前确认注册已上链；注册失败时提交必然被合约拒绝，直接报错。"""
+        if self.registration is not None:
+            self.registration.result()
+            self.registration = None
+
+    def _read_round_state(self):
+        """
+        轮次、本客户端状态与全局模型 CID 合并为一次批量 RPC 请求，返回 (当前轮次, 最近提交的轮次, 全局模型 CID)。
+        已交给聚合者转发、但尚未上链的更新也算作已提交（包括崩溃前由上一个进程投递的）。
+        """
+        current_round, client_info, global_model_cid = self.reader.batch_call([
+            self.contract.functions.currentRound(),
+            self.contract.functions.clients(self.account.address),
+            self.contract.functions.globalModelCID(),
+        ])
+        from relay import has_signed_update
+
+        self._check_relayed_update(current_round, client_info[1]) # client_info[1] is 'lastUpdateRound'
+        last_submitted_round = max(client_info[1], self.relayed_round)
+        if last_submitted_round < current_round and has_signed_update(current_round, self.account.address, self.dirs["relay"]):
+            last_submitted_round = current_round
+        return current_round, last_submitted_round, cid_from_bytes32(global_model_cid)
+
+    def claim_rewards(self, current_round):
+        """
+        领取本客户端在已结束轮次中的奖励：从自己的 UpdateSubmitted 日志找出参与过的轮次，
+        读取聚合者写出的奖励清单（金额与 Merkle 证明）并发送 claimReward 交易，不等待确认。
+        返回已发送的领取交易的 Future 列表。
+        """
+        from rewards import load_claim
+
+        latest_block = self.w3.eth.block_number
+        if latest_block >= self._claim_cursor:
+            events = self.contract.events.UpdateSubmitted.getLogs(
+                argument_filters={"clientAddress": self.account.address},
+                fromBlock=self._claim_cursor, toBlock=latest_block,
+            )
+            self.unclaimed_rounds.update(event.args.round for event in events)
+            self._claim_cursor = latest_block + 1
+        finished = sorted(r for r in self.unclaimed_rounds if r < current_round)
+        if not finished:
+            return []
+        claimed = self.reader.batch_call([
+            self.contract.functions.rewardClaimed(r, self.account.address) for r in finished
+        ])
+        futures = []
+        for round_number, already_claimed in zip(finished, claimed):
+            self.unclaimed_rounds.discard(round_number)
+            if already_claimed:
+                continue
+            claim = load_claim(round_number, self.account.address, self.dirs["rewards"])
+            if claim is None:
+                print(f"  - 找不到第 {round_number} 轮的奖励清单或其中没有本客户端，跳过领取。")
+                continue
+            amount, proof, _ = claim
+            future = self.tx_manager.send(self.contract.functions.claimReward(round_number, amount, proof))
+            future.add_done_callback(lambda f, r=round_number: self._report_claim(f, r))
+            futures.append(future)
+        return futures
+
+    def claim_remaining_rewards(self):
+        """
+        进程退出前的最后一次领取：每轮开始时的领取只覆盖更早的轮次，最后一轮（以及之后不再训练的轮次）
+        的奖励只能在这里领取。等待领取交易确认后返回。
+        """
+        print(f"\n[客户端 {self.client_id} | 步骤 3/3] 正在领取剩余的奖励...")
+        try:
+            futures = self.claim_rewards(self.contract.functions.currentRound().call())
+        except Exception as e:
+            print(f"  - ❌ 领取奖励失败: {e}")
+            return
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass  # 失败原因已由 _report_claim 打印
+        if not futures:
+            print("  - 没有待领取的奖励。")
+
+    def _report_claim(self, future, round_number):
+        try:
+            receipt = future.result()
+            print(f"  - 💰 已领取第 {round_number} 轮奖励！交易哈希: {receipt.transactionHash.hex()}")
+        except Exception as e:
+            print(f"  - ❌ 领取第 {round_number} 轮奖励失败: {e}")
+
+    def run_training_round(self, wait_for_next_round=False):
+        """
+        基于链上最新的全局模型训练一次并提交更新，更新标明它所基于的全局模型轮次。
+        wait_for_next_round=True（异步调度）时，若本轮已经提交过，则等待下一轮开始、拉取新的全局模型后再训练，
+        而不是直接跳过（合约规定每个客户端每轮只能提交一个更新，提前完成的客户端不能为同一轮再提交）。
+        """
+        from model_io import write_model_update, load_state_dict
+
+        recorder = metrics.get_recorder()
+        current_round, last_submitted_round, global_model_cid = self._read_round_state()
+        if last_submitted_round >= current_round and wait_for_next_round:
+            print(f"  - 已在第 {current_round} 轮提交过更新，等待下一轮开始...")
+            with recorder.span("wait_for_round", round=current_round):
+                while last_submitted_round >= current_round:
+                    time.sleep(ROUND_POLL_INTERVAL)
+                    current_round, last_submitted_round, global_model_cid = self._read_round_state()
+        recorder.set_context(round=current_round)
         print(f"\n[客户端 {self.client_id} | 步骤 2/3] 开始第 {current_round} 轮训练...")
+        try:
+            self.claim_rewards(current_round)
+        except Exception as e:
+            print(f"  - ❌ 领取奖励失败: {e}")
 
-        client_info = self.contract.functions.clients(self.account.address).call()
-        if client_info[1] >= current_round: # client_info[1] is 'lastUpdateRound'
+        if last_submitted_round >= current_round:
             print(f"  - 您已经在第 {current_round} 轮提交过更新了，跳过。")
             return
 
-        # 1. 加载全局模型
-        print(f"  - 正在加载全局模型: {GLOBAL_MODEL_PATH}")
-        model = ComplexCNN()
-        if os.path.exists(GLOBAL_MODEL_PATH):
-            model.load_state_dict(torch.load(GLOBAL_MODEL_PATH))
-            print("  - 成功加载全局模型权重。")
-        else:
-            print("  - 未找到全局模型文件，将使用随机初始化的模型。")
+        # 1. 准备本地数据与模型（常驻工作进程只在第一轮构建一次）
+        trainer = self._get_trainer()
+        model = trainer.model
 
-        # 2. 加载本客户端的本地数据 (现在返回 Dataset)
-        train_dataset = load_cifar10(client_id=self.client_id, num_clients=TOTAL_CLIENTS)
+        # 2. 按链上记录的 CID 加载全局模型（原地覆盖常驻模型的权重），同时保留一份作为压缩增量的基准
+        print(f"  - 正在加载全局模型: {global_model_cid}")
+        base_state_dict = None
+        with recorder.span("load_global_model"):
+            if self.store.has(global_model_cid):
+                global_model_path = self.store.path(global_model_cid)
+                base_state_dict = load_state_dict(global_model_path, map_location=self.device, mmap=True)
+                model.load_state_dict(base_state_dict)
+                recorder.count("model_bytes_read", os.path.getsize(global_model_path))
+                print("  - 成功加载全局模型权重。")
+            else:
+                print("  - 本地存储中没有该全局模型，将使用随机初始化的模型。")
 
         # 3. 进行真实训练
-        # --- 这是修改的地方 ---
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"  - 使用设备: {device}")
-        
-        # 创建 Trainer 时传入所有必需参数
-        trainer = Trainer(model, train_dataset, test_dataset=train_dataset, device=device)
-        trainer.train(epochs=1)
-        # --- 修改结束 ---
-
-        # 4. 保存模型更新到本地文件
-        saved_models_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'saved_models'))
-        os.makedirs(saved_models_dir, exist_ok=True)
-        local_update_path = os.path.join(saved_models_dir, f"client_{self.client_id}_update_round_{current_round}.pth")
-        torch.save(model.state_dict(), local_update_path)
-        print(f"  - 模型更新已保存到: {local_update_path}")
-
-        # 5. 向区块链提交模型更新的 *绝对路径*
-        print("  - 正在向区块链提交模型文件路径...")
+        with recorder.span("train"):
+            trainer.train(epochs=1)
+
+        # 4. 把模型更新写入内容寻址存储
+        with recorder.span("serialise"):
+            num_samples = len(trainer.train_loader.dataset)
+            update = self._compress_update(model.state_dict(), base_state_dict)
+            # 张量逐个流式写入存储，不在内存中拼出整个文件
+            update_cid, update_size = self.store.put_stream(lambda f: write_model_update(f, update, num_samples))
+        recorder.count("model_bytes_written", update_size)
+        print(f"  - 模型更新（{num_samples} 条样本，{update_size / 1e6:.2f} MB）已存入本地存储，CID: {update_cid}")
+
+        # 5. 提交模型更新的 CID，并标明它基于第 current_round 轮的全局模型；
+        #    训练期间全局模型若已前进，更新会计入新的轮次，由聚合者按陈旧度降权
         try:
-            func_call = self.contract.functions.submitUpdate(local_update_path)
-            receipt = self._send_transaction(func_call)
-            print(f"  - ✅ 第 {current_round} 轮更新提交成功！交易哈希: {receipt.transactionHash.hex()}")
+            with recorder.span("submit"):
+                self._submit_update(update_cid, base_round=current_round)
         except Exception as e:
             print(f"  - ❌ 更新提交失败: {e}")
+        recorder.record_peak_rss()
+        recorder.flush()
 
+    def _submit_update(self, update_cid, base_round):
+        self._wait_for_registration()
+        if SUBMISSION_MODE == "relay":
+            self._relay_update(update_cid, base_round)
+        else:
+            print("  - 正在向区块链提交模型更新 CID...")
+            submission = self.contract.functions.submitVersionedUpdate(cid_to_bytes32(update_cid), base_round)
+            receipt = self.tx_manager.send(submission).result()
+            print(f"  - ✅ 基于第 {base_round} 轮全局模型的更新提交成功！交易哈希: {receipt.transactionHash.hex()}")
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2 or sys.argv[1] not in ['0', '1']:
-        print("用法: python client.py [client_id]")
-        print("  client_id: 0 或 1")
-        sys.exit(1)
+    def _relay_update(self, update_cid, base_round):
+        """
+        对更新做 EIP-712 签名并放进聚合者的转发收件箱，不发送交易：
+        签名绑定提交时的链上轮次，聚合者在结束该轮的同一笔交易中把它记录上链。
+        异步调度下聚合者可能在读取轮次与投递之间结束该轮并清空收件箱，此时为新的轮次重新签名投递。
+        """
+        from relay import domain_separator, sign_update, post_signed_update, withdraw_signed_update
+
+        if self._signing_domain is None:
+            self._signing_domain = domain_separator(self.w3.eth.chain_id, self.contract.address)
+        target_round = self.contract.functions.currentRound().call()
+        while True:
+            signature = sign_update(self.account.key, self._signing_domain, target_round, update_cid, base_round)
+            post_signed_update(target_round, self.account.address, update_cid, base_round, signature, self.dirs["relay"])
+            current_round, client_info = self.reader.batch_call([
+                self.contract.functions.currentRound(),
+                self.contract.functions.clients(self.account.address),
+            ])
+            # 轮次未前进：聚合者结束该轮时会读到这条更新；链上已记录本客户端在该轮的更新：已被转发
+            if current_round == target_round or client_info[1] >= target_round:
+                break
+            withdraw_signed_update(target_round, self.account.address, self.dirs["relay"])
+            print(f"  - 第 {target_round} 轮在投递期间已经结束，改为在第 {current_round} 轮转发。")
+            target_round = current_round
+        self.relayed_round = target_round
+        self._pending_relay = (update_cid, base_round)
+        print(f"  - ✅ 基于第 {base_round} 轮全局模型的更新已签名，交由聚合者在第 {target_round} 轮批量上链。")
+
+    def _check_relayed_update(self, current_round, last_onchain_round):
+        """
+        转发的更新只有在聚合者结束该轮时读到才会上链：聚合者读取收件箱之后、结束该轮之前投递的更新
+        不会被转发，随后还会随该轮的收件箱一起被清空。因此转发轮次结束后按链上记录的 lastUpdateRound 核对，
+        没有被记录的更新改投当前轮次（聚合者按陈旧度降权）。
+        """
+        from relay import withdraw_signed_update
+
+        if self._pending_relay is None or current_round <= self.relayed_round:
+            return
+        update_cid, base_round = self._pending_relay
+        self._pending_relay = None
+        if last_onchain_round >= self.relayed_round:
+            return
+        print(f"  - 第 {self.relayed_round} 轮结束时没有转发本客户端的更新，改为在第 {current_round} 轮重新投递。")
+        withdraw_signed_update(self.relayed_round, self.account.address, self.dirs["relay"])
+        self._relay_update(update_cid, base_round)
 
-    client_id = int(sys.argv[1])
-    private_key = CLIENT1_PRIVATE_KEY if client_id == 0 else CLIENT2_PRIVATE_KEY
 
-    # 初始化并运行客户端
-    fl_client = FederatedLearningClient(private_key=private_key, client_id=client_id)
+def _signal_server(*fields):
+    """向 server.py 发送一条控制信号（独占一行，带固定前缀，以便与普通日志区分）。"""
+    print(WORKER_SIGNAL_PREFIX, *fields, flush=True)
+
+
+def run_worker_loop(fl_client):
+    """
+    常驻工作进程模式：注册一次后在 stdin 上等待 server.py 的指令。
+    每收到一条 "train" 就执行一轮训练，数据集、模型、优化器和 RPC 连接在轮次之间保持在内存中。
+    "train_next"（异步调度）在本轮已提交过时会先等待下一轮开始，再基于最新的全局模型训练。
+    收到 "exit"、stdin 关闭或被 SIGTERM 结束（异步调度下 server.py 不等待进行中的训练）时，
+    先领取剩余的奖励再退出。
+    """
+    # SIGTERM 转换为 SystemExit，使下面的 finally 得以执行
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     fl_client.register()
-    fl_client.run_training_round()
\ No newline at end of file
+    _signal_server("READY")
+    try:
+        for command in sys.stdin:
+            command = command.strip()
+            if command in ("train", "train_next"):
+                try:
+                    fl_client.run_training_round(wait_for_next_round=command == "train_next")
+                    _signal_server("ROUND_DONE")
+                except Exception as e:
+                    print(f"  - ❌ 本轮训练失败: {e}")
+                    _signal_server("ROUND_FAILED")
+            elif command == "exit":
+                break
+    finally:
+        # 领取期间不再响应 SIGTERM，避免领取交易发出后、确认前被打断
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        fl_client.claim_remaining_rewards()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="联邦学习客户端")
+    parser.add_argument("client_id", type=int, help="客户端编号，从 0 开始")
+    parser.add_argument("--num-clients", type=int, default=TOTAL_CLIENTS, help="参与训练的客户端总数（决定数据划分）")
+    parser.add_argument("--worker", action="store_true", help="以常驻工作进程模式运行，由 server.py 通过 stdin 下发每轮的训练指令")
+    parser.add_argument("--claim-only", action="store_true", help="不训练，只领取已结束轮次中尚未领取的奖励（一次性进程模式在最后一轮之后使用）")
+    args = parser.parse_args()
+    if not 0 <= args.client_id < args.num_clients:
+        parser.error(f"client_id 必须在 [0, {args.num_clients}) 范围内")
+
+    config.strip_proxy_env()
+    metrics.configure("client", client=args.client_id)
+
+    # 由 server.py 并发调度时，每个客户端只能使用分配给它的 CPU 核
+    num_threads = os.environ.get("FL_NUM_THREADS")
+    if num_threads:
+        import torch
+        torch.set_num_threads(int(num_threads))
+
+    # 初始化并运行客户端（私钥从 Hardhat 助记词派生，客户端数量不再受限）
+    fl_client = FederatedLearningClient(
+        private_key=client_private_key(args.client_id), client_id=args.client_id, num_clients=args.num_clients,
+    )
+    if args.worker:
+        run_worker_loop(fl_client)
+    elif args.claim_only:
+        fl_client.claim_remaining_rewards()
+    else:
+        fl_client.register()
+        fl_client.run_training_round()
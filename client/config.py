@@ -1,16 +1,15 @@
+import functools
 import os
 import re
 
-# --- 项目根目录 ---
-
 # --- 项目根目录 ---
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_PATH = os.path.join(PROJECT_ROOT, ".env")
 
-def load_dotenv():
+def load_dotenv(env_path=ENV_PATH):
     """
     从项目根目录的 .env 文件加载环境变量。
     """
-    env_path = os.path.join(PROJECT_ROOT, ".env")
     variables = {}
     try:
         with open(env_path, 'r') as f:
@@ -24,30 +23,56 @@ def load_dotenv():
         print(f"错误：找不到配置文件: {env_path}")
         return None
 
-# 加载 .env 文件
-env_vars = load_dotenv()
-if env_vars is None:
-    raise FileNotFoundError("未能找到 .env 文件。请确保已成功运行 start_local_node.sh 脚本。")
+@functools.lru_cache(maxsize=None)
+def load_config():
+    """
+    解析 .env 中与部署相关的配置并缓存结果。
+    导入本模块不会读取 .env；第一次访问 CONTRACT_ADDRESS 等部署配置时才调用本函数。
+    """
+    env_vars = load_dotenv()
+    if env_vars is None:
+        raise FileNotFoundError("未能找到 .env 文件。请确保已成功运行 start_local_node.sh 脚本。")
+    contract_address = env_vars.get("CONTRACT_ADDRESS")
+    if contract_address is None:
+        raise ValueError("未能在 .env 文件中找到 CONTRACT_ADDRESS。")
+    print(f"读取到合约地址: {contract_address}")
+    return {"CONTRACT_ADDRESS": contract_address}
 
-# os.path.abspath(__file__) -> 获取 config.py 的绝对路径
-# os.path.dirname(...) -> 获取 client 目录的路径
-# os.path.dirname(...) -> 获取项目根目录的路径
+def __getattr__(name):
+    # PEP 562：来自 .env 的配置项在首次访问时才解析（例如 config.CONTRACT_ADDRESS）
+    if name in ("CONTRACT_ADDRESS",):
+        return load_config()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def strip_proxy_env():
+    """删除代理环境变量，避免访问本地节点的 RPC 请求被转发到代理（在入口的 main 中调用）。"""
+    for key in ('http_proxy', 'https_proxy'):
+        os.environ.pop(key, None)
+
+def artifact_dirs(work_dir=None):
+    """
+    客户端与聚合者写文件的位置。work_dir 为 None 时各项均为 None，即使用各模块自己的默认位置
+    （saved_models/ 与 logs/ 下）；否则全部放在 work_dir 下，例如基准测试每个场景使用一个临时目录。
+    """
+    if work_dir is None:
+        return dict.fromkeys(("saved_models", "store", "relay", "rewards", "checkpoint", "logs"))
+    return {
+        "saved_models": work_dir,
+        "store": os.path.join(work_dir, "store"),
+        "relay": os.path.join(work_dir, "relay"),
+        "rewards": os.path.join(work_dir, "rewards"),
+        "checkpoint": os.path.join(work_dir, "checkpoint.json"),
+        "logs": os.path.join(work_dir, "logs"),
+    }
 
 # --- 区块链配置 ---
 RPC_URL = "http://127.0.0.1:8545"
 
-# 合约地址 - 每次部署后都需要从 deploy.log 文件更新
-CONTRACT_ADDRESS = "0x5FbDB2315678afecb367f032d93F642f64180aa3" 
-
 # ABI 文件路径 - 现在是绝对路径，不会再出错
 ABI_PATH = os.path.join(PROJECT_ROOT, "blockchain", "artifacts", "contracts", "FederatedLearning.sol", "FederatedLearning.json")
 
 # --- 合约地址 ---
-# 自动从 .env 文件获取
-CONTRACT_ADDRESS = env_vars.get("CONTRACT_ADDRESS")
-if CONTRACT_ADDRESS is None:
-    raise ValueError("未能在 .env 文件中找到 CONTRACT_ADDRESS。")
-print(f"读取到合约地址: {CONTRACT_ADDRESS}")
+# 自动从 .env 文件获取：通过 config.CONTRACT_ADDRESS 访问，见上面的 __getattr__
 
 
 # ================== 账户设置 ==================
@@ -64,6 +89,34 @@ CLIENT1_PRIVATE_KEY = "0x59c6995e998f97a5a0044966f0945389dc9e86dae88c7a8412f4603
 # 客户端 2 地址: 0x3C44CdDdB6a900fa2b585dd299e03d12FA4293BC
 CLIENT2_PRIVATE_KEY = "0x5de4111afa1a4b94908f83103eb1f1706367c2e68ca870fc3fb9a804cdab365a"
 
+# 更多客户端的私钥从 Hardhat 节点默认助记词按 BIP-44 路径派生：
+# 账户 0 是聚合者，客户端 i 使用账户 i + 1（客户端 0、1 即上面两个私钥）。
+# 节点默认只预置 20 个有余额的账户，更多客户端需要设置 HARDHAT_ACCOUNT_COUNT 后再启动节点。
+HARDHAT_MNEMONIC = "test test test test test test test test test test test junk"
+
+@functools.lru_cache(maxsize=None)
+def derive_private_key(account_index):
+    from eth_account import Account
+    Account.enable_unaudited_hdwallet_features()
+    account = Account.from_mnemonic(HARDHAT_MNEMONIC, account_path=f"m/44'/60'/0'/0/{account_index}")
+    return account.key.hex()
+
+def client_private_key(client_id):
+    return derive_private_key(client_id + 1)
+
+# ================== 数据划分设置 ==================
+# 客户端训练数据的划分策略："contiguous" / "iid" / "dirichlet" / "shard"（见 partitioner.PARTITION_STRATEGIES）。
+# 客户端、data_loader.load_cifar10 与 partitioner 都以这里为默认值；默认按样本位置连续切分（原始行为）
+PARTITION_STRATEGY = "contiguous"
+PARTITION_SEED = 0
+# 传给划分策略的额外参数，例如 {"alpha": 0.1}（dirichlet）或 {"shards_per_client": 2}（shard）
+PARTITION_OPTIONS = {}
+
 # ================== IPFS 设置 ==================
 # 如果您的 IPFS 守护进程运行在不同的地址，请修改这里
-# IPFS_API_URL = "/ip4/127.0.0.1/tcp/5001"
\ No newline at end of file
+# IPFS_API_URL = "/ip4/127.0.0.1/tcp/5001"
+
+# ================== 常驻进程设置 ==================
+# 常驻工作进程（client.py --worker / aggregator.py --serve）向 server.py 发送控制信号时使用的行前缀，
+# server.py 从这里导入
+WORKER_SIGNAL_PREFIX = "@@FL_WORKER@@"
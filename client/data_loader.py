@@ -1,56 +1,254 @@
 import torch
-from torchvision import datasets, transforms
+import numpy as np
 from torch.utils.data import DataLoader, Subset
 import os
+import queue
+import threading
 
-def load_cifar10(root_dir="../data", client_id=0, num_clients=1):
-    """
-    加载并划分 CIFAR-10 数据集。
-    现在返回一个 Dataset 对象，而不是 DataLoader。
-    """
-    transform = transforms.Compose([
+from config import PARTITION_SEED, PARTITION_STRATEGY
+from partitioner import load_partition
+from utils.fileio import atomic_write
+
+# --- 归一化参数 ---
+CIFAR10_MEAN = (0.5, 0.5, 0.5)
+CIFAR10_STD = (0.5, 0.5, 0.5)
+
+# --- 预解码缓存 ---
+# CIFAR-10 的每个划分会被一次性转换为磁盘上连续的 uint8 数组 (N×3×32×32) 与 int64 标签数组，
+# 之后所有客户端和聚合器都以只读 memmap 的方式打开，共享同一份页缓存。
+CACHE_DIR_NAME = "cifar10_cache"
+# torchvision 只在构建缓存或使用未缓存的数据集时才需要，按需导入以缩短进程启动时间
+
+
+def _normalizing_transform():
+    from torchvision import transforms
+    return transforms.Compose([
         transforms.ToTensor(),
-        transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
+        transforms.Normalize(CIFAR10_MEAN, CIFAR10_STD)
     ])
 
-    # 确保数据目录存在
+
+def _resolve_data_path(root_dir):
     data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), root_dir))
     os.makedirs(data_path, exist_ok=True)
+    return data_path
+
+
+def _cache_paths(data_path, train):
+    split = "train" if train else "test"
+    cache_dir = os.path.join(data_path, CACHE_DIR_NAME)
+    return os.path.join(cache_dir, f"{split}_images.npy"), os.path.join(cache_dir, f"{split}_labels.npy")
+
+
+def _atomic_save_npy(path, array):
+    # 多个进程同时构建缓存时，读者也不会看到写了一半的文件
+    with atomic_write(path, 'wb') as f:
+        np.save(f, array)
+
+
+def build_cifar10_cache(data_path, train=True):
+    """
+    将 CIFAR-10 的一个划分转换为预解码的 uint8 缓存文件（已存在时直接返回路径）。
+    torchvision 的 CIFAR10 本身就以 uint8 数组保存原始像素，这里只做一次 NHWC -> NCHW 的重排并落盘。
+    """
+    images_path, labels_path = _cache_paths(data_path, train)
+    if os.path.exists(images_path) and os.path.exists(labels_path):
+        return images_path, labels_path
+
+    os.makedirs(os.path.dirname(images_path), exist_ok=True)
+    from torchvision import datasets
+    raw_dataset = datasets.CIFAR10(root=data_path, train=train, download=True)
+    images = np.ascontiguousarray(raw_dataset.data.transpose(0, 3, 1, 2))
+    labels = np.asarray(raw_dataset.targets, dtype=np.int64)
+    _atomic_save_npy(labels_path, labels)
+    _atomic_save_npy(images_path, images)
+    print(f"  - 已生成 CIFAR-10 {'训练' if train else '测试'}集预解码缓存: {images_path}")
+    return images_path, labels_path
+
+
+def normalize_batch(images, mean=CIFAR10_MEAN, std=CIFAR10_STD):
+    """对一整批 uint8 图像 (B×3×H×W) 做向量化的 ToTensor + Normalize，返回 float32 张量。"""
+    mean = torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+    std = torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+    return images.to(torch.float32).div_(255.0).sub_(mean).div_(std)
+
+
+class CachedCIFAR10:
+    """
+    基于 memmap 缓存的 CIFAR-10 视图。
+    images / labels 是磁盘数组的零拷贝视图；indices 不为 None 时，数据集只包含这些（升序的）样本位置，
+    划分客户端数据时不会复制像素，只在取批次时按索引读取。
+    仍然实现了 Dataset 协议（__len__ / __getitem__），可以在需要时交给普通的 DataLoader。
+    """
+    def __init__(self, images, labels, indices=None):
+        self.images = images
+        self.labels = labels
+        self.indices = indices
+
+    @classmethod
+    def open(cls, data_path, train=True):
+        images_path, labels_path = build_cifar10_cache(data_path, train)
+        return cls(np.load(images_path, mmap_mode='r'), np.load(labels_path, mmap_mode='r'))
+
+    def slice(self, start, end):
+        """返回 [start, end) 范围的零拷贝视图。"""
+        if self.indices is not None:
+            return CachedCIFAR10(self.images, self.labels, self.indices[start:end])
+        return CachedCIFAR10(self.images[start:end], self.labels[start:end])
+
+    def subset(self, indices):
+        """返回只包含给定样本位置（相对本视图）的视图。"""
+        indices = np.asarray(indices)
+        if self.indices is not None:
+            indices = self.indices[indices]
+        return CachedCIFAR10(self.images, self.labels, indices)
+
+    def fetch(self, positions):
+        """按位置（切片或升序数组）一次取出一批 (images, labels) numpy 数组。"""
+        if self.indices is not None:
+            positions = self.indices[positions]
+        return np.asarray(self.images[positions]), np.asarray(self.labels[positions])
+
+    def __len__(self):
+        return len(self.indices) if self.indices is not None else len(self.labels)
+
+    def __getitem__(self, idx):
+        if self.indices is not None:
+            idx = self.indices[idx]
+        image = torch.from_numpy(np.array(self.images[idx]))
+        return normalize_batch(image.unsqueeze(0))[0], int(self.labels[idx])
 
-    # 下载或加载 CIFAR-10 训练集
-    train_dataset = datasets.CIFAR10(root=data_path, train=True, download=True, transform=transform)
+
+class BatchedArrayLoader:
+    """
+    以整批为单位从 CachedCIFAR10 中取数的加载器，用来替代逐样本的 PIL + ToTensor 流程。
+    每个批次只做一次 memmap 的花式索引和一次向量化归一化。
+    prefetch > 0 时由一个后台线程提前准备最多 prefetch 个批次，与训练计算重叠
+    （索引与归一化大部分在 numpy/torch 内部执行，不持有 GIL）。
+    """
+    def __init__(self, dataset, batch_size, shuffle=False, prefetch=0):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+
+    def __len__(self):
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        if self.prefetch <= 0:
+            return self._iter_batches()
+        return self._iter_prefetched()
+
+    def _iter_prefetched(self):
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        end_of_epoch = object()
+
+        def put(item):
+            # 消费者提前退出（break）时 stop 被置位，生产者不会永远阻塞在满队列上
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for batch in self._iter_batches():
+                    if not put(batch):
+                        return
+                put(end_of_epoch)
+            except Exception as e:
+                put(e)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is end_of_epoch:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            producer.join()
+
+    def _iter_batches(self):
+        num_samples = len(self.dataset)
+        order = torch.randperm(num_samples).numpy() if self.shuffle else None
+        for start in range(0, num_samples, self.batch_size):
+            end = min(start + self.batch_size, num_samples)
+            if order is None:
+                images, labels = self.dataset.fetch(slice(start, end))
+            else:
+                # 排序后的索引让 memmap 读取保持单调，对页缓存更友好；批内顺序不影响训练
+                images, labels = self.dataset.fetch(np.sort(order[start:end]))
+            yield normalize_batch(torch.from_numpy(images)), torch.from_numpy(labels)
+
+
+def make_data_loader(dataset, batch_size, shuffle=False, num_workers=0, persistent_workers=False):
+    """
+    为数据集选择合适的加载器：缓存数据集使用批量加载器（num_workers 为预取的批次数），
+    其余使用标准 DataLoader（num_workers 个工作进程，persistent_workers 时在 epoch 之间保留）。
+    """
+    if isinstance(dataset, CachedCIFAR10):
+        return BatchedArrayLoader(dataset, batch_size=batch_size, shuffle=shuffle, prefetch=num_workers)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                      persistent_workers=persistent_workers and num_workers > 0)
+
+
+def load_cifar10(root_dir="../data", client_id=0, num_clients=1, use_cache=True, strategy=PARTITION_STRATEGY, seed=PARTITION_SEED, **partition_options):
+    """
+    加载并划分 CIFAR-10 数据集。
+    现在返回一个 Dataset 对象，而不是 DataLoader。
+    use_cache=True 时返回预解码 memmap 缓存上的零拷贝视图。
+    strategy / seed / partition_options 决定划分方式（见 partitioner.PARTITION_STRATEGIES），
+    划分只在第一次使用时计算，之后各客户端直接从缓存的划分文件中查找自己的分片。
+    """
+    # 确保数据目录存在
+    data_path = _resolve_data_path(root_dir)
+
+    if use_cache:
+        train_dataset = CachedCIFAR10.open(data_path, train=True)
+        labels = train_dataset.labels
+    else:
+        from torchvision import datasets
+        # 下载或加载 CIFAR-10 训练集
+        train_dataset = datasets.CIFAR10(root=data_path, train=True, download=True, transform=_normalizing_transform())
+        labels = np.asarray(train_dataset.targets, dtype=np.int64)
 
     # 划分数据集
-    num_samples = len(train_dataset)
-    indices = list(range(num_samples))
-    samples_per_client = num_samples // num_clients
-    
-    start_idx = client_id * samples_per_client
-    end_idx = start_idx + samples_per_client
-    
-    client_indices = indices[start_idx:end_idx]
-    client_dataset = Subset(train_dataset, client_indices)
-    
-    print(f"  - 为客户端 {client_id} 加载了 {len(client_dataset)} 条 CIFAR-10 训练数据。")
-    
+    partition = load_partition(data_path, "train", labels, num_clients, strategy, seed, **partition_options)
+    client_indices = partition.client_indices(client_id)
+
+    if use_cache:
+        client_dataset = train_dataset.subset(client_indices)
+    else:
+        client_dataset = Subset(train_dataset, client_indices.tolist())
+
+    print(f"  - 为客户端 {client_id} 加载了 {len(client_dataset)} 条 CIFAR-10 训练数据（划分策略: {strategy}）。")
+
     return client_dataset
 
-def load_cifar10_test(root_dir="../data"):
+def load_cifar10_test(root_dir="../data", use_cache=True):
     """
     加载 CIFAR-10 测试数据集。
-    返回一个 DataLoader 对象。
+    返回一个可迭代的批量加载器（use_cache=True 时为基于 memmap 缓存的 BatchedArrayLoader）。
     """
-    transform = transforms.Compose([
-        transforms.ToTensor(),
-        transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
-    ])
+    data_path = _resolve_data_path(root_dir)
 
-    data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), root_dir))
-    os.makedirs(data_path, exist_ok=True)
+    if use_cache:
+        test_dataset = CachedCIFAR10.open(data_path, train=False)
+    else:
+        from torchvision import datasets
+        test_dataset = datasets.CIFAR10(root=data_path, train=False, download=True, transform=_normalizing_transform())
+    test_loader = make_data_loader(test_dataset, batch_size=128, shuffle=False)
 
-    test_dataset = datasets.CIFAR10(root=data_path, train=False, download=True, transform=transform)
-    test_loader = DataLoader(test_dataset, batch_size=128, shuffle=False)
-    
     print(f"  - 加载了 {len(test_dataset)} 条 CIFAR-10 测试数据用于评估。")
-    
-    return test_loader
\ No newline at end of file
+
+    return test_loader
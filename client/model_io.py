@@ -0,0 +1,391 @@
+import io
+import json
+import math
+import os
+import mmap as mmap_module
+import struct
+
+import torch
+
+# 客户端与聚合器共用的模型更新读写函数。
+# 更新文件除了模型参数之外还记录客户端本轮使用的训练样本数，供聚合器按样本数加权。
+#
+# 更新有两种形式：
+#   - 完整的 state_dict（压缩方案 "none"）；
+#   - 相对当前全局模型的压缩增量（"fp16" / "int8" / "topk"），聚合器可以直接解码进累加器。
+
+# --- 压缩方案 ---
+#   "none" —— 完整的 fp32 state_dict
+#   "fp16" —— 增量以 fp16 存储
+#   "int8" —— 增量按张量对称量化为 int8（每个张量一个缩放系数）
+#   "topk" —— 每个张量只保留绝对值最大的 topk_ratio 比例的增量（稀疏索引 + 数值）
+COMPRESSION_SCHEMES = ("none", "fp16", "int8", "topk")
+COMPRESSED_MARKER = "__compressed_delta__"
+
+# --- 文件格式 ---
+#   "safetensors" —— 与 safetensors 相同的平铺格式：8 字节小端头部长度 + JSON 头部 + 连续的原始张量数据。
+#                    读取时整个文件以 mmap 映射，每个张量都是映射区上的零拷贝视图，只有被访问的页才会读入内存；
+#                    写入时逐个张量把原始字节流式写入文件，不在内存中拼出整个文件；不经过 pickle。
+# 更新、全局模型与残差都来自其他进程或其他客户端，读取时只接受这一种格式：
+# 不再回退到 torch.load（pickle 反序列化可以执行任意代码），头部不合法的文件直接拒绝。
+# 头部长度上限，防止损坏或恶意的文件让读者分配过大的内存
+MAX_HEADER_BYTES = 100 * 1024 * 1024
+# 张量数据按此字节数对齐（头部用空格补齐），保证每个张量视图的起始地址与其元素大小对齐
+HEADER_ALIGNMENT = 8
+
+
+def is_compressed(update):
+    return isinstance(update, dict) and update.get(COMPRESSED_MARKER, False)
+
+
+def _encode_tensor(delta, scheme, topk_ratio):
+    if scheme == "fp16":
+        return {'values': delta.to(torch.float16)}
+    if scheme == "int8":
+        scale = delta.abs().max().item() / 127.0 if delta.numel() else 0.0
+        if scale == 0.0:
+            scale = 1.0
+        quantized = torch.round(delta / scale).clamp_(-127, 127).to(torch.int8)
+        return {'values': quantized, 'scale': scale}
+    if scheme == "topk":
+        flat = delta.reshape(-1)
+        k = min(flat.numel(), max(1, math.ceil(topk_ratio * flat.numel())))
+        indices = flat.abs().topk(k).indices
+        return {'indices': indices.to(torch.int32), 'values': flat[indices].clone(), 'shape': tuple(delta.shape)}
+    raise ValueError(f"未知的压缩方案: {scheme}（可选: {', '.join(COMPRESSION_SCHEMES)}）")
+
+
+def _decode_tensor_into(out, encoded, scheme, alpha=1.0):
+    """把一个编码后的增量乘以 alpha 后原地加到 out 上。"""
+    if scheme == "fp16":
+        out.add_(encoded['values'].to(out.dtype), alpha=alpha)
+    elif scheme == "int8":
+        out.add_(encoded['values'].to(out.dtype), alpha=alpha * encoded['scale'])
+    elif scheme == "topk":
+        out.view(-1).index_add_(0, encoded['indices'].to(torch.int64), encoded['values'].to(out.dtype), alpha=alpha)
+    else:
+        raise ValueError(f"未知的压缩方案: {scheme}")
+    return out
+
+
+def compress_update(state_dict, base_state_dict, scheme, topk_ratio=0.01, residual=None):
+    """
+    把训练后的 state_dict 编码为相对 base_state_dict 的压缩增量。
+    residual 是上一轮留下的压缩误差（误差反馈）：它会先加到本轮增量上，
+    编码后未能传输的部分作为新的 residual 返回，由客户端保留到下一轮。
+    返回 (update, new_residual)；scheme 为 "none" 或没有基准模型时返回完整 state_dict。
+    """
+    if scheme == "none" or base_state_dict is None:
+        return state_dict, None
+    tensors, dense, new_residual = {}, {}, {}
+    for key, value in state_dict.items():
+        if not value.is_floating_point():
+            dense[key] = value
+            continue
+        delta = value.detach().to(torch.float32) - base_state_dict[key].to(value.device, torch.float32)
+        if residual is not None and key in residual:
+            delta += residual[key].to(delta.device)
+        encoded = _encode_tensor(delta, scheme, topk_ratio)
+        tensors[key] = encoded
+        new_residual[key] = _decode_tensor_into(delta.clone(), encoded, scheme, alpha=-1.0)
+    update = {COMPRESSED_MARKER: True, 'scheme': scheme, 'tensors': tensors, 'dense': dense}
+    return update, new_residual
+
+
+def accumulate_update(accumulator, update, weight, base_state_dict=None):
+    """
+    把一个客户端更新乘以 weight 后原地累加到 accumulator 中（首次调用时 accumulator 传 None）。
+    有 base_state_dict 时累加器保存的是加权增量之和，完整 state_dict 会先换算成相对基准的增量；
+    没有基准时（例如第一轮）累加器保存完整模型的加权和，此时只接受完整 state_dict。
+    返回累加器。
+    """
+    if accumulator is None:
+        template = base_state_dict if base_state_dict is not None else update
+        accumulator = {key: torch.zeros_like(value) for key, value in template.items()}
+    if is_compressed(update):
+        if base_state_dict is None:
+            raise ValueError("收到压缩增量，但聚合器没有可用的基准全局模型。")
+        for key, encoded in update['tensors'].items():
+            _decode_tensor_into(accumulator[key], encoded, update['scheme'], alpha=weight)
+        dense = update['dense']
+    else:
+        dense = {}
+        for key, value in update.items():
+            if not value.is_floating_point():
+                dense[key] = value
+            elif base_state_dict is not None:
+                accumulator[key].add_(value, alpha=weight).sub_(base_state_dict[key], alpha=weight)
+            else:
+                accumulator[key].add_(value, alpha=weight)
+    # 整数缓冲区（如 BatchNorm 的计数器）无法加权平均，直接沿用最新的值
+    for key, value in dense.items():
+        accumulator[key].copy_(value)
+    return accumulator
+
+
+def finalize_average(accumulator, total_weight, base_state_dict=None):
+    """把累加器除以总权重，并在有基准模型时加回基准，得到新的全局模型 state_dict。"""
+    for key, value in accumulator.items():
+        if value.is_floating_point():
+            value.div_(total_weight)
+            if base_state_dict is not None:
+                value.add_(base_state_dict[key])
+    return accumulator
+
+
+def rebase_update(state_dict, update_base_state_dict, base_state_dict):
+    """
+    把基于 update_base_state_dict 训练出的完整 state_dict 换算为相对 base_state_dict 的等价模型：
+    base + (state_dict - update_base)。陈旧的完整模型据此只贡献它自己的训练增量，
+    而不会把期间全局模型的变化也当作该客户端的贡献（压缩增量本来就相对其训练时的基准，无需换算）。
+    """
+    rebased = {}
+    for key, value in state_dict.items():
+        if value.is_floating_point():
+            rebased[key] = base_state_dict[key] + (value - update_base_state_dict[key].to(value.device))
+        else:
+            rebased[key] = value
+    return rebased
+
+
+def decode_update(update, base_state_dict=None):
+    """把任意形式的更新还原为完整的 state_dict。"""
+    if not is_compressed(update):
+        return update
+    state_dict = {key: value.clone() for key, value in base_state_dict.items()}
+    for key, encoded in update['tensors'].items():
+        _decode_tensor_into(state_dict[key], encoded, update['scheme'])
+    state_dict.update(update['dense'])
+    return state_dict
+
+
+# --- 平铺张量文件 ---
+_DTYPE_CODES = {
+    torch.float64: "F64", torch.float32: "F32", torch.float16: "F16", torch.bfloat16: "BF16",
+    torch.int64: "I64", torch.int32: "I32", torch.int16: "I16", torch.int8: "I8",
+    torch.uint8: "U8", torch.bool: "BOOL",
+}
+_CODE_DTYPES = {code: dtype for dtype, code in _DTYPE_CODES.items()}
+
+
+def write_tensors(f, tensors, metadata=None):
+    """
+    把 {名称: 张量} 按平铺格式流式写入已打开的二进制文件 f，返回写入的字节数。
+    metadata 是附在头部的字符串字典。张量按元素大小从大到小排列，数据区内不留空隙也不会错位。
+    """
+    tensors = {name: tensor.detach().contiguous() for name, tensor in tensors.items()}
+    order = sorted(tensors, key=lambda name: -tensors[name].element_size())
+    header, offset = {}, 0
+    for name in order:
+        tensor = tensors[name]
+        if tensor.dtype not in _DTYPE_CODES:
+            raise ValueError(f"不支持的张量类型: {name} ({tensor.dtype})")
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {"dtype": _DTYPE_CODES[tensor.dtype], "shape": list(tensor.shape), "data_offsets": [offset, offset + size]}
+        offset += size
+    # 头部中的条目保持调用方的插入顺序，读取时 keys() 的顺序与写入时一致
+    header = {name: header[name] for name in tensors}
+    if metadata:
+        header["__metadata__"] = {str(key): str(value) for key, value in metadata.items()}
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-(8 + len(header_bytes)) % HEADER_ALIGNMENT)
+    f.write(struct.pack("<Q", len(header_bytes)))
+    f.write(header_bytes)
+    for name in order:
+        tensor = tensors[name]
+        if tensor.numel():
+            # 按字节重新解释后交给 numpy 暴露缓冲区（numpy 不支持 bfloat16，但 uint8 视图总是可以导出）
+            f.write(tensor.cpu().reshape(-1).view(torch.uint8).numpy().data)
+    return 8 + len(header_bytes) + offset
+
+
+def _read_header_length(f):
+    prefix = f.read(9)
+    if len(prefix) < 9 or prefix[8:9] != b"{":
+        return None
+    (header_length,) = struct.unpack("<Q", prefix[:8])
+    return header_length if header_length <= MAX_HEADER_BYTES else None
+
+
+def _check_header(header, data_size, path):
+    """校验头部中每个张量的类型、形状与数据区间，避免越界读取或错误解释数据。"""
+    if not isinstance(header, dict):
+        raise ValueError(f"平铺张量文件的头部不是 JSON 对象: {path}")
+    metadata = header.pop("__metadata__", {})
+    if not isinstance(metadata, dict):
+        raise ValueError(f"平铺张量文件的元数据不合法: {path}")
+    for name, entry in header.items():
+        try:
+            dtype = _CODE_DTYPES[entry["dtype"]]
+            shape = entry["shape"]
+            begin, end = entry["data_offsets"]
+            valid = (all(isinstance(dim, int) and dim >= 0 for dim in shape)
+                     and isinstance(begin, int) and isinstance(end, int) and 0 <= begin <= end <= data_size
+                     and end - begin == math.prod(shape) * dtype.itemsize)
+        except (KeyError, TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise ValueError(f"平铺张量文件中张量 {name} 的头部条目不合法: {path}")
+    return metadata
+
+
+class TensorFile:
+    """
+    只读地打开一个平铺张量文件。头部在打开时解析，张量在 get_tensor() 时才创建。
+    mmap=True 时文件以私有（写时复制）方式映射，返回的张量是映射区上的零拷贝视图，
+    读取按页惰性发生；调用方原地修改张量不会写回文件。mmap=False 时整个文件读入内存。
+    张量持有映射区的引用，TensorFile 对象本身可以先于张量被回收。
+    """
+    def __init__(self, path, mmap=True):
+        with open(path, 'rb') as f:
+            header_length = _read_header_length(f)
+            file_size = os.fstat(f.fileno()).st_size
+            if header_length is None or 8 + header_length > file_size:
+                raise ValueError(f"不是平铺张量格式的文件: {path}")
+            f.seek(8)
+            try:
+                header = json.loads(f.read(header_length))
+            except UnicodeDecodeError as e:
+                raise ValueError(f"平铺张量文件的头部无法解码: {path}") from e
+            metadata = _check_header(header, file_size - 8 - header_length, path)
+            if mmap:
+                self._buffer = mmap_module.mmap(f.fileno(), 0, access=mmap_module.ACCESS_COPY)
+            else:
+                f.seek(0)
+                self._buffer = bytearray(file_size)
+                f.readinto(self._buffer)
+        self._data_start = 8 + header_length
+        self.metadata = metadata
+        self._entries = header
+
+    def keys(self):
+        return list(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def get_tensor(self, name):
+        entry = self._entries[name]
+        dtype = _CODE_DTYPES[entry["dtype"]]
+        begin, end = entry["data_offsets"]
+        if end == begin:
+            return torch.empty(entry["shape"], dtype=dtype)
+        tensor = torch.frombuffer(self._buffer, dtype=dtype, count=(end - begin) // dtype.itemsize,
+                                  offset=self._data_start + begin)
+        return tensor.view(entry["shape"])
+
+    def tensors(self, map_location="cpu"):
+        device = torch.device(map_location)
+        if device.type == "cpu":
+            return {name: self.get_tensor(name) for name in self._entries}
+        return {name: self.get_tensor(name).to(device) for name in self._entries}
+
+
+# --- 更新与全局模型的读写 ---
+# 完整 state_dict 的张量按原名保存；压缩增量展平为 "delta/<参数名>/<字段>" 与 "dense/<参数名>"，
+# 缩放系数、稀疏形状等非张量字段与压缩方案、样本数一起写入头部元数据。
+
+def _flatten_update(update, num_samples):
+    metadata = {"num_samples": int(num_samples)}
+    if not is_compressed(update):
+        metadata["kind"] = "state_dict"
+        return dict(update), metadata
+    tensors, params = {}, {}
+    for key, encoded in update['tensors'].items():
+        for field, value in encoded.items():
+            if isinstance(value, torch.Tensor):
+                tensors[f"delta/{key}/{field}"] = value
+            else:
+                params.setdefault(key, {})[field] = value
+    for key, value in update['dense'].items():
+        tensors[f"dense/{key}"] = value
+    metadata.update(kind="compressed_delta", scheme=update['scheme'], params=json.dumps(params))
+    return tensors, metadata
+
+
+def _unflatten_update(tensors, metadata):
+    if metadata.get("kind") != "compressed_delta":
+        return tensors
+    encoded_tensors = {}
+    for key, params in json.loads(metadata["params"]).items():
+        encoded_tensors[key] = {field: tuple(value) if field == 'shape' else value for field, value in params.items()}
+    dense = {}
+    for name, tensor in tensors.items():
+        section, _, rest = name.partition("/")
+        if section == "dense":
+            dense[rest] = tensor
+        else:
+            key, _, field = rest.rpartition("/")
+            encoded_tensors.setdefault(key, {})[field] = tensor
+    return {COMPRESSED_MARKER: True, 'scheme': metadata["scheme"], 'tensors': encoded_tensors, 'dense': dense}
+
+
+def write_model_update(f, update, num_samples):
+    """把一个客户端模型更新（完整 state_dict 或压缩增量）及其训练样本数流式写入已打开的二进制文件，返回写入的字节数。"""
+    tensors, metadata = _flatten_update(update, num_samples)
+    return write_tensors(f, tensors, metadata)
+
+
+def write_state_dict(f, state_dict):
+    """把全局模型的 state_dict 流式写入已打开的二进制文件，返回写入的字节数。"""
+    return write_tensors(f, state_dict, {"kind": "state_dict"})
+
+
+def serialize_model_update(update, num_samples):
+    """把一个客户端模型更新序列化为字节串（需要整段字节时使用；写入存储请用 write_model_update 流式写入）。"""
+    buffer = io.BytesIO()
+    write_model_update(buffer, update, num_samples)
+    return buffer.getvalue()
+
+
+def save_model_update(path, update, num_samples):
+    """保存一个客户端模型更新到文件，返回写入的字节数。"""
+    with open(path, 'wb') as f:
+        return write_model_update(f, update, num_samples)
+
+
+def is_full_model_update(path):
+    """更新文件保存的是否为完整的 state_dict（而不是压缩增量）；只读取文件头部。"""
+    return TensorFile(path).metadata.get("kind") != "compressed_delta"
+
+
+def load_model_update(path, map_location="cpu", mmap=False):
+    """
+    读取一个客户端模型更新，返回 (update, num_samples)。
+    mmap=True 时张量直接映射自文件，不会整体读入内存。不是平铺张量格式的文件抛出 ValueError。
+    """
+    tensor_file = TensorFile(path, mmap=mmap)
+    update = _unflatten_update(tensor_file.tensors(map_location), tensor_file.metadata)
+    return update, int(tensor_file.metadata.get("num_samples", 1))
+
+
+def serialize_state_dict(state_dict):
+    """把全局模型的 state_dict 序列化为字节串。"""
+    buffer = io.BytesIO()
+    write_state_dict(buffer, state_dict)
+    return buffer.getvalue()
+
+
+def save_state_dict(path, state_dict):
+    with open(path, 'wb') as f:
+        return write_state_dict(f, state_dict)
+
+
+def load_state_dict(path, map_location="cpu", mmap=False):
+    """读取全局模型的 state_dict；不是平铺张量格式的文件抛出 ValueError。"""
+    return TensorFile(path, mmap=mmap).tensors(map_location)
+
+
+def write_partial_sum(f, accumulator, total_weight, num_updates):
+    """写出边缘聚合器的加权部分和（累加器含义同 accumulate_update）及其总权重，返回写入的字节数。"""
+    # repr 可以无损地往返 float
+    metadata = {"kind": "partial_sum", "total_weight": repr(float(total_weight)), "num_updates": int(num_updates)}
+    return write_tensors(f, accumulator, metadata)
+
+
+def load_partial_sum(path, mmap=True):
+    """读取 write_partial_sum 写出的部分和，返回 (accumulator, total_weight, num_updates)。"""
+    tensor_file = TensorFile(path, mmap=mmap)
+    if tensor_file.metadata.get("kind") != "partial_sum":
+        raise ValueError(f"不是部分和文件: {path}")
+    return tensor_file.tensors(), float(tensor_file.metadata["total_weight"]), int(tensor_file.metadata["num_updates"])
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+
+from utils.fileio import atomic_write
+
+# --- 本地内容寻址存储（IPFS 的本地替身） ---
+# 模型文件按内容的 SHA-256 摘要（即 CID）存放在分层目录中：<root>/<cid[0:2]>/<cid[2:4]>/<cid>。
+# 相同内容只存一份；链上只记录 CID，不再记录依赖具体主机和目录的绝对路径。
+DEFAULT_STORE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'saved_models', 'store'))
+CID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+# 链上以 bytes32 保存 CID（SHA-256 摘要正好 32 字节）；全零表示“尚无全局模型”
+EMPTY_CID_BYTES = bytes(32)
+
+
+def cid_to_bytes32(cid):
+    """CID（64 位十六进制字符串）-> 合约中的 bytes32；None 编码为全零。"""
+    if cid is None:
+        return EMPTY_CID_BYTES
+    if not ModelStore.is_cid(cid):
+        raise ValueError(f"无效的 CID: {cid}")
+    return bytes.fromhex(cid)
+
+
+def cid_from_bytes32(value):
+    """合约返回的 bytes32 -> CID 字符串；全零返回 None。"""
+    value = bytes(value)
+    return None if value == EMPTY_CID_BYTES else value.hex()
+
+
+class ChecksumMismatchError(IOError):
+    """存储中的文件内容与其 CID 不一致（文件损坏或被篡改）。"""
+
+
+class _HashingWriter:
+    """只追加的文件包装：写入的同时累计 SHA-256 摘要与字节数。"""
+    def __init__(self, f):
+        self._f = f
+        self._digest = hashlib.sha256()
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._digest.update(data)
+        self.bytes_written += memoryview(data).nbytes
+        return self._f.write(data)
+
+    def tell(self):
+        return self.bytes_written
+
+    def flush(self):
+        self._f.flush()
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class ModelStore:
+    def __init__(self, root=None, fanout_levels=2):
+        root = root or DEFAULT_STORE_DIR
+        self.root = root
+        self.fanout_levels = fanout_levels
+        self.refs_dir = os.path.join(root, "refs")
+        # 本进程中已经校验过的 CID，避免重复计算摘要
+        self._verified = set()
+
+    @staticmethod
+    def is_cid(value):
+        return isinstance(value, str) and CID_PATTERN.match(value) is not None
+
+    def _blob_path(self, cid):
+        shards = [cid[2 * i:2 * i + 2] for i in range(self.fanout_levels)]
+        return os.path.join(self.root, *shards, cid)
+
+    def has(self, cid):
+        return self.is_cid(cid) and os.path.exists(self._blob_path(cid))
+
+    def put_bytes(self, data):
+        """写入一段内容并返回其 CID；内容已存在时直接返回（去重）。"""
+        cid = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(cid)
+        if not os.path.exists(path):
+            # 并发写入同一内容或中途崩溃都不会留下半个文件
+            with atomic_write(path, 'wb', durable=True) as f:
+                f.write(data)
+        self._verified.add(cid)
+        return cid
+
+    def put_stream(self, write):
+        """
+        流式写入一个对象：write(f) 把内容写入存储目录下的临时文件，边写边计算摘要，
+        写完后原子地重命名为 CID 路径。返回 (cid, 写入的字节数)。内容已存在时丢弃临时文件（去重）。
+        """
+        # CID 要等内容写完才知道，目标路径事先未知，因此这里不用 atomic_write，而是在存储根目录下写临时文件
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer = _HashingWriter(f)
+                write(writer)
+                f.flush()
+                os.fsync(f.fileno())
+            cid = writer.hexdigest()
+            path = self._blob_path(cid)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._verified.add(cid)
+        return cid, writer.bytes_written
+
+    def put_file(self, src_path):
+        with open(src_path, 'rb') as f:
+            return self.put_bytes(f.read())
+
+    def _verify(self, cid, path):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                digest = hashlib.sha256(b"").hexdigest()
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest = hashlib.sha256(mapped).hexdigest()
+        if digest != cid:
+            raise ChecksumMismatchError(f"CID 校验失败: {path} 的摘要为 {digest}")
+        self._verified.add(cid)
+
+    def path(self, cid, verify=True):
+        """返回 CID 对应的文件路径，默认先校验内容摘要。"""
+        if not self.is_cid(cid):
+            raise ValueError(f"无效的 CID: {cid}")
+        path = self._blob_path(cid)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"存储中不存在 CID: {cid}")
+        if verify and cid not in self._verified:
+            self._verify(cid, path)
+        return path
+
+    def open_mmap(self, cid, verify=True):
+        """以只读 mmap 的方式打开一个对象。"""
+        with open(self.path(cid, verify=verify), 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # --- 轮次引用与垃圾回收 ---
+    def tag_round(self, round_number, cids):
+        """记录某一轮引用的所有 CID（全局模型与客户端更新），供垃圾回收判断哪些对象仍然有用。"""
+        with atomic_write(os.path.join(self.refs_dir, f"round_{round_number}.json")) as f:
+            json.dump(sorted(set(cids)), f)
+
+    def _tagged_rounds(self):
+        if not os.path.isdir(self.refs_dir):
+            return {}
+        rounds = {}
+        for name in os.listdir(self.refs_dir):
+            match = re.match(r"^round_(\d+)\.json$", name)
+            if match:
+                rounds[int(match.group(1))] = os.path.join(self.refs_dir, name)
+        return rounds
+
+    def collect_garbage(self, keep_last_rounds, extra_cids=()):
+        """
+        删除只被较早轮次引用的对象：保留最近 keep_last_rounds 轮引用的 CID 与 extra_cids，
+        删除更早轮次的引用记录以及不再被任何保留记录引用的对象。返回删除的对象数量。
+        """
+        rounds = self._tagged_rounds()
+        if len(rounds) <= keep_last_rounds:
+            return 0
+        keep_rounds = sorted(rounds)[-keep_last_rounds:] if keep_last_rounds > 0 else []
+        live = set(extra_cids)
+        for round_number in keep_rounds:
+            with open(rounds[round_number]) as f:
+                live.update(json.load(f))
+        removed = 0
+        for round_number, ref_path in rounds.items():
+            if round_number in keep_rounds:
+                continue
+            with open(ref_path) as f:
+                for cid in json.load(f):
+                    blob_path = self._blob_path(cid)
+                    if cid not in live and os.path.exists(blob_path):
+                        os.remove(blob_path)
+                        self._verified.discard(cid)
+                        removed += 1
+            os.remove(ref_path)
+        return removed
@@ -6,19 +6,21 @@ class ComplexCNN(nn.Module):
     A more complex CNN model for CIFAR-10 or MNIST.
     This is adapted from your Federated-Learning/src/models/model.py
     """
-    def __init__(self, num_classes=10):
+    def __init__(self, num_classes=10, width=1.0):
+        """width 按比例缩放各层的通道数与隐藏单元数（默认 1.0 即原始结构），基准测试用它构造不同大小的模型。"""
         super(ComplexCNN, self).__init__()
-        self.conv1 = nn.Conv2d(3, 64, 5)
+        self.conv2_channels = max(1, int(128 * width))
+        self.conv1 = nn.Conv2d(3, max(1, int(64 * width)), 5)
         self.pool = nn.MaxPool2d(2, 2)
-        self.conv2 = nn.Conv2d(64, 128, 5)
-        self.fc1 = nn.Linear(128 * 5 * 5, 256)
-        self.fc2 = nn.Linear(256, 128)
-        self.fc3 = nn.Linear(128, num_classes)
+        self.conv2 = nn.Conv2d(self.conv1.out_channels, self.conv2_channels, 5)
+        self.fc1 = nn.Linear(self.conv2_channels * 5 * 5, max(1, int(256 * width)))
+        self.fc2 = nn.Linear(self.fc1.out_features, max(1, int(128 * width)))
+        self.fc3 = nn.Linear(self.fc2.out_features, num_classes)
 
     def forward(self, x):
         x = self.pool(F.relu(self.conv1(x)))
         x = self.pool(F.relu(self.conv2(x)))
-        x = x.view(-1, 128 * 5 * 5)
+        x = x.reshape(-1, self.conv2_channels * 5 * 5)  # channels_last 布局下 view 不可用
         x = F.relu(self.fc1(x))
         x = F.relu(self.fc2(x))
         x = self.fc3(x)
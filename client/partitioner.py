@@ -0,0 +1,124 @@
+import os
+
+import numpy as np
+
+from config import PARTITION_SEED, PARTITION_STRATEGY
+from utils.fileio import atomic_write
+
+# --- 客户端数据划分 ---
+# 对给定的 (划分策略, 客户端数, 随机种子, 策略参数) 只计算一次划分，结果以紧凑的
+# “偏移 + 索引”数组保存在 <data>/partitions 下：
+#   file = [num_clients, offsets[0..num_clients], indices[...]]   （int64 的一维 .npy）
+# 客户端 c 的样本索引为 indices[offsets[c]:offsets[c+1]]（升序）。文件以 memmap 打开，
+# 任意客户端查找自己的分片都是 O(1)，不需要读取或重新计算其他客户端的划分。
+PARTITIONS_DIR_NAME = "partitions"
+
+# 划分策略：
+#   "contiguous" —— 按样本位置连续切分（旧版 load_cifar10 的行为）
+#   "iid"        —— 随机打乱后均分
+#   "dirichlet"  —— 每个类别按 Dirichlet(alpha) 分配给各客户端，alpha 越小标签越倾斜
+#   "shard"      —— 按标签排序后切成 num_clients * shards_per_client 个分片，每个客户端随机分到若干片
+PARTITION_STRATEGIES = ("contiguous", "iid", "dirichlet", "shard")
+DEFAULT_DIRICHLET_ALPHA = 0.5
+DEFAULT_SHARDS_PER_CLIENT = 2
+
+
+def _pack(client_indices):
+    """把每个客户端的索引列表打包为 (offsets, indices)。"""
+    sizes = np.array([len(idx) for idx in client_indices], dtype=np.int64)
+    offsets = np.zeros(len(client_indices) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    indices = np.concatenate([np.sort(idx) for idx in client_indices]).astype(np.int64)
+    return offsets, indices
+
+
+def _contiguous(num_samples, num_clients, rng):
+    per_client = num_samples // num_clients
+    return [np.arange(c * per_client, (c + 1) * per_client) for c in range(num_clients)]
+
+
+def _iid(num_samples, num_clients, rng):
+    per_client = num_samples // num_clients
+    order = rng.permutation(num_samples)
+    return [order[c * per_client:(c + 1) * per_client] for c in range(num_clients)]
+
+
+def _dirichlet(labels, num_clients, rng, alpha=DEFAULT_DIRICHLET_ALPHA):
+    client_indices = [[] for _ in range(num_clients)]
+    for label in np.unique(labels):
+        members = rng.permutation(np.flatnonzero(labels == label))
+        proportions = rng.dirichlet(np.full(num_clients, alpha))
+        cuts = (np.cumsum(proportions)[:-1] * len(members)).astype(np.int64)
+        for client_id, part in enumerate(np.split(members, cuts)):
+            client_indices[client_id].append(part)
+    return [np.concatenate(parts) for parts in client_indices]
+
+
+def _shard(labels, num_clients, rng, shards_per_client=DEFAULT_SHARDS_PER_CLIENT):
+    num_shards = num_clients * shards_per_client
+    if num_shards > len(labels):
+        raise ValueError(f"分片数 {num_shards} 超过了样本数 {len(labels)}。")
+    # 稳定排序保证同一标签内的顺序确定，结果只取决于种子
+    shards = np.array_split(np.argsort(labels, kind="stable"), num_shards)
+    assignment = rng.permutation(num_shards).reshape(num_clients, shards_per_client)
+    return [np.concatenate([shards[s] for s in row]) for row in assignment]
+
+
+def compute_partition(labels, num_clients, strategy=PARTITION_STRATEGY, seed=PARTITION_SEED, **options):
+    """计算一次划分，返回 (offsets, indices)。"""
+    if strategy not in PARTITION_STRATEGIES:
+        raise ValueError(f"未知的划分策略: {strategy}（可选: {', '.join(PARTITION_STRATEGIES)}）")
+    if num_clients < 1:
+        raise ValueError("num_clients 必须为正数。")
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    if strategy == "contiguous":
+        client_indices = _contiguous(len(labels), num_clients, rng)
+    elif strategy == "iid":
+        client_indices = _iid(len(labels), num_clients, rng)
+    elif strategy == "dirichlet":
+        client_indices = _dirichlet(labels, num_clients, rng, **options)
+    else:
+        client_indices = _shard(labels, num_clients, rng, **options)
+    return _pack(client_indices)
+
+
+def partition_path(data_path, split, num_clients, strategy, seed, **options):
+    option_suffix = "".join(f"_{key}{value}" for key, value in sorted(options.items()))
+    name = f"{split}_{strategy}_n{num_clients}_s{seed}{option_suffix}.npy"
+    return os.path.join(data_path, PARTITIONS_DIR_NAME, name)
+
+
+def build_partition(path, labels, num_clients, strategy=PARTITION_STRATEGY, seed=PARTITION_SEED, **options):
+    """计算划分并写入 path（已存在时直接返回）。多个进程同时构建时以原子重命名保证读者看到完整文件。"""
+    if os.path.exists(path):
+        return path
+    offsets, indices = compute_partition(labels, num_clients, strategy, seed, **options)
+    packed = np.concatenate([np.array([num_clients], dtype=np.int64), offsets, indices])
+    with atomic_write(path, 'wb') as f:
+        np.save(f, packed)
+    return path
+
+
+class PartitionIndex:
+    """以 memmap 打开的划分文件；client_indices(c) 返回客户端 c 的索引视图。"""
+    def __init__(self, path):
+        self.path = path
+        self._packed = np.load(path, mmap_mode='r')
+        self.num_clients = int(self._packed[0])
+        self._offsets = self._packed[1:self.num_clients + 2]
+        self._indices = self._packed[self.num_clients + 2:]
+
+    def client_indices(self, client_id):
+        if not 0 <= client_id < self.num_clients:
+            raise IndexError(f"客户端编号 {client_id} 超出范围 [0, {self.num_clients})。")
+        return self._indices[self._offsets[client_id]:self._offsets[client_id + 1]]
+
+    def client_size(self, client_id):
+        return int(self._offsets[client_id + 1] - self._offsets[client_id])
+
+
+def load_partition(data_path, split, labels, num_clients, strategy=PARTITION_STRATEGY, seed=PARTITION_SEED, **options):
+    """返回给定参数对应的 PartitionIndex，首次使用时计算并缓存划分文件。"""
+    path = partition_path(data_path, split, num_clients, strategy, seed, **options)
+    return PartitionIndex(build_partition(path, labels, num_clients, strategy, seed, **options))
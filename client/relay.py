@@ -0,0 +1,108 @@
+import json
+import os
+
+from eth_abi import encode_abi
+from eth_account import Account
+from eth_account.messages import SignableMessage
+from web3 import Web3
+
+from model_store import cid_to_bytes32
+from utils.fileio import atomic_write
+
+# --- 由聚合者转发的签名更新 ---
+# 客户端不再各自发送 submitUpdate 交易，而是对更新做 EIP-712 签名，并把签名消息放进共享的转发收件箱
+# （与内容寻址存储一样，是本地文件系统上的 IPFS 替身）：RELAY_DIR/round_<n>/<address>.json。
+# 聚合者校验签名后，用 submitBatchAndFinalize 在一笔交易中记录整批更新并结束本轮。
+# 限制：收件箱只是本机目录，客户端与聚合者必须运行在同一台主机上（或共享同一个文件系统），
+# 这与 ModelStore 相同；跨主机部署时需要把两者一起换成真正的网络传输（IPFS、HTTP 等）。
+RELAY_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'saved_models', 'relay'))
+
+# EIP-712 域与消息类型，需与 FederatedLearning.sol 中的 EIP712("FederatedLearning", "1")
+# 及 UPDATE_SUBMISSION_TYPEHASH 保持一致
+EIP712_NAME = "FederatedLearning"
+EIP712_VERSION = "1"
+EIP712_DOMAIN_TYPE = "EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"
+UPDATE_SUBMISSION_TYPE = "UpdateSubmission(uint256 round,bytes32 modelCID,uint256 baseRound)"
+
+
+def domain_separator(chain_id, contract_address):
+    return Web3.keccak(encode_abi(
+        ["bytes32", "bytes32", "bytes32", "uint256", "address"],
+        [Web3.keccak(text=EIP712_DOMAIN_TYPE), Web3.keccak(text=EIP712_NAME), Web3.keccak(text=EIP712_VERSION),
+         chain_id, Web3.toChecksumAddress(contract_address)],
+    ))
+
+
+def _update_message(domain, round_number, model_cid, base_round):
+    struct_hash = Web3.keccak(encode_abi(
+        ["bytes32", "uint256", "bytes32", "uint256"],
+        [Web3.keccak(text=UPDATE_SUBMISSION_TYPE), round_number, cid_to_bytes32(model_cid), base_round],
+    ))
+    return SignableMessage(b"\x01", bytes(domain), bytes(struct_hash))
+
+
+def sign_update(private_key, domain, round_number, model_cid, base_round):
+    """对“第 round_number 轮提交基于 base_round 训练的 model_cid”做 EIP-712 签名，返回签名字节。"""
+    return bytes(Account.sign_message(_update_message(domain, round_number, model_cid, base_round), private_key).signature)
+
+
+def recover_signer(domain, round_number, model_cid, base_round, signature):
+    return Account.recover_message(_update_message(domain, round_number, model_cid, base_round), signature=signature)
+
+
+def _round_dir(round_number, relay_dir=None):
+    return os.path.join(relay_dir or RELAY_DIR, f"round_{round_number}")
+
+
+def post_signed_update(round_number, client_address, model_cid, base_round, signature, relay_dir=None):
+    """把签名更新原子地放进第 round_number 轮的收件箱（同一客户端重复投递时覆盖旧的）。"""
+    path = os.path.join(_round_dir(round_number, relay_dir), f"{Web3.toChecksumAddress(client_address)}.json")
+    with atomic_write(path) as f:
+        json.dump({
+            "round": round_number, "client": Web3.toChecksumAddress(client_address), "model_cid": model_cid,
+            "base_round": base_round, "signature": "0x" + bytes(signature).hex(),
+        }, f)
+    return path
+
+
+def has_signed_update(round_number, client_address, relay_dir=None):
+    """客户端是否已在第 round_number 轮投递过签名更新（续跑时用来跳过已完成的客户端）。"""
+    return os.path.exists(os.path.join(_round_dir(round_number, relay_dir), f"{Web3.toChecksumAddress(client_address)}.json"))
+
+
+def read_signed_updates(round_number, relay_dir=None):
+    """读取第 round_number 轮收件箱中的全部签名更新：[(client_address, model_cid, base_round, signature), ...]。"""
+    round_dir = _round_dir(round_number, relay_dir)
+    try:
+        names = sorted(name for name in os.listdir(round_dir) if name.endswith(".json"))
+    except FileNotFoundError:
+        return []
+    updates = []
+    for name in names:
+        with open(os.path.join(round_dir, name), 'r') as f:
+            message = json.load(f)
+        updates.append((
+            message["client"], message["model_cid"], message["base_round"], bytes.fromhex(message["signature"][2:]),
+        ))
+    return updates
+
+
+def withdraw_signed_update(round_number, client_address, relay_dir=None):
+    """撤回客户端在第 round_number 轮投递、但没有被转发的签名更新（该轮已经结束）。"""
+    round_dir = _round_dir(round_number, relay_dir)
+    try:
+        os.remove(os.path.join(round_dir, f"{Web3.toChecksumAddress(client_address)}.json"))
+        os.rmdir(round_dir)
+    except OSError:
+        # 文件已随该轮一起清空，或收件箱中还有其他客户端的文件
+        pass
+
+
+def discard_round(round_number, relay_dir=None):
+    """本轮结束后清空它的收件箱。"""
+    round_dir = _round_dir(round_number, relay_dir)
+    if not os.path.isdir(round_dir):
+        return
+    for name in os.listdir(round_dir):
+        os.remove(os.path.join(round_dir, name))
+    os.rmdir(round_dir)
@@ -0,0 +1,105 @@
+import json
+import os
+
+from eth_abi import encode_abi
+from web3 import Web3
+
+from utils.fileio import atomic_write
+
+# --- 可按需领取的轮次奖励 ---
+# 合约的 finalizeRound 不再逐个客户端铸币，只保存本轮奖励分配表的 Merkle 根；
+# 聚合者把分配表与每个叶子的证明写入 REWARDS_DIR/round_<n>.json，客户端读取后调用 claimReward 领取。
+# 叶子与相邻节点的哈希方式与 OpenZeppelin 的 MerkleProof（StandardMerkleTree）一致：
+#   leaf = keccak256(keccak256(abi.encode(round, account, amount)))
+#   parent = keccak256(min(a, b) ++ max(a, b))
+REWARDS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs', 'rewards'))
+# 每轮奖励总额，需与合约中的 ROUND_REWARD 保持一致
+ROUND_REWARD = 100 * 10**18
+
+
+def reward_leaf(round_number, account, amount):
+    encoded = encode_abi(["uint256", "address", "uint256"], [round_number, Web3.toChecksumAddress(account), amount])
+    return bytes(Web3.keccak(Web3.keccak(encoded)))
+
+
+def _hash_pair(a, b):
+    return bytes(Web3.keccak(a + b if a < b else b + a))
+
+
+def allocate_rewards(accounts, total=ROUND_REWARD):
+    """把一轮的奖励平分给本轮的贡献者（与旧版合约中 totalReward / updates.length 的规则相同）。"""
+    if not accounts:
+        return {}
+    share = total // len(accounts)
+    return {Web3.toChecksumAddress(account): share for account in accounts}
+
+
+class RewardTree:
+    """一轮奖励分配表的 Merkle 树；叶子顺序即 allocations 的插入顺序。"""
+    def __init__(self, round_number, allocations):
+        self.round_number = round_number
+        self.allocations = dict(allocations)
+        self.accounts = list(self.allocations)
+        self._positions = {account: i for i, account in enumerate(self.accounts)}
+        level = [reward_leaf(round_number, account, amount) for account, amount in self.allocations.items()]
+        self.levels = [level]
+        while len(level) > 1:
+            # 奇数个节点时最后一个直接升到上一层，证明在该层不需要兄弟节点
+            level = [_hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                     for i in range(0, len(level), 2)]
+            self.levels.append(level)
+
+    @property
+    def root(self):
+        return self.levels[-1][0] if self.levels[0] else bytes(32)
+
+    def proof(self, account):
+        index = self._positions[Web3.toChecksumAddress(account)]
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                proof.append(level[sibling])
+            index //= 2
+        return proof
+
+
+def verify_proof(proof, root, leaf):
+    node = leaf
+    for sibling in proof:
+        node = _hash_pair(node, sibling)
+    return node == root
+
+
+def manifest_path(round_number, rewards_dir=None):
+    return os.path.join(rewards_dir or REWARDS_DIR, f"round_{round_number}.json")
+
+
+def write_manifest(tree, rewards_dir=None):
+    """把一轮的分配表与证明原子地写入清单文件，返回文件路径。"""
+    path = manifest_path(tree.round_number, rewards_dir)
+    manifest = {
+        "round": tree.round_number,
+        "root": "0x" + tree.root.hex(),
+        "claims": {
+            account: {"amount": str(amount), "proof": ["0x" + node.hex() for node in tree.proof(account)]}
+            for account, amount in tree.allocations.items()
+        },
+    }
+    with atomic_write(path) as f:
+        json.dump(manifest, f)
+    return path
+
+
+def load_claim(round_number, account, rewards_dir=None):
+    """读取某个地址在某一轮的 (amount, proof, root)；清单不存在或其中没有该地址时返回 None。"""
+    try:
+        with open(manifest_path(round_number, rewards_dir), 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    claim = manifest["claims"].get(Web3.toChecksumAddress(account))
+    if claim is None:
+        return None
+    proof = [bytes.fromhex(node[2:]) for node in claim["proof"]]
+    return int(claim["amount"]), proof, bytes.fromhex(manifest["root"][2:])
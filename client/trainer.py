@@ -1,51 +1,110 @@
+import contextlib
+import time
+
 import torch
-from torch.utils.data import DataLoader
 import torch.optim as optim
 import torch.nn as nn
+from data_loader import make_data_loader
+from utils.metrics import get_recorder
+
+# 面向 CPU 吞吐的训练配置，可整体传给 Trainer（client.py 中 TRAINING_MODE = "performance" 时使用）。
+# bf16 autocast 只在支持 AVX512-BF16 / AMX 的 CPU 上更快，torch.compile 首次编译耗时较长，二者默认不开启。
+PERFORMANCE_OPTIONS = {
+    "num_workers": 1,
+    "persistent_workers": True,
+    "channels_last": True,
+    "use_bf16": False,
+    "compile_model": False,
+    "grad_accum_steps": 1,
+    "log_interval": 100,
+}
+
 
 class Trainer:
-    def __init__(self, model, train_dataset, test_dataset, device, learning_rate=0.001, batch_size=64):
-        self.model = model.to(device)
+    """
+    本地训练器。除学习率和批大小外的参数都是性能选项：
+      num_workers / persistent_workers —— 数据加载的后台工作者数量，以及是否在 epoch 之间保留它们；
+      use_bf16 —— 前向与损失计算使用 bf16 autocast；
+      channels_last —— 模型与输入使用 NHWC 内存布局；
+      compile_model —— 用 torch.compile 编译前向（state_dict 仍来自原模型，键名不变）；
+      grad_accum_steps —— 每累积多少个小批次的梯度更新一次参数；
+      log_interval —— 每多少个小批次打印一次损失，也是唯一的主机同步点。
+    """
+    def __init__(self, model, train_dataset, test_dataset, device, learning_rate=0.001, batch_size=64,
+                 num_workers=0, persistent_workers=False, use_bf16=False, channels_last=False,
+                 compile_model=False, grad_accum_steps=1, log_interval=100):
         self.device = device
-        self.train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-        self.test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
+        self.memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        self.model = model.to(device, memory_format=self.memory_format)
+        loader_options = {"num_workers": num_workers, "persistent_workers": persistent_workers}
+        self.train_loader = make_data_loader(train_dataset, batch_size=batch_size, shuffle=True, **loader_options)
+        self.test_loader = make_data_loader(test_dataset, batch_size=batch_size, shuffle=False, **loader_options)
         self.optimizer = optim.Adam(self.model.parameters(), lr=learning_rate)
         self.criterion = nn.CrossEntropyLoss()
+        self.use_bf16 = use_bf16
+        self.grad_accum_steps = max(1, grad_accum_steps)
+        self.log_interval = log_interval
+        self.forward = torch.compile(self.model) if compile_model else self.model
+
+    def _autocast(self):
+        if not self.use_bf16:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16)
+
+    def _to_device(self, inputs, labels):
+        inputs = inputs.to(self.device, non_blocking=True).contiguous(memory_format=self.memory_format)
+        return inputs, labels.to(self.device, non_blocking=True)
 
     def train(self, epochs):
+        """训练 epochs 轮，返回 {'samples', 'seconds', 'samples_per_sec', 'loss'}（loss 为最后一个 epoch 的平均损失）。"""
         self.model.train()
+        num_samples = 0
+        start_time = time.perf_counter()
+        epoch_loss = 0.0
         for epoch in range(epochs):
-            running_loss = 0.0
+            # 损失在设备上累加，只在打印日志和 epoch 结束时同步
+            running_loss = torch.zeros((), device=self.device)
+            total_loss = torch.zeros((), device=self.device)
+            num_batches = len(self.train_loader)
+            self.optimizer.zero_grad(set_to_none=True)
             for i, data in enumerate(self.train_loader, 0):
-                inputs, labels = data
-                inputs, labels = inputs.to(self.device), labels.to(self.device)
-
-                self.optimizer.zero_grad()
+                inputs, labels = self._to_device(*data)
 
-                outputs = self.model(inputs)
-                loss = self.criterion(outputs, labels)
-                loss.backward()
-                self.optimizer.step()
+                with self._autocast():
+                    outputs = self.forward(inputs)
+                    loss = self.criterion(outputs, labels)
+                (loss / self.grad_accum_steps).backward()
+                if (i + 1) % self.grad_accum_steps == 0 or i + 1 == num_batches:
+                    self.optimizer.step()
+                    self.optimizer.zero_grad(set_to_none=True)
 
-                running_loss += loss.item()
-                if i % 100 == 99:  # Print every 100 mini-batches
-                    print(f'[Epoch {epoch + 1}, Batch {i + 1}] loss: {running_loss / 100:.3f}')
-                    running_loss = 0.0
-        print('Finished Training')
+                running_loss += loss.detach()
+                total_loss += loss.detach()
+                num_samples += labels.size(0)
+                if i % self.log_interval == self.log_interval - 1:
+                    print(f'[Epoch {epoch + 1}, Batch {i + 1}] loss: {running_loss.item() / self.log_interval:.3f}')
+                    running_loss.zero_()
+            epoch_loss = total_loss.item() / max(1, num_batches)
+            get_recorder().gauge("train_loss", epoch_loss, epoch=epoch + 1)
+        elapsed = time.perf_counter() - start_time
+        samples_per_sec = num_samples / elapsed if elapsed > 0 else 0.0
+        get_recorder().gauge("samples_per_sec", samples_per_sec)
+        get_recorder().count("train_samples", num_samples)
+        print(f'Finished Training: {num_samples} samples in {elapsed:.1f}s ({samples_per_sec:.1f} samples/sec)')
+        return {"samples": num_samples, "seconds": elapsed, "samples_per_sec": samples_per_sec, "loss": epoch_loss}
 
     def evaluate(self):
         self.model.eval()
-        correct = 0
+        correct = torch.zeros((), dtype=torch.int64, device=self.device)
         total = 0
-        with torch.no_grad():
+        with torch.no_grad(), self._autocast():
             for data in self.test_loader:
-                images, labels = data
-                images, labels = images.to(self.device), labels.to(self.device)
-                outputs = self.model(images)
+                images, labels = self._to_device(*data)
+                outputs = self.forward(images)
                 _, predicted = torch.max(outputs.data, 1)
                 total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-        accuracy = 100 * correct / total
+                correct += (predicted == labels).sum()
+        accuracy = 100 * correct.item() / total
         print(f'Accuracy of the network on the test images: {accuracy:.2f} %')
         return accuracy
 
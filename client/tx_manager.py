@@ -0,0 +1,161 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from utils.metrics import get_recorder
+
+# --- 交易发送参数 ---
+# gas 估算值的安全系数
+GAS_ESTIMATE_MARGIN = 1.2
+# 估算失败时（例如依赖的前一笔交易尚未上链）使用的 gas 上限
+DEFAULT_GAS_LIMIT = 2000000
+# 单次等待回执的超时时间（秒），超时后用更高的 gas 价格替换同一 nonce 的交易
+RECEIPT_TIMEOUT = 120
+# 轮询回执的间隔（秒）
+RECEIPT_POLL_INTERVAL = 0.1
+# gas 价格的缓存时间（秒）：大致一个出块间隔，期间连续发送的交易共用同一个价格，不必每笔都查询节点
+GAS_PRICE_TTL = 2.0
+# 替换交易时 gas 价格的提升比例（节点通常要求至少提高 10%）
+GAS_PRICE_BUMP = 1.125
+MAX_REPLACEMENTS = 3
+
+
+class TransactionFailedError(RuntimeError):
+    """交易已上链但执行失败（回执 status 为 0）。"""
+
+
+class TransactionManager:
+    """
+    单个账户的交易发送器，供客户端和聚合器共用：
+    - 在本地维护 nonce，多笔交易可以连续广播，无需等待上一笔确认；
+    - gas 价格缓存 GAS_PRICE_TTL 秒，过期后重新查询；
+    - gas 上限按函数签名估算一次并缓存；
+    - 回执在后台线程中确认，send() 立即返回 Future；
+    - 广播失败导致 nonce 出现空洞时从链上重新同步，回执超时则以更高的 gas 价格替换同一 nonce 的交易。
+    """
+    def __init__(self, w3, account, max_pending=8):
+        self.w3 = w3
+        self.account = account
+        self._lock = threading.Lock()
+        self._next_nonce = None
+        self._gas_estimates = {}
+        self._gas_price = None
+        self._gas_price_time = None
+        self._executor = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix="tx-receipt")
+
+    # --- nonce / 费用 / gas ---
+    def _reserve_nonce(self):
+        if self._next_nonce is None:
+            self._resync_nonce()
+        nonce = self._next_nonce
+        self._next_nonce += 1
+        return nonce
+
+    def _resync_nonce(self):
+        self._next_nonce = self.w3.eth.get_transaction_count(self.account.address, 'pending')
+
+    def _current_gas_price(self):
+        now = time.monotonic()
+        if self._gas_price is None or now - self._gas_price_time >= GAS_PRICE_TTL:
+            self._gas_price = self.w3.eth.gas_price
+            self._gas_price_time = now
+        return self._gas_price
+
+    @staticmethod
+    def _signature(func_call):
+        input_types = ",".join(item['type'] for item in func_call.abi.get('inputs', []))
+        return f"{func_call.fn_name}({input_types})"
+
+    def _gas_limit(self, func_call, cache_estimate=True):
+        if not cache_estimate:
+            try:
+                return int(func_call.estimate_gas({'from': self.account.address}) * GAS_ESTIMATE_MARGIN)
+            except Exception:
+                return DEFAULT_GAS_LIMIT
+        signature = self._signature(func_call)
+        if signature not in self._gas_estimates:
+            try:
+                estimate = func_call.estimate_gas({'from': self.account.address})
+            except Exception:
+                return DEFAULT_GAS_LIMIT
+            self._gas_estimates[signature] = int(estimate * GAS_ESTIMATE_MARGIN)
+        return self._gas_estimates[signature]
+
+    # --- 发送与确认 ---
+    def _sign_and_broadcast(self, func_call, nonce, gas, gas_price):
+        tx = func_call.build_transaction({
+            'from': self.account.address,
+            'nonce': nonce,
+            'gas': gas,
+            'gasPrice': gas_price,
+        })
+        signed_tx = self.w3.eth.account.sign_transaction(tx, private_key=self.account.key)
+        return self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+
+    def send(self, func_call, cache_gas_estimate=True):
+        """
+        签名并立即广播一笔交易，返回在回执确认后完成的 Future（结果为交易回执）。
+        gas 随参数规模变化的调用（如批量提交）应传 cache_gas_estimate=False，每次单独估算。
+        """
+        with self._lock:
+            gas = self._gas_limit(func_call, cache_gas_estimate)
+            gas_price = self._current_gas_price()
+            nonce = self._reserve_nonce()
+            try:
+                tx_hash = self._sign_and_broadcast(func_call, nonce, gas, gas_price)
+            except ValueError as e:
+                # nonce 过低（其他进程用同一账户发过交易）时重新同步后重试一次；
+                # 其余错误说明该 nonce 没有被占用，重新同步以免后续交易卡在空洞之后
+                self._resync_nonce()
+                if "nonce" not in str(e).lower():
+                    raise
+                nonce = self._reserve_nonce()
+                tx_hash = self._sign_and_broadcast(func_call, nonce, gas, gas_price)
+        return self._executor.submit(self._confirm, func_call, nonce, gas, gas_price, tx_hash)
+
+    def _wait_for_any_receipt(self, tx_hashes, timeout):
+        """轮询同一 nonce 下已广播的全部交易，返回最先上链的那一笔的回执。"""
+        deadline = time.monotonic() + timeout
+        while True:
+            for tx_hash in tx_hashes:
+                try:
+                    receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+                except TransactionNotFound:
+                    receipt = None
+                if receipt is not None:
+                    return receipt
+            if time.monotonic() >= deadline:
+                raise TimeExhausted(f"nonce 相同的交易 {[tx_hash.hex() for tx_hash in tx_hashes]} 在 {timeout} 秒内均未上链")
+            time.sleep(RECEIPT_POLL_INTERVAL)
+
+    def _confirm(self, func_call, nonce, gas, gas_price, tx_hash):
+        # 替换交易广播后，被替换的交易仍可能先被打包，因此每次都等待该 nonce 下发出过的所有交易
+        tx_hashes = [tx_hash]
+        for attempt in range(MAX_REPLACEMENTS + 1):
+            try:
+                receipt = self._wait_for_any_receipt(tx_hashes, RECEIPT_TIMEOUT)
+                break
+            except TimeExhausted:
+                if attempt == MAX_REPLACEMENTS:
+                    raise
+                gas_price = int(gas_price * GAS_PRICE_BUMP)
+                print(f"  - ⏳ 交易 {tx_hashes[-1].hex()} 确认超时，以 gas 价格 {gas_price} 替换 nonce {nonce} 的交易...")
+                try:
+                    with self._lock:
+                        tx_hashes.append(self._sign_and_broadcast(func_call, nonce, gas, gas_price))
+                except ValueError as e:
+                    # 较早的交易恰好在此时上链，节点会以 nonce 过低拒绝替换交易；继续等待已发出的交易即可
+                    print(f"  - 替换交易被节点拒绝（{e}），继续等待已发出的交易。")
+        get_recorder().count("gas_used", receipt.gasUsed, function=func_call.fn_name)
+        with self._lock:
+            if receipt.status == 0:
+                # 可能是缓存的 gas 估算值不再够用，下次重新估算
+                self._gas_estimates.pop(self._signature(func_call), None)
+        if receipt.status == 0:
+            raise TransactionFailedError(f"交易 {receipt.transactionHash.hex()} 执行失败（{self._signature(func_call)}）")
+        return receipt
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -1,56 +1,122 @@
 import streamlit as st
 import pandas as pd
 import os
+import sys
 import time
 import json
-from web3 import Web3
+import glob
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'client')))
+from chain_reader import make_session
+from client import SUBMISSION_MODE
+from relay import read_signed_updates
+from utils.chain_indexer import ChainIndexer, default_index_path
+from utils.metrics import METRICS_DIR
+from utils.status_channel import StatusLogReader
 
 # --- 文件路径和常量 ---
 STATUS_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'status.json'))
+STATUS_LOG_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'status_log.txt'))
 HISTORY_LOG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'logs', 'history.csv'))
 PLOT_SAVE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'plots', 'accuracy_vs_rounds.png'))
 ENV_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '.env'))
 ABI_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'blockchain', 'artifacts', 'contracts', 'FederatedLearning.sol', 'FederatedLearning.json'))
 FINAL_STATE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'final_blockchain_state.json'))
+RPC_URL = "http://127.0.0.1:8545"
+# 所有刷新共用一个带连接池的 HTTP 会话
+RPC_SESSION = make_session()
+# 交易历史面板每次展示的交易数
+HISTORY_PAGE_SIZE = 50
 
 # --- 页面配置 ---
 st.set_page_config(page_title="联邦学习实时仪表盘", page_icon="🛰️", layout="wide")
 
 # --- 辅助函数 ---
+@st.cache_resource
+def get_chain_indexer(contract_address):
+    """每个合约地址在本进程中只创建一个索引器，并在后台线程中持续跟随新区块。"""
+    with open(ABI_PATH, 'r') as f: abi = json.load(f)['abi']
+    indexer = ChainIndexer(default_index_path(contract_address), RPC_URL, contract_address, abi, RPC_SESSION)
+    return indexer.start()
+
+def count_round_updates(bc_data, is_final_state):
+    """
+    本轮已收到的更新数。转发模式下签名更新在本轮结束前只存在于聚合者的收件箱中，
+    链上的计数一直为 0，因此加上收件箱中本轮的签名更新数（尚未校验签名，仅用于展示进度）。
+    """
+    updates_received = bc_data['updates_received']
+    if SUBMISSION_MODE == "relay" and not is_final_state:
+        updates_received += len(read_signed_updates(bc_data['onchain_round']))
+    return updates_received
+
 def get_full_blockchain_data():
+    """从本地索引读取链上状态与最近的交易；节点不可达时返回 None。"""
     try:
         if not os.path.exists(ENV_FILE): return None
         with open(ENV_FILE, 'r') as f: contract_address = f.readline().split('=')[1].strip()
-        w3 = Web3(Web3.HTTPProvider("http://127.0.0.1:8545"))
-        if not w3.isConnected(): return None
-        with open(ABI_PATH, 'r') as f: abi = json.load(f)['abi']
-        contract = w3.eth.contract(address=contract_address, abi=abi)
-        latest_block_number = w3.eth.block_number
-        current_round = contract.functions.currentRound().call()
-        state_data = {
-            "contract_address": contract.address, "block_number": latest_block_number,
-            "onchain_round": current_round,
-            "updates_received": contract.functions.getRoundUpdatesCount(current_round).call(),
-            "updates_needed": contract.functions.updatesNeeded().call(),
-        }
-        history = []
-        scan_depth = min(latest_block_number, 50)
-        for i in range(scan_depth):
-            block = w3.eth.get_block(latest_block_number - i, full_transactions=True)
-            for tx in block.transactions:
-                if tx['to'] and tx['to'].lower() == contract.address.lower():
-                    try:
-                        func_obj, func_params = contract.decode_function_input(tx.input)
-                        params_str = ", ".join(f"{k}: {str(v)[:30]}..." if len(str(v)) > 30 else f"{k}: {v}" for k, v in func_params.items())
-                        history.append({
-                            "block": tx.blockNumber, "hash": tx.hash.hex(),
-                            "from": tx['from'], "func": func_obj.fn_name, "params": params_str
-                        })
-                    except ValueError: pass
-        state_data['history'] = history
-        return state_data
+        indexer = get_chain_indexer(contract_address)
+        if not indexer.is_live: return None
+        return indexer.snapshot(history_limit=HISTORY_PAGE_SIZE)
     except Exception: return None
 
+def load_metrics():
+    """读取各进程写出的 logs/metrics/*.jsonl，合并为一个 DataFrame；还没有指标时返回 None。"""
+    frames = []
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.jsonl')):
+        try:
+            frames.append(pd.read_json(path, lines=True))
+        except ValueError:
+            # 进程正在写入最后一行时可能读到不完整的 JSON，下次刷新再读
+            continue
+    frames = [frame for frame in frames if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+def round_time_breakdown(df):
+    """
+    每轮各阶段的耗时（秒），行为轮次、列为 "进程·阶段"。
+    客户端阶段取本轮最慢的客户端（同步调度下由它决定本轮的节奏），聚合器阶段按轮求和。
+    """
+    spans = df[(df['type'] == 'span') & df['round'].notna()]
+    parts = {}
+    clients = spans[spans['component'] == 'client']
+    if not clients.empty:
+        parts['客户端'] = clients.groupby(['round', 'name', 'client'])['value'].sum().groupby(['round', 'name']).max()
+    aggregator = spans[spans['component'] == 'aggregator']
+    if not aggregator.empty:
+        parts['聚合器'] = aggregator.groupby(['round', 'name'])['value'].sum()
+    if not parts:
+        return None
+    breakdown = pd.concat(parts).unstack(level=[0, 2])
+    breakdown.columns = [f"{component}·{stage}" for component, stage in breakdown.columns]
+    breakdown.index = breakdown.index.astype(int)
+    return breakdown.fillna(0.0)
+
+def render_metrics_panel(df):
+    if df is None or 'round' not in df.columns:
+        st.info("运行指标将在第一轮训练完成后出现（logs/metrics/）。")
+        return
+    breakdown = round_time_breakdown(df)
+    if breakdown is not None:
+        st.markdown("**每轮耗时分解（秒）:**")
+        st.bar_chart(breakdown, use_container_width=True)
+    server_spans = df[(df['type'] == 'span') & (df['component'] == 'server') & df['round'].notna()]
+    if not server_spans.empty:
+        server_table = server_spans.pivot_table(index='round', columns='name', values='value', aggfunc='sum')
+        server_table.index = server_table.index.astype(int)
+        st.markdown("**服务器视角的每轮耗时（秒）:**")
+        st.dataframe(server_table, use_container_width=True)
+    losses = df[(df['type'] == 'gauge') & (df['name'] == 'train_loss')]
+    if not losses.empty:
+        st.markdown("**各客户端训练损失:**")
+        loss_table = losses.pivot_table(index='round', columns='client', values='value', aggfunc='last')
+        loss_table.columns = [f"客户端 {int(client)}" for client in loss_table.columns]
+        st.line_chart(loss_table, use_container_width=True)
+    counters = df[df['type'] == 'counter']
+    if not counters.empty:
+        st.markdown("**累计计数（模型读写字节、RPC 调用、gas、训练样本）:**")
+        st.dataframe(counters.pivot_table(index='component', columns='name', values='value', aggfunc='sum'),
+                     use_container_width=True)
+
 def load_final_state():
     if os.path.exists(FINAL_STATE_FILE):
         with open(FINAL_STATE_FILE, 'r') as f:
@@ -61,6 +127,8 @@ def load_final_state():
 def main():
     st.title("🛰️ 联邦学习与区块链实时监控仪表盘")
     placeholder = st.empty()
+    # 日志按偏移增量读取，每次刷新只读新追加的部分
+    log_reader = StatusLogReader(STATUS_LOG_FILE)
     while True:
         with placeholder.container():
             col_fl, col_bc, col_results = st.columns([2, 1.5, 2.5])
@@ -75,7 +143,7 @@ def main():
                     st.info(f"**当前步骤:** {status_data.get('current_step', '等待中...')}")
                     st.markdown("**实时日志输出:**")
                     log_box = st.container(height=250, border=True)
-                    for line in status_data.get('log_output', []): log_box.code(line, language=None)
+                    for line in log_reader.read(status_data.get('log_offset', 0)): log_box.code(line, language=None)
                 else:
                     st.warning("⚠️ 找不到状态文件 (status.json)。请先运行 `server.py`。")
             
@@ -103,7 +171,8 @@ def main():
                     metric_col2.metric("链上轮次", bc_data['onchain_round'])
                     # --- 修改结束 ---
 
-                    st.progress(bc_data['updates_received'] / bc_data['updates_needed'], text=f"本轮更新进度: {bc_data['updates_received']} / {bc_data['updates_needed']}")
+                    updates_received = count_round_updates(bc_data, is_final_state)
+                    st.progress(min(1.0, updates_received / bc_data['updates_needed']), text=f"本轮更新进度: {updates_received} / {bc_data['updates_needed']}")
                     st.markdown("**合约地址:**")
                     st.code(bc_data['contract_address'], language=None)
 
@@ -121,15 +190,21 @@ def main():
             
             with col_results:
                 st.subheader("📈 结果分析")
-                if os.path.exists(PLOT_SAVE_PATH):
+                df = pd.read_csv(HISTORY_LOG_PATH) if os.path.exists(HISTORY_LOG_PATH) else None
+                if df is not None and not df.empty:
+                    # 直接用 history.csv 原生绘图，不依赖聚合器渲染的 PNG
+                    st.line_chart(df.set_index('Round')['Accuracy'], use_container_width=True)
+                elif os.path.exists(PLOT_SAVE_PATH):
                     st.image(PLOT_SAVE_PATH, use_column_width=True)
                 else:
-                    st.info("准确率图表将在实验结束后生成。")
-                if os.path.exists(HISTORY_LOG_PATH):
+                    st.info("准确率图表将在第一轮评估完成后生成。")
+                if df is not None:
                     st.markdown("**历史数据详情:**")
-                    df = pd.read_csv(HISTORY_LOG_PATH)
                     st.dataframe(df, use_container_width=True)
 
+            with st.expander("⏱️ **运行指标：每轮时间都花在了哪里**", expanded=True):
+                render_metrics_panel(load_metrics())
+
         time.sleep(3)
 
 if __name__ == "__main__":
@@ -1,56 +1,390 @@
+import argparse
 import subprocess
 import sys
 import os
 import json
 import time
+import threading
+import queue
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from web3 import Web3
 
+# 与客户端、聚合器共用 client/config.py 中的节点地址、ABI 路径与控制信号前缀
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'client')))
+from config import ABI_PATH, RPC_URL, WORKER_SIGNAL_PREFIX
+from utils import metrics
+from utils.chain_indexer import ChainIndexer, default_index_path
+from utils.checkpoint import read_checkpoint
+from utils.status_channel import StatusChannel
+
 # --- 配置参数 ---
 NUM_ROUNDS = 3
 NUM_CLIENTS = 2
+# 客户端执行模式：
+#   "sequential" —— 逐个运行客户端（原始行为）
+#   "concurrent" —— 同一轮的所有客户端通过有界进程池并发运行
+#   "persistent" —— 每个客户端一个常驻工作进程，跨轮次保留数据集、模型、优化器和 RPC 连接
+CLIENT_EXECUTION_MODE = "sequential"
+# 聚合器运行模式：
+#   "oneshot" —— 每轮客户端完成后运行一次 aggregator.py（原始行为）
+#   "service" —— 常驻聚合服务监听链上 UpdateSubmitted 事件，达到法定数量后立即聚合并结束本轮
+AGGREGATOR_MODE = "oneshot"
+# 训练调度：
+#   "sync"  —— 每轮等待所有客户端完成训练后再聚合，最慢的客户端决定每一轮的节奏
+#   "async" —— FedBuff 式缓冲异步聚合（需要 persistent 客户端与 service 聚合器）：聚合服务每收满
+#              ASYNC_BUFFER_SIZE 个更新就结束一轮，陈旧的更新按陈旧度降权（见 aggregator.STALENESS_EXPONENT）。
+#              合约规定每个客户端每轮只能提交一个更新，因此较快的客户端提交后会等到本轮结束、
+#              再拉取新的全局模型继续训练（每轮每个客户端至多一个更新）。ASYNC_BUFFER_SIZE 应小于 NUM_CLIENTS，
+#              否则每一轮仍要等到最慢的客户端提交
+TRAINING_SCHEDULE = "sync"
+# 异步调度下每轮聚合的更新数（缓冲区大小 K，写入合约的 updatesNeeded）
+ASYNC_BUFFER_SIZE = 2
+# 异步调度下的轮次超时（秒）：超过截止时间后聚合服务以已到达的更新结束本轮；0 表示不设超时
+ROUND_TIMEOUT_SECONDS = 120
+# 常驻聚合服务结束某一轮失败（交易回滚、收据超时等）后会重新同步链上状态并自动重试；
+# 同一轮连续失败超过该次数时放弃整个运行，None 表示不设上限
+MAX_ROUND_FAILURES = 5
+# 并发模式下同时运行的客户端进程上限，None 表示不超过可用 CPU 核数
+MAX_PARALLEL_CLIENTS = None
 STATUS_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'status.json'))
+# 子进程日志的追加写入文件，仪表盘按偏移增量读取
+STATUS_LOG_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'status_log.txt'))
+# status.json 的最短写入间隔（秒），期间的多次状态变化合并为一次写入
+STATUS_PUBLISH_INTERVAL = 0.5
 # --- 新增：最终快照文件路径 ---
 FINAL_STATE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), 'final_blockchain_state.json'))
+ENV_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '.env'))
+
+# 并发运行多个子进程时，status_data 与状态通道由多个线程共享
+_status_lock = threading.Lock()
+_status_channel = None
+
+# --- 状态更新与命令执行函数 ---
+def open_status_channel(append=False):
+    """打开状态通道；续跑时传入 append=True，保留上一次运行的日志。"""
+    global _status_channel
+    _status_channel = StatusChannel(STATUS_FILE, STATUS_LOG_FILE, min_interval=STATUS_PUBLISH_INTERVAL, append=append)
+    return _status_channel
+
+def get_status_channel():
+    if _status_channel is None:
+        return open_status_channel()
+    return _status_channel
 
-# --- 状态更新与命令执行函数 (保持不变) ---
 def update_status(data):
-    try:
-        with open(STATUS_FILE, 'w') as f: json.dump(data, f, indent=4)
-    except IOError as e:
-        print(f"警告：无法写入状态文件: {e}")
+    """发布一份状态快照（节流、原子写入 status.json）。"""
+    get_status_channel().publish(data)
 
-def run_command(command, status_data, step_name):
-    status_data.update({'current_step': step_name, 'log_output': []})
-    update_status(status_data)
+def begin_step(status_data, step_name):
+    """切换当前步骤；仪表盘只展示从该步骤开始的日志（调用方需持有 _status_lock）。"""
+    status_data.update({'current_step': step_name, 'log_offset': get_status_channel().log_offset()})
+
+def publish_log_line(status_data, line):
+    """打印一行子进程日志，并追加到状态日志文件（不重写 status.json）。"""
+    with _status_lock:
+        print(line)
+        get_status_channel().append_log(line)
+
+def run_command(command, status_data, step_name=None, env=None, preexec_fn=None, log_prefix=""):
+    """
+    运行一条命令，并把它的输出实时写入状态日志。
+    step_name 为 None 时不重置当前步骤与日志（供并发运行的多个子进程共享同一步骤）。
+    """
+    with _status_lock:
+        if step_name is not None:
+            begin_step(status_data, step_name)
+        update_status(status_data)
     process = subprocess.Popen(
         command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-        text=True, encoding='utf-8', bufsize=1
+        text=True, encoding='utf-8', bufsize=1, env=env, preexec_fn=preexec_fn
     )
-    log_buffer = []
     for line in iter(process.stdout.readline, ''):
         if line:
-            clean_line = line.strip()
-            print(clean_line)
-            log_buffer.append(clean_line)
-            if len(log_buffer) > 20: log_buffer.pop(0)
-            status_data['log_output'] = log_buffer
-            update_status(status_data)
+            publish_log_line(status_data, f"{log_prefix}{line.strip()}")
     process.wait()
     if process.returncode != 0:
         raise subprocess.CalledProcessError(process.returncode, command)
 
+# --- 客户端调度 ---
+def get_available_cpus():
+    """返回当前进程可用的 CPU 核编号列表（优先遵循已有的 CPU 亲和性设置）。"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def plan_cpu_slots(num_workers):
+    """
+    将可用 CPU 核均分给 num_workers 个工作槽位，每个槽位是一组互不重叠的核编号。
+    核数少于工作者数量时，多个槽位会共享同一个核。
+    """
+    cpus = get_available_cpus()
+    if num_workers <= len(cpus):
+        per_worker = len(cpus) // num_workers
+        return [cpus[i * per_worker:(i + 1) * per_worker] for i in range(num_workers)]
+    return [[cpus[i % len(cpus)]] for i in range(num_workers)]
+
+def build_worker_env(cpu_slot):
+    """为一个客户端子进程构造环境变量，把 torch/OpenMP/MKL 的线程数限制在其槽位的核数以内。"""
+    env = os.environ.copy()
+    num_threads = str(len(cpu_slot))
+    env.update({
+        'OMP_NUM_THREADS': num_threads,
+        'MKL_NUM_THREADS': num_threads,
+        'FL_NUM_THREADS': num_threads,
+    })
+    return env
+
+def make_affinity_setter(cpu_slot):
+    """返回在子进程 exec 之前把它绑定到 cpu_slot 的函数（平台不支持时返回 None）。"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return None
+    return lambda: os.sched_setaffinity(0, cpu_slot)
+
+def report_client_timings(round_number, client_timings, round_wall_time):
+    """打印每个客户端的耗时，并与顺序执行的理论耗时（各客户端耗时之和）对比。"""
+    sequential_time = sum(client_timings.values())
+    print(f"\n⏱️  第 {round_number} 轮客户端耗时统计 (模式: {CLIENT_EXECUTION_MODE}):")
+    for client_id in sorted(client_timings):
+        print(f"  - 客户端 {client_id}: {client_timings[client_id]:.2f} 秒")
+    print(f"  - 本轮客户端阶段总耗时: {round_wall_time:.2f} 秒，"
+          f"各客户端耗时之和: {sequential_time:.2f} 秒，"
+          f"加速比: {sequential_time / max(round_wall_time, 1e-9):.2f}x")
+
+def run_clients_sequentially(round_number, python_executable, status_data):
+    client_timings = {}
+    for i in range(NUM_CLIENTS):
+        print(f"\n--- 客户端 {i} 开始训练 ---")
+        start_time = time.perf_counter()
+        run_command(f"{python_executable} client/client.py {i} --num-clients {NUM_CLIENTS}", status_data, f"第 {round_number} 轮：客户端 {i} 训练中")
+        client_timings[i] = time.perf_counter() - start_time
+        print(f"--- ✅ 客户端 {i} 完成 ---")
+    return client_timings
+
+def run_clients_concurrently(round_number, python_executable, status_data):
+    """
+    通过有界工作池并发运行本轮的所有客户端。
+    每个工作槽位独占一组 CPU 核：子进程被绑定到这些核上，且 torch 的线程数与核数一致，
+    避免多个训练进程互相抢占 CPU。
+    """
+    num_workers = min(NUM_CLIENTS, MAX_PARALLEL_CLIENTS or len(get_available_cpus()))
+    free_slots = queue.Queue()
+    for cpu_slot in plan_cpu_slots(num_workers):
+        free_slots.put(cpu_slot)
+    print(f"\n--- {NUM_CLIENTS} 个客户端并发训练，工作池大小: {num_workers} ---")
+
+    def run_client(client_id):
+        cpu_slot = free_slots.get()
+        try:
+            print(f"--- 客户端 {client_id} 开始训练 (CPU 核: {cpu_slot}) ---")
+            start_time = time.perf_counter()
+            run_command(
+                f"{python_executable} client/client.py {client_id} --num-clients {NUM_CLIENTS}", status_data,
+                env=build_worker_env(cpu_slot), preexec_fn=make_affinity_setter(cpu_slot),
+                log_prefix=f"[客户端 {client_id}] "
+            )
+            elapsed = time.perf_counter() - start_time
+            print(f"--- ✅ 客户端 {client_id} 完成 ---")
+            return elapsed
+        finally:
+            free_slots.put(cpu_slot)
+
+    with _status_lock:
+        begin_step(status_data, f"第 {round_number} 轮：{NUM_CLIENTS} 个客户端并发训练中")
+        update_status(status_data)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = {i: executor.submit(run_client, i) for i in range(NUM_CLIENTS)}
+        # result() 会把子进程失败（CalledProcessError）重新抛给主循环
+        return {i: future.result() for i, future in futures.items()}
+
+class ResidentProcess:
+    """
+    常驻子进程（client.py --worker / aggregator.py --serve）。
+    进程只启动一次，server 通过 stdin 下发指令，并通过带前缀的 stdout 行接收控制信号，
+    其余输出照常转发到状态日志。
+    """
+    def __init__(self, label, command, status_data, env=None, preexec_fn=None):
+        self.label = label
+        self.status_data = status_data
+        self.signals = queue.Queue()
+        self.process = subprocess.Popen(
+            command, shell=True,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, encoding='utf-8', bufsize=1, env=env, preexec_fn=preexec_fn
+        )
+        self.reader = threading.Thread(target=self._pump_output, daemon=True)
+        self.reader.start()
+
+    def _pump_output(self):
+        for line in iter(self.process.stdout.readline, ''):
+            clean_line = line.strip()
+            if clean_line.startswith(WORKER_SIGNAL_PREFIX):
+                self.signals.put(clean_line[len(WORKER_SIGNAL_PREFIX):].strip())
+            elif clean_line:
+                publish_log_line(self.status_data, f"[{self.label}] {clean_line}")
+        self.signals.put("EXITED")
+
+    def wait_for(self, expected_signal):
+        signal = self.signals.get()
+        if signal != expected_signal:
+            raise RuntimeError(f"{self.label} 的常驻进程返回了 {signal}，期望 {expected_signal}")
+
+    def send(self, command):
+        self.process.stdin.write(f"{command}\n")
+        self.process.stdin.flush()
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.send("exit")
+                self.process.wait(timeout=30)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+
+    def terminate(self):
+        """
+        不等待当前任务完成，直接结束进程（异步调度下工作进程可能正阻塞在等待下一轮上）。
+        客户端工作进程收到 SIGTERM 后仍会先领取剩余的奖励，因此与 close() 一样最多等待 30 秒。
+        """
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class ClientWorker(ResidentProcess):
+    """
+    常驻的客户端工作进程：每轮通过 stdin 下发一条 "train" 指令，
+    因此 torch/web3 的导入、配置解析、合约连接和数据集加载只发生在第一轮之前。
+    """
+    def __init__(self, client_id, python_executable, status_data, cpu_slot):
+        self.client_id = client_id
+        super().__init__(
+            f"客户端 {client_id}", f"{python_executable} client/client.py {client_id} --num-clients {NUM_CLIENTS} --worker", status_data,
+            env=build_worker_env(cpu_slot), preexec_fn=make_affinity_setter(cpu_slot)
+        )
+
+    def start_round(self):
+        self.send("train")
+
+    def keep_training(self, stop_event, completed):
+        """
+        异步调度：每完成一次训练就立即再派发一次 "train_next"，不与其他客户端同步。
+        completed 记录每个客户端完成（含失败）的训练次数。
+        """
+        while not stop_event.is_set():
+            self.send("train_next")
+            signal = self.signals.get()
+            if signal == "EXITED":
+                return
+            if signal == "ROUND_FAILED":
+                print(f"⚠️  客户端 {self.client_id} 本次训练失败，继续派发下一次训练。")
+            completed[self.client_id] += 1
+
+def start_client_workers(python_executable, status_data):
+    """为每个客户端启动一个常驻工作进程（各自绑定一组 CPU 核），并等待它们完成初始化与注册。"""
+    print(f"\n--- 正在启动 {NUM_CLIENTS} 个常驻客户端工作进程 ---")
+    workers = [
+        ClientWorker(i, python_executable, status_data, cpu_slot)
+        for i, cpu_slot in enumerate(plan_cpu_slots(NUM_CLIENTS))
+    ]
+    for worker in workers:
+        worker.wait_for("READY")
+    print("--- ✅ 所有客户端工作进程已就绪 ---")
+    return workers
+
+def start_aggregator_service(python_executable, status_data):
+    """启动常驻聚合服务，它会在每轮更新达到法定数量时自动聚合并结束该轮。"""
+    print("\n--- 正在启动常驻聚合服务 ---")
+    service = ResidentProcess("聚合者", f"{python_executable} aggregator/aggregator.py --serve", status_data)
+    service.wait_for("READY")
+    print("--- ✅ 常驻聚合服务已就绪 ---")
+    return service
+
+def wait_for_round_finalized(aggregator_service, round_number):
+    """
+    等待常驻聚合服务结束本轮。ROUND_FAILED 不是致命错误：聚合服务会以链上状态为准重新同步并重试，
+    这里只记录失败并继续等待 ROUND_FINALIZED，直到同一轮失败次数超过 MAX_ROUND_FAILURES。
+    """
+    failures = 0
+    while True:
+        signal = aggregator_service.signals.get()
+        if signal == "ROUND_FINALIZED":
+            return
+        if signal != "ROUND_FAILED":
+            raise RuntimeError(f"{aggregator_service.label} 的常驻进程返回了 {signal}，期望 ROUND_FINALIZED")
+        failures += 1
+        metrics.get_recorder().count("round_failures")
+        if MAX_ROUND_FAILURES is not None and failures > MAX_ROUND_FAILURES:
+            raise RuntimeError(f"第 {round_number} 轮连续 {failures} 次结束失败，放弃运行")
+        print(f"⚠️  聚合服务结束第 {round_number} 轮失败（第 {failures} 次），等待其重试...")
+
+def claim_final_rewards(python_executable, status_data):
+    """
+    一次性客户端进程在每轮开始时只领取更早轮次的奖励，最后一轮结束后再为每个客户端运行一次领取。
+    常驻工作进程在退出时自行领取，不需要这一步。
+    """
+    for i in range(NUM_CLIENTS):
+        run_command(
+            f"{python_executable} client/client.py {i} --num-clients {NUM_CLIENTS} --claim-only", status_data,
+            f"客户端 {i} 领取剩余的奖励", log_prefix=f"[客户端 {i}] "
+        )
+
+def run_round_on_workers(round_number, workers, status_data):
+    """向所有常驻工作进程下发本轮训练指令，并等待全部完成。"""
+    with _status_lock:
+        begin_step(status_data, f"第 {round_number} 轮：{len(workers)} 个常驻客户端训练中")
+        update_status(status_data)
+    start_times = {}
+    for worker in workers:
+        start_times[worker.client_id] = time.perf_counter()
+        worker.start_round()
+    client_timings = {}
+    for worker in workers:
+        worker.wait_for("ROUND_DONE")
+        client_timings[worker.client_id] = time.perf_counter() - start_times[worker.client_id]
+    return client_timings
+
+def run_async_schedule(workers, aggregator_service, status_data, start_round=1):
+    """
+    FedBuff 式异步调度：所有常驻客户端各自连续训练，轮次只由聚合服务推进
+    （收满缓冲区或超过轮次截止时间即结束一轮），慢客户端不再拖住其他客户端。
+    """
+    stop_event = threading.Event()
+    completed = Counter()
+    recorder = metrics.get_recorder()
+    for worker in workers:
+        threading.Thread(target=worker.keep_training, args=(stop_event, completed), daemon=True).start()
+    try:
+        for r in range(start_round, NUM_ROUNDS + 1):
+            print(f"\n{'='*25} ROUND {r}/{NUM_ROUNDS} (async) {'='*25}")
+            with _status_lock:
+                status_data.update({'overall_status': f'Running Round {r}', 'current_round': r})
+                begin_step(status_data, f"第 {r} 轮：客户端异步训练中，等待聚合服务收满 {ASYNC_BUFFER_SIZE} 个更新")
+                update_status(status_data)
+            round_start_time = time.perf_counter()
+            recorder.set_context(round=r)
+            with recorder.span("round"):
+                wait_for_round_finalized(aggregator_service, r)
+            recorder.flush()
+            done = ", ".join(f"客户端 {i}: {completed[i]}" for i in sorted(w.client_id for w in workers))
+            print(f"--- ✅ 第 {r} 轮结束，耗时 {time.perf_counter() - round_start_time:.2f} 秒（累计完成训练次数 {done}）---")
+    finally:
+        stop_event.set()
+
 # --- 新增函数：保存最终区块链状态 ---
 def save_final_blockchain_state():
-    """连接到区块链，获取最终状态并保存到文件。"""
+    """把链上索引追到最新区块，并把最终状态与完整交易历史保存到文件。"""
     print("📸 正在保存最终区块链状态快照...")
     try:
-        # 这部分逻辑与 dashboard.py 中的 get_full_blockchain_data 类似
-        from dashboard import get_full_blockchain_data
-        final_data = get_full_blockchain_data()
+        with open(ENV_FILE, 'r') as f: contract_address = f.readline().split('=')[1].strip()
+        with open(ABI_PATH, 'r') as f: abi = json.load(f)['abi']
+        indexer = ChainIndexer(default_index_path(contract_address), RPC_URL, contract_address, abi)
+        indexer.sync()
+        final_data = indexer.snapshot(history_limit=None)
         if final_data:
             with open(FINAL_STATE_FILE, 'w') as f:
-                # 注意：我们不能直接保存 w3 和 contract 对象
-                # get_full_blockchain_data 已经只返回纯字典了，所以是安全的
                 json.dump(final_data, f, indent=4)
             print(f"✅ 最终状态已保存到 {FINAL_STATE_FILE}")
         else:
@@ -58,46 +392,143 @@ def save_final_blockchain_state():
     except Exception as e:
         print(f"❌ 保存最终状态时出错: {e}")
 
+def start_local_node():
+    # 同步调度每轮需要所有客户端的更新，异步调度每轮聚合一个缓冲区（并设置轮次超时）；
+    # 节点预置足够多的账户（聚合者 + 每个客户端一个）
+    node_env = os.environ.copy()
+    node_env.update({'HARDHAT_ACCOUNT_COUNT': str(max(20, NUM_CLIENTS + 1))})
+    if TRAINING_SCHEDULE == "async":
+        node_env.update({'UPDATES_NEEDED': str(ASYNC_BUFFER_SIZE), 'ROUND_TIMEOUT': str(ROUND_TIMEOUT_SECONDS)})
+    else:
+        node_env.update({'UPDATES_NEEDED': str(NUM_CLIENTS)})
+    subprocess.Popen("./blockchain/start_local_node.sh", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=node_env)
+    print("⏳ 等待10秒，确保节点和合约部署就绪...")
+    time.sleep(10)
+
+def probe_resume_point():
+    """
+    续跑前核对链上状态与本地检查点，返回应当开始的轮次。
+    Hardhat 节点的状态只保存在内存中，续跑要求上一次运行留下的节点仍在运行；
+    链上的 currentRound / globalModelCID 是权威来源，检查点只用于核对。
+    """
+    try:
+        with open(ENV_FILE, 'r') as f: contract_address = f.readline().split('=')[1].strip()
+        with open(ABI_PATH, 'r') as f: abi = json.load(f)['abi']
+    except (FileNotFoundError, IndexError) as e:
+        raise RuntimeError(f"无法续跑：找不到上一次运行的部署信息 ({e})。") from e
+    w3 = Web3(Web3.HTTPProvider(RPC_URL))
+    if not w3.isConnected() or w3.eth.get_code(contract_address) in (b'', None):
+        raise RuntimeError("无法续跑：本地节点未运行或合约已不存在（节点状态只保存在内存中），请重新开始一次完整运行。")
+    contract = w3.eth.contract(address=contract_address, abi=abi)
+    current_round = contract.functions.currentRound().call()
+    global_cid = bytes(contract.functions.globalModelCID().call())
+    global_cid = None if global_cid == bytes(32) else global_cid.hex()
+
+    checkpoint = read_checkpoint()
+    if checkpoint is None:
+        print("⚠️ 没有找到检查点文件，以链上状态为准。")
+    elif checkpoint['next_round'] != current_round or checkpoint['global_model_cid'] != global_cid:
+        print(f"⚠️ 检查点（下一轮 {checkpoint['next_round']}，全局模型 {checkpoint['global_model_cid']}）"
+              f"与链上状态（当前轮 {current_round}，全局模型 {global_cid}）不一致，以链上状态为准。")
+    else:
+        print(f"✅ 检查点与链上状态一致（第 {checkpoint['round']} 轮已结束）。")
+    print(f"🔁 从第 {current_round} 轮继续（全局模型 CID: {global_cid}）。")
+    return current_round
+
 def main():
+    parser = argparse.ArgumentParser(description="联邦学习自动化服务器")
+    parser.add_argument('--resume', action='store_true',
+                        help="在上一次中断的运行之上续跑：复用仍在运行的本地节点，从链上的当前轮次继续")
+    args = parser.parse_args()
     python_executable = f"{sys.executable} -u"
     print("="*60)
     print("🚀 联邦学习自动化服务器已启动 🚀")
     # ... (前面的 print 保持不变) ...
     print(f"  - 计划执行轮数: {NUM_ROUNDS}")
     print(f"  - 客户端数量: {NUM_CLIENTS}")
+    print(f"  - 客户端执行模式: {CLIENT_EXECUTION_MODE}")
+    print(f"  - 聚合器运行模式: {AGGREGATOR_MODE}")
+    print(f"  - 训练调度: {TRAINING_SCHEDULE}")
+    print(f"  - 续跑: {'是' if args.resume else '否'}")
     print(f"  - Python 解释器: {python_executable}")
     print("="*60)
     
+    open_status_channel(append=args.resume)
     status_data = {
         'overall_status': 'Initializing', 'current_round': 0, 'total_rounds': NUM_ROUNDS,
-        'current_step': '清理旧文件', 'log_output': [], 'blockchain_info': {}
+        'current_step': '清理旧文件', 'log_offset': 0, 'blockchain_info': {}
     }
     update_status(status_data)
+    workers = []
+    aggregator_service = None
 
     try:
-        print("\n[ 1/3 ] 🧹 清理旧的实验产物...")
-        run_command("rm -rf logs/ plots/ saved_models/ .env status.json final_blockchain_state.json", status_data, "清理旧文件")
-        print("✅ 清理完成。")
-        
-        print("\n[ 2/3 ] 🔗 启动本地区块链并部署合约...")
-        status_data.update({'overall_status': 'Starting Blockchain'})
-        subprocess.Popen("./blockchain/start_local_node.sh", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        print("⏳ 等待10秒，确保节点和合约部署就绪...")
-        time.sleep(10)
-        print("✅ 区块链已就绪。")
+        if TRAINING_SCHEDULE == "async" and (CLIENT_EXECUTION_MODE != "persistent" or AGGREGATOR_MODE != "service"):
+            raise ValueError("异步调度需要 CLIENT_EXECUTION_MODE = \"persistent\" 且 AGGREGATOR_MODE = \"service\"。")
+
+        if args.resume:
+            # 续跑时保留日志、已保存的模型、转发收件箱与节点，只核对从哪一轮开始
+            print("\n[ 1/3 ] 🔁 核对链上状态与检查点...")
+            start_round = probe_resume_point()
+            metrics.configure("server")
+            print("\n[ 2/3 ] 🔗 复用正在运行的本地区块链。")
+        else:
+            start_round = 1
+            print("\n[ 1/3 ] 🧹 清理旧的实验产物...")
+            run_command("rm -rf logs/ plots/ saved_models/ .env status.json final_blockchain_state.json", status_data, "清理旧文件")
+            print("✅ 清理完成。")
+            # 清理会删除 logs/，指标文件在清理之后才创建
+            metrics.configure("server")
+
+            print("\n[ 2/3 ] 🔗 启动本地区块链并部署合约...")
+            status_data.update({'overall_status': 'Starting Blockchain'})
+            update_status(status_data)
+            # 上一次运行出错时节点会被保留以便续跑，重新开始前先把它关掉
+            subprocess.run("./blockchain/stop_local_node.sh", shell=True, stdout=subprocess.DEVNULL)
+            with metrics.get_recorder().span("node_startup"):
+                start_local_node()
+            print("✅ 区块链已就绪。")
 
         print("\n[ 3/3 ] 🤖 开始执行联邦学习主循环...")
-        for r in range(1, NUM_ROUNDS + 1):
-            print(f"\n{'='*25} ROUND {r}/{NUM_ROUNDS} {'='*25}")
-            status_data.update({'overall_status': f'Running Round {r}', 'current_round': r})
-            for i in range(NUM_CLIENTS):
-                print(f"\n--- 客户端 {i} 开始训练 ---")
-                run_command(f"{python_executable} client/client.py {i}", status_data, f"第 {r} 轮：客户端 {i} 训练中")
-                print(f"--- ✅ 客户端 {i} 完成 ---")
-            print(f"\n--- 聚合器开始工作 ---")
-            run_command(f"{python_executable} aggregator/aggregator.py", status_data, f"第 {r} 轮：聚合器运行中")
-            print(f"--- ✅ 聚合器完成 ---")
-            
+        if AGGREGATOR_MODE == "service":
+            aggregator_service = start_aggregator_service(python_executable, status_data)
+        if CLIENT_EXECUTION_MODE == "persistent":
+            workers = start_client_workers(python_executable, status_data)
+        if TRAINING_SCHEDULE == "async":
+            run_async_schedule(workers, aggregator_service, status_data, start_round)
+        else:
+            # 续跑时，中断的那一轮里已经提交过更新的客户端会自行跳过，只有其余客户端重新训练
+            recorder = metrics.get_recorder()
+            for r in range(start_round, NUM_ROUNDS + 1):
+                print(f"\n{'='*25} ROUND {r}/{NUM_ROUNDS} {'='*25}")
+                status_data.update({'overall_status': f'Running Round {r}', 'current_round': r})
+                update_status(status_data)
+                recorder.set_context(round=r)
+                round_start_time = time.perf_counter()
+                with recorder.span("round"):
+                    with recorder.span("client_training"):
+                        if CLIENT_EXECUTION_MODE == "persistent":
+                            client_timings = run_round_on_workers(r, workers, status_data)
+                        elif CLIENT_EXECUTION_MODE == "concurrent":
+                            client_timings = run_clients_concurrently(r, python_executable, status_data)
+                        else:
+                            client_timings = run_clients_sequentially(r, python_executable, status_data)
+                    report_client_timings(r, client_timings, time.perf_counter() - round_start_time)
+                    with recorder.span("aggregation"):
+                        if aggregator_service is not None:
+                            print(f"\n--- 等待常驻聚合服务结束第 {r} 轮 ---")
+                            with _status_lock:
+                                begin_step(status_data, f"第 {r} 轮：聚合器运行中")
+                                update_status(status_data)
+                            wait_for_round_finalized(aggregator_service, r)
+                        else:
+                            print(f"\n--- 聚合器开始工作 ---")
+                            run_command(f"{python_executable} aggregator/aggregator.py", status_data, f"第 {r} 轮：聚合器运行中")
+                recorder.flush()
+                print(f"--- ✅ 聚合器完成 ---")
+            if CLIENT_EXECUTION_MODE != "persistent":
+                claim_final_rewards(python_executable, status_data)
+
         status_data.update({'overall_status': 'Finished', 'current_step': '所有任务完成'})
         update_status(status_data)
         print("\n\n🎉🎉🎉 所有联邦学习任务已成功完成！ 🎉🎉🎉")
@@ -107,13 +538,28 @@ def main():
         status_data.update({'overall_status': 'Error', 'current_step': f'错误: {e}'})
         update_status(status_data)
     finally:
+        for worker in workers:
+            if TRAINING_SCHEDULE == "async":
+                worker.terminate()
+            else:
+                worker.close()
+        if aggregator_service is not None:
+            aggregator_service.close()
+
         # --- 这是修改的地方 ---
         # 在关闭节点之前，保存最终快照
         save_final_blockchain_state()
         # --- 修改结束 ---
         
-        print("\n🛑 正在关闭本地区块链节点...")
-        subprocess.Popen("./blockchain/stop_local_node.sh", shell=True)
+        get_status_channel().close()
+
+        if status_data['overall_status'] == 'Finished':
+            print("\n🛑 正在关闭本地区块链节点...")
+            subprocess.Popen("./blockchain/stop_local_node.sh", shell=True)
+        else:
+            # 节点的链上状态只保存在内存中，出错时保留节点，修复问题后可以续跑
+            print("\n⏸️ 运行未完成，本地区块链节点保持运行。可执行 `python server.py --resume` 从中断的轮次继续，"
+                  "或执行 ./blockchain/stop_local_node.sh 关闭节点。")
         print("👋 服务器已关闭。")
 
 if __name__ == "__main__":
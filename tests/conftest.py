@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 与各入口脚本一样，把项目根目录（server.py 与 utils 包）与 client / aggregator 目录加入模块搜索路径
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(PROJECT_ROOT)
+for directory in ('client', 'aggregator'):
+    sys.path.append(os.path.join(PROJECT_ROOT, directory))
@@ -0,0 +1,132 @@
+import pytest
+from eth_abi import encode
+from eth_utils import event_abi_to_log_topic
+from hexbytes import HexBytes
+from web3 import Web3
+
+from utils import chain_indexer
+from utils.chain_indexer import ChainIndexer
+
+CONTRACT = Web3.toChecksumAddress("0x" + "11" * 20)
+OTHER = Web3.toChecksumAddress("0x" + "22" * 20)
+CLIENTS = [Web3.toChecksumAddress("0x" + f"{i:02x}" * 20) for i in (0xa1, 0xa2)]
+CID = "cd" * 32
+
+# 合约 ABI 中索引器用到的部分
+ABI = [
+    {"type": "function", "name": "submitUpdate", "stateMutability": "nonpayable",
+     "inputs": [{"name": "_modelCID", "type": "bytes32"}], "outputs": []},
+    {"type": "function", "name": "getRoundState", "stateMutability": "view", "inputs": [],
+     "outputs": [{"name": "round", "type": "uint256"}, {"name": "needed", "type": "uint256"},
+                 {"name": "modelCID", "type": "bytes32"}, {"name": "updates", "type": "address[]"}]},
+    {"type": "event", "name": "UpdateSubmitted", "anonymous": False, "inputs": [
+        {"name": "round", "type": "uint256", "indexed": True},
+        {"name": "clientAddress", "type": "address", "indexed": True},
+        {"name": "modelCID", "type": "bytes32", "indexed": False},
+        {"name": "baseRound", "type": "uint256", "indexed": False}]},
+]
+UPDATE_TOPIC = event_abi_to_log_topic(ABI[2])
+
+
+class FakeChain:
+    """按区块号保存区块与日志，替代 ChainReader 的批量请求与 eth_getLogs。"""
+    def __init__(self):
+        self.blocks = []
+        self.logs = []
+        self.fork = 0
+
+    def mine(self, txs=(), round_number=1):
+        number = len(self.blocks)
+        block_hash = f"0x{self.fork:02x}{number:062x}"
+        transactions = []
+        for index, (sender, to, cid) in enumerate(txs):
+            tx_hash = f"0x{self.fork:02x}{number:030x}{index:032x}"
+            data = Web3.keccak(text="submitUpdate(bytes32)")[:4] + bytes.fromhex(cid)
+            transactions.append({
+                'hash': tx_hash, 'from': sender, 'to': to, 'input': "0x" + data.hex(),
+                'blockNumber': hex(number), 'transactionIndex': hex(index),
+            })
+            if to == CONTRACT:
+                self.logs.append({
+                    'address': CONTRACT, 'blockNumber': number, 'blockHash': HexBytes(block_hash),
+                    'transactionHash': HexBytes(tx_hash), 'transactionIndex': index, 'logIndex': index,
+                    'topics': [HexBytes(UPDATE_TOPIC), HexBytes(round_number.to_bytes(32, 'big')),
+                               HexBytes(bytes(12) + bytes.fromhex(sender[2:]))],
+                    'data': "0x" + encode(["bytes32", "uint256"], [bytes.fromhex(cid), 0]).hex(),
+                })
+        self.blocks.append({'hash': block_hash, 'transactions': transactions})
+
+    def batch_call(self, calls):
+        results = []
+        for call in calls:
+            if not isinstance(call, tuple):
+                results.append([len(self.blocks), 2, bytes.fromhex(CID), CLIENTS[:1]])
+            elif call[0] == "eth_blockNumber":
+                results.append(hex(len(self.blocks) - 1))
+            else:
+                number = int(call[1][0], 16)
+                results.append(self.blocks[number] if number < len(self.blocks) else None)
+        return results
+
+    def get_logs(self, params):
+        return [log for log in self.logs if params['fromBlock'] <= log['blockNumber'] <= params['toBlock']]
+
+
+@pytest.fixture
+def indexer(tmp_path, monkeypatch):
+    monkeypatch.setattr(chain_indexer, "BLOCKS_PER_BATCH", 2)
+    chain = FakeChain()
+    indexer = ChainIndexer(str(tmp_path / "index.sqlite"), "http://127.0.0.1:1", CONTRACT, ABI)
+    indexer.reader = chain
+    indexer.w3.eth.get_logs = chain.get_logs
+    indexer.chain = chain
+    return indexer
+
+
+def test_sync_indexes_contract_transactions_and_events(indexer):
+    chain = indexer.chain
+    chain.mine()
+    chain.mine([(CLIENTS[0], CONTRACT, CID), (CLIENTS[1], OTHER, CID)])
+    chain.mine([(CLIENTS[1], CONTRACT, "ef" * 32)])
+    assert indexer.sync() == 3
+    assert indexer.is_live
+    # 发往其他地址的交易不入索引；交易按区块倒序返回，轮次取自同一交易的事件
+    history = indexer.transactions()
+    assert [(tx["from"], tx["func"], tx["round"]) for tx in history] == [
+        (CLIENTS[1], "submitUpdate", 1), (CLIENTS[0], "submitUpdate", 1)]
+    assert [tx["from"] for tx in indexer.transactions(client=CLIENTS[0].lower())] == [CLIENTS[0]]
+    assert indexer.transactions(limit=1, offset=1) == history[1:]
+    assert indexer.round_updates(1) == [(CLIENTS[0], CID), (CLIENTS[1], "ef" * 32)]
+    snapshot = indexer.snapshot()
+    assert snapshot["onchain_round"] == 3
+    assert snapshot["updates_received"] == 1
+    assert snapshot["global_model_cid"] == CID
+    assert snapshot["contract_address"] == CONTRACT
+
+
+def test_sync_is_incremental(indexer):
+    chain = indexer.chain
+    for _ in range(3):
+        chain.mine([(CLIENTS[0], CONTRACT, CID)])
+    assert indexer.sync() == 3
+    assert indexer.sync() == 0
+    chain.mine([(CLIENTS[1], CONTRACT, CID)], round_number=2)
+    assert indexer.sync() == 1
+    assert indexer.round_updates(2) == [(CLIENTS[1], CID)]
+    assert len(indexer.transactions(limit=None)) == 4
+
+
+def test_reorg_triggers_full_reindex(indexer):
+    chain = indexer.chain
+    chain.mine([(CLIENTS[0], CONTRACT, CID)])
+    chain.mine([(CLIENTS[0], CONTRACT, CID)])
+    indexer.sync()
+    # 节点重启：游标处的区块哈希变了，旧链上的数据必须全部丢弃
+    chain.blocks, chain.logs, chain.fork = [], [], 1
+    chain.mine([(CLIENTS[1], CONTRACT, "ef" * 32)])
+    assert indexer.sync() == 1
+    assert indexer.round_updates(1) == [(CLIENTS[1], "ef" * 32)]
+
+
+def test_snapshot_before_first_sync_is_none(indexer):
+    assert indexer.snapshot() is None
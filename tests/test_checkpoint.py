@@ -0,0 +1,99 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import aggregator as aggregator_module
+import server
+from utils import checkpoint
+from utils.checkpoint import read_checkpoint, write_checkpoint
+from utils.plotter import read_history
+
+CID = "ab" * 32
+
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / "saved_models" / "checkpoint.json")
+    assert read_checkpoint(path) is None
+    write_checkpoint(1, "11" * 32, "0x01", path)
+    write_checkpoint(2, CID, "0x02", path)
+    assert read_checkpoint(path) == {"round": 2, "next_round": 3, "global_model_cid": CID, "tx_hash": "0x02"}
+    assert sorted(p.name for p in (tmp_path / "saved_models").iterdir()) == ["checkpoint.json"]
+
+
+def test_unreadable_checkpoint_is_ignored(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    path.write_text('{"round": 2, "next_')
+    assert read_checkpoint(str(path)) is None
+
+
+class FakeCall:
+    def __init__(self, value):
+        self.value = value
+
+    def call(self):
+        return self.value
+
+
+class FakeWeb3:
+    """只实现 probe_resume_point 用到的只读调用。"""
+    current_round = 3
+    global_model_cid = bytes.fromhex(CID)
+    code = b"\x60\x80"
+
+    def __init__(self, provider):
+        self.eth = SimpleNamespace(get_code=lambda address: self.code, contract=self._contract)
+
+    @staticmethod
+    def HTTPProvider(url):
+        return url
+
+    def isConnected(self):
+        return True
+
+    def _contract(self, address, abi):
+        functions = SimpleNamespace(currentRound=lambda: FakeCall(self.current_round),
+                                    globalModelCID=lambda: FakeCall(self.global_model_cid))
+        return SimpleNamespace(functions=functions)
+
+
+@pytest.fixture
+def deployment(tmp_path, monkeypatch):
+    env_file = tmp_path / ".env"
+    env_file.write_text("CONTRACT_ADDRESS=0x" + "11" * 20 + "\n")
+    abi_file = tmp_path / "FederatedLearning.json"
+    abi_file.write_text(json.dumps({"abi": []}))
+    monkeypatch.setattr(server, "ENV_FILE", str(env_file))
+    monkeypatch.setattr(server, "ABI_PATH", str(abi_file))
+    monkeypatch.setattr(server, "Web3", FakeWeb3)
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_PATH", str(tmp_path / "checkpoint.json"))
+    return tmp_path
+
+
+def test_resume_point_matches_checkpoint(deployment, capsys):
+    write_checkpoint(2, CID)
+    assert server.probe_resume_point() == 3
+    assert "一致" in capsys.readouterr().out
+
+
+def test_resume_point_prefers_chain_state(deployment, capsys):
+    # 检查点落后于链上状态（例如聚合者在写检查点前崩溃）：以链上的轮次为准
+    write_checkpoint(1, "11" * 32)
+    assert server.probe_resume_point() == 3
+    assert "不一致" in capsys.readouterr().out
+
+
+def test_resume_requires_running_node(deployment, monkeypatch):
+    monkeypatch.setattr(FakeWeb3, "code", b"")
+    with pytest.raises(RuntimeError):
+        server.probe_resume_point()
+
+
+def test_history_keeps_latest_accuracy_per_round(tmp_path):
+    aggregator = aggregator_module.Aggregator.__new__(aggregator_module.Aggregator)
+    aggregator.history_log_path = str(tmp_path / "logs" / "history.csv")
+    aggregator._log_history(2, 0.5)
+    aggregator._log_history(1, 0.4)
+    # 续跑时重复评估同一轮，只保留最新结果
+    aggregator._log_history(2, 0.6)
+    assert read_history(aggregator.history_log_path) == [(1, 0.4), (2, 0.6)]
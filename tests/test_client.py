@@ -0,0 +1,140 @@
+import io
+import os
+import signal
+
+import pytest
+from eth_account import Account
+
+import client as client_module
+import config
+import relay
+
+CID = "ab" * 32
+
+
+class FakeClient:
+    def __init__(self, terminate=False):
+        self.calls = []
+        self.terminate = terminate
+
+    def register(self):
+        self.calls.append("register")
+
+    def run_training_round(self, wait_for_next_round=False):
+        self.calls.append("train_next" if wait_for_next_round else "train")
+        if self.terminate:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    def claim_remaining_rewards(self):
+        self.calls.append("claim")
+
+
+@pytest.fixture(autouse=True)
+def restore_sigterm():
+    handler = signal.getsignal(signal.SIGTERM)
+    yield
+    signal.signal(signal.SIGTERM, handler)
+
+
+@pytest.mark.parametrize("stdin", ["train\nexit\n", "train\n"], ids=["exit", "eof"])
+def test_worker_claims_remaining_rewards_on_shutdown(monkeypatch, stdin):
+    monkeypatch.setattr("sys.stdin", io.StringIO(stdin))
+    fl_client = FakeClient()
+    client_module.run_worker_loop(fl_client)
+    assert fl_client.calls == ["register", "train", "claim"]
+
+
+def test_worker_claims_remaining_rewards_when_terminated(monkeypatch):
+    # 异步调度下 server.py 用 SIGTERM 结束阻塞在等待下一轮上的工作进程
+    monkeypatch.setattr("sys.stdin", io.StringIO("train_next\n"))
+    fl_client = FakeClient(terminate=True)
+    with pytest.raises(SystemExit):
+        client_module.run_worker_loop(fl_client)
+    assert fl_client.calls == ["register", "train_next", "claim"]
+
+
+class FakeCall:
+    def __init__(self, value):
+        self.value = value
+
+    def call(self):
+        return self.value
+
+
+class FakeChain:
+    """按顺序返回投递后读到的 (当前轮次, 本客户端最近上链的轮次)。"""
+    def __init__(self, start_round, states):
+        self.round = start_round
+        self.states = list(states)
+        self.functions = self
+
+    def currentRound(self):
+        return FakeCall(self.round)
+
+    def clients(self, address):
+        return FakeCall(None)
+
+    def globalModelCID(self):
+        return FakeCall(None)
+
+    def batch_call(self, calls):
+        self.round, last_submitted = self.states.pop(0)
+        # 第三项（如果有）是全局模型 CID
+        return [self.round, (True, last_submitted), bytes(32)][:len(calls)]
+
+
+def make_relaying_client(tmp_path, chain):
+    fl_client = object.__new__(client_module.FederatedLearningClient)
+    fl_client.account = Account.create()
+    fl_client.contract = fl_client.reader = chain
+    fl_client.dirs = config.artifact_dirs(str(tmp_path))
+    fl_client._signing_domain = relay.domain_separator(31337, "0x" + "11" * 20)
+    fl_client.relayed_round = 0
+    fl_client._pending_relay = None
+    return fl_client
+
+
+def test_relay_resigns_when_round_ends_during_post(tmp_path):
+    # 投递到第 3 轮后发现该轮已经结束且没有转发本客户端的更新，应改投第 4 轮
+    chain = FakeChain(3, [(4, 2), (4, 2)])
+    fl_client = make_relaying_client(tmp_path, chain)
+    fl_client._relay_update(CID, base_round=3)
+    assert fl_client.relayed_round == 4
+    assert relay.read_signed_updates(3, fl_client.dirs["relay"]) == []
+    [(address, model_cid, base_round, signature)] = relay.read_signed_updates(4, fl_client.dirs["relay"])
+    assert (model_cid, base_round) == (CID, 3)
+    assert relay.recover_signer(fl_client._signing_domain, 4, CID, 3, signature) == fl_client.account.address
+
+
+def test_relay_keeps_update_already_recorded(tmp_path):
+    # 轮次前进了，但本客户端在第 3 轮的更新已经随该轮上链，不能在第 4 轮重复提交
+    chain = FakeChain(3, [(4, 3)])
+    fl_client = make_relaying_client(tmp_path, chain)
+    fl_client._relay_update(CID, base_round=3)
+    assert fl_client.relayed_round == 3
+    assert relay.read_signed_updates(4, fl_client.dirs["relay"]) == []
+
+
+def test_relay_reposts_update_missed_by_finalisation(tmp_path):
+    # 投递时第 3 轮尚未结束，但聚合者已经读过收件箱：它结束第 3 轮时没有包含这条更新，并清空了收件箱
+    chain = FakeChain(3, [(3, 2), (4, 2), (4, 2)])
+    fl_client = make_relaying_client(tmp_path, chain)
+    fl_client._relay_update(CID, base_round=3)
+    assert fl_client.relayed_round == 3
+    relay.discard_round(3, fl_client.dirs["relay"])
+    # 轮次前进后客户端核对链上记录，发现更新没有上链，改投第 4 轮
+    current_round, last_submitted_round, _ = fl_client._read_round_state()
+    assert (current_round, last_submitted_round) == (4, 4)
+    [(address, model_cid, base_round, signature)] = relay.read_signed_updates(4, fl_client.dirs["relay"])
+    assert (model_cid, base_round) == (CID, 3)
+    assert relay.recover_signer(fl_client._signing_domain, 4, CID, 3, signature) == fl_client.account.address
+
+
+def test_relay_not_reposted_once_included(tmp_path):
+    chain = FakeChain(3, [(3, 2), (4, 3)])
+    fl_client = make_relaying_client(tmp_path, chain)
+    fl_client._relay_update(CID, base_round=3)
+    relay.discard_round(3, fl_client.dirs["relay"])
+    assert fl_client._read_round_state()[:2] == (4, 3)
+    assert relay.read_signed_updates(4, fl_client.dirs["relay"]) == []
+    assert fl_client._pending_relay is None
@@ -0,0 +1,162 @@
+import os
+
+import pytest
+import torch
+from torch import nn
+
+import aggregator as aggregator_module
+import edge_aggregation
+from edge_aggregation import COMBINE_MODES, hierarchical_average
+from model_io import COMPRESSION_SCHEMES, compress_update, save_model_update, save_state_dict
+from model_store import ModelStore
+
+NUM_CLIENTS = 7
+NUM_EDGES = 3
+# 存储中不存在的 CID：聚合器据此认为还没有全局模型（第一轮）
+MISSING_CID = "0" * 64
+
+
+def make_model():
+    # 带 BatchNorm，state_dict 中含有整数缓冲区 num_batches_tracked
+    return nn.Sequential(nn.Conv2d(3, 4, 3), nn.BatchNorm2d(4), nn.Flatten(), nn.Linear(4 * 6 * 6, 5))
+
+
+def make_round(tmp_path, with_base):
+    """在临时存储中写入一轮客户端更新，返回 (store, base_cid, [(CID, 陈旧度), ...])。"""
+    torch.manual_seed(0)
+    store = ModelStore(str(tmp_path / "store"))
+    base = make_model().state_dict()
+    base_path = tmp_path / "base"
+    save_state_dict(str(base_path), base)
+    base_cid = store.put_file(str(base_path)) if with_base else None
+    updates = []
+    for i in range(NUM_CLIENTS):
+        state_dict = {
+            key: value + 0.01 * torch.randn_like(value) if value.is_floating_point() else value + 3 * i + 1
+            for key, value in base.items()
+        }
+        # 第一轮没有基准模型，只能提交完整 state_dict；之后混合完整模型与各种压缩增量
+        scheme = COMPRESSION_SCHEMES[i % len(COMPRESSION_SCHEMES)] if with_base else "none"
+        update, _ = compress_update(state_dict, base, scheme, topk_ratio=0.2)
+        path = tmp_path / f"update_{i}"
+        save_model_update(str(path), update, num_samples=100 + 37 * i)
+        updates.append((store.put_file(str(path)), i % 3))
+    return store, base_cid, updates
+
+
+def make_aggregator(store, base_cid, round_base_cids=None):
+    """不连接区块链的 Aggregator，只设置聚合路径用到的属性。"""
+    aggregator = object.__new__(aggregator_module.Aggregator)
+    aggregator.store = store
+    aggregator.global_model_cid = base_cid or MISSING_CID
+    aggregator.device = torch.device("cpu")
+    aggregator.update_bytes_read = 0
+    aggregator._global_model_cache = {}
+    aggregator._round_base_cids = dict(round_base_cids or {})
+    aggregator.edge_partials_dir = os.path.join(os.path.dirname(store.root), "edge_partials")
+    return aggregator
+
+
+def flat_fedavg(store, base_cid, updates):
+    """生产环境的扁平路径：Aggregator._federated_averaging。"""
+    aggregator = make_aggregator(store, base_cid)
+    return aggregator._federated_averaging([cid for cid, _ in updates], [lag for _, lag in updates])
+
+
+def assert_equivalent(result, flat):
+    assert list(result) == list(flat)
+    for key, value in flat.items():
+        assert result[key].dtype == value.dtype, key
+        if value.is_floating_point():
+            torch.testing.assert_close(result[key], value, rtol=1e-5, atol=1e-6)
+        else:
+            assert torch.equal(result[key], value), key
+
+
+@pytest.fixture(autouse=True)
+def partials_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(edge_aggregation, "EDGE_PARTIALS_DIR", str(tmp_path / "partials"))
+
+
+@pytest.mark.parametrize("with_base", [False, True], ids=["no_base", "with_base"])
+@pytest.mark.parametrize("combine", COMBINE_MODES)
+def test_hierarchical_matches_flat_fedavg(tmp_path, combine, with_base):
+    store, base_cid, updates = make_round(tmp_path, with_base)
+    flat = flat_fedavg(store, base_cid, updates)
+    result = hierarchical_average(
+        [(cid, aggregator_module.staleness_weight(lag), None) for cid, lag in updates],
+        store.root, NUM_EDGES, base_cid=base_cid, combine=combine,
+    )
+    assert_equivalent(result, flat)
+    # 整数缓冲区取最后一个更新的值
+    assert int(result["1.num_batches_tracked"]) == 3 * (NUM_CLIENTS - 1) + 1
+
+
+def test_aggregator_dispatches_to_edges(tmp_path, monkeypatch):
+    store, base_cid, updates = make_round(tmp_path, with_base=True)
+    flat = flat_fedavg(store, base_cid, updates)
+    monkeypatch.setattr(aggregator_module, "EDGE_AGGREGATORS", NUM_EDGES)
+    assert_equivalent(flat_fedavg(store, base_cid, updates), flat)
+
+
+def test_split_shards_keeps_order_without_empty_shards():
+    shards = edge_aggregation.split_shards(list(range(7)), 3)
+    assert shards == [[0, 1, 2], [3, 4], [5, 6]]
+    assert edge_aggregation.split_shards([0, 1], 5) == [[0], [1]]
+
+
+def put_state_dict(store, tmp_path, name, state_dict, num_samples=None):
+    path = tmp_path / name
+    if num_samples is None:
+        save_state_dict(str(path), state_dict)
+    else:
+        save_model_update(str(path), state_dict, num_samples=num_samples)
+    return store.put_file(str(path))
+
+
+@pytest.mark.parametrize("edges", [1, NUM_EDGES], ids=["flat", "edges"])
+def test_stale_full_model_is_diffed_against_its_base_round(tmp_path, monkeypatch, edges):
+    monkeypatch.setattr(aggregator_module, "EDGE_AGGREGATORS", edges)
+    torch.manual_seed(0)
+    store = ModelStore(str(tmp_path / "store"))
+    # 第 2 轮的全局模型 old 与当前（第 3 轮）的全局模型 new 差别很大
+    old = make_model().state_dict()
+    new = {key: value + 1.0 if value.is_floating_point() else value for key, value in old.items()}
+    old_cid = put_state_dict(store, tmp_path, "old", old)
+    new_cid = put_state_dict(store, tmp_path, "new", new)
+    deltas = [
+        {key: 0.01 * torch.randn_like(value) if value.is_floating_point() else torch.zeros_like(value)
+         for key, value in old.items()}
+        for _ in range(3)
+    ]
+    # 两个客户端基于 old 训练（陈旧度 1），一个基于 new 训练
+    trained = [(old, 1), (old, 1), (new, 0)]
+    cids = [
+        put_state_dict(store, tmp_path, f"update_{i}", {key: base[key] + delta[key] for key in base}, 100 + i)
+        for i, ((base, _), delta) in enumerate(zip(trained, deltas))
+    ]
+    lags = [lag for _, lag in trained]
+    aggregator = make_aggregator(store, new_cid, round_base_cids={2: old_cid})
+    model_cids, staleness, update_base_cids = aggregator._delta_bases(3, cids, lags)
+    assert update_base_cids == [old_cid, old_cid, None]
+    result = aggregator._aggregate(model_cids, staleness, update_base_cids)
+
+    # 期望结果：同样的训练成果都基于 new 提交
+    rebased = [
+        put_state_dict(store, tmp_path, f"rebased_{i}", {key: new[key] + delta[key] for key in new}, 100 + i)
+        for i, delta in enumerate(deltas)
+    ]
+    expected = flat_fedavg(store, new_cid, list(zip(rebased, lags)))
+    assert_equivalent(result, expected)
+
+
+def test_stale_full_model_without_base_is_dropped(tmp_path):
+    store, base_cid, updates = make_round(tmp_path, with_base=True)
+    stale_full = put_state_dict(store, tmp_path, "stale", make_model().state_dict(), 100)
+    cids = [cid for cid, _ in updates] + [stale_full]
+    lags = [0] * len(updates) + [2]
+    # 第 1 轮开始时没有全局模型（随机初始化），第 1 轮的完整模型无法换算为增量
+    aggregator = make_aggregator(store, base_cid, round_base_cids={1: None})
+    model_cids, staleness, update_base_cids = aggregator._delta_bases(3, cids, lags)
+    assert model_cids == cids[:-1] and staleness == lags[:-1]
+    assert update_base_cids == [None] * len(updates)
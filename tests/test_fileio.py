@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from utils.fileio import atomic_write
+
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = str(tmp_path / "nested" / "state.json")
+    with atomic_write(path) as f:
+        f.write("old")
+    with atomic_write(path, durable=True) as f:
+        f.write("new")
+    with open(path) as f:
+        assert f.read() == "new"
+    assert os.listdir(os.path.dirname(path)) == ["state.json"]
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    path = str(tmp_path / "state.json")
+    with atomic_write(path) as f:
+        f.write("old")
+    with pytest.raises(RuntimeError):
+        with atomic_write(path) as f:
+            f.write("half")
+            raise RuntimeError("写入中断")
+    with open(path) as f:
+        assert f.read() == "old"
+    assert os.listdir(tmp_path) == ["state.json"]
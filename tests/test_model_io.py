@@ -0,0 +1,134 @@
+import json
+import math
+import pickle
+import struct
+
+import pytest
+import torch
+
+from model_io import (
+    TensorFile, compress_update, decode_update, load_model_update, load_state_dict,
+    save_model_update, save_state_dict, write_tensors,
+)
+
+
+def make_state_dict():
+    torch.manual_seed(0)
+    return {
+        'conv.weight': torch.randn(4, 3, 3, 3),
+        'bn.running_mean': torch.randn(4).to(torch.float16),
+        'bn.num_batches_tracked': torch.tensor(7),
+        'mask': torch.tensor([True, False, True]),
+        'empty': torch.empty(0, 5),
+    }
+
+
+def write_raw(path, header, data=b""):
+    header_bytes = json.dumps(header).encode("utf-8")
+    with open(path, 'wb') as f:
+        f.write(struct.pack("<Q", len(header_bytes)) + header_bytes + data)
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_state_dict_round_trip(tmp_path, mmap):
+    state_dict = make_state_dict()
+    path = str(tmp_path / "global")
+    save_state_dict(path, state_dict)
+    loaded = load_state_dict(path, mmap=mmap)
+    # 头部保持写入时的顺序，张量的类型、形状与数值都不变
+    assert list(loaded) == list(state_dict)
+    for key, value in state_dict.items():
+        assert loaded[key].dtype == value.dtype
+        assert torch.equal(loaded[key], value)
+
+
+def test_model_update_round_trip(tmp_path):
+    base = make_state_dict()
+    del base['empty']
+    trained = {key: value + 1 if value.is_floating_point() else value for key, value in base.items()}
+    update, _ = compress_update(trained, base, "topk", topk_ratio=0.5)
+    path = str(tmp_path / "update")
+    save_model_update(path, update, num_samples=123)
+    loaded, num_samples = load_model_update(path)
+    assert num_samples == 123
+    assert loaded['scheme'] == "topk"
+    for key, encoded in update['tensors'].items():
+        assert loaded['tensors'][key]['shape'] == encoded['shape']
+        assert torch.equal(loaded['tensors'][key]['indices'], encoded['indices'])
+        assert torch.equal(loaded['tensors'][key]['values'], encoded['values'])
+    assert torch.equal(loaded['dense']['bn.num_batches_tracked'], base['bn.num_batches_tracked'])
+
+
+def test_pickle_files_are_rejected(tmp_path):
+    path = tmp_path / "legacy.pth"
+    torch.save(make_state_dict(), str(path))
+    with pytest.raises(ValueError):
+        load_state_dict(str(path))
+    path.write_bytes(pickle.dumps({'state_dict': {}, 'num_samples': 1}))
+    with pytest.raises(ValueError):
+        load_model_update(str(path))
+
+
+@pytest.mark.parametrize("header, data", [
+    # 数据区越界
+    ({"w": {"dtype": "F32", "shape": [4], "data_offsets": [0, 16]}}, b"\0" * 8),
+    # 区间长度与形状不符
+    ({"w": {"dtype": "F32", "shape": [4], "data_offsets": [0, 8]}}, b"\0" * 16),
+    # 未知类型
+    ({"w": {"dtype": "F128", "shape": [1], "data_offsets": [0, 16]}}, b"\0" * 16),
+    # 负的维度
+    ({"w": {"dtype": "U8", "shape": [-1], "data_offsets": [0, 0]}}, b""),
+    # 缺少字段
+    ({"w": {"dtype": "U8", "shape": [1]}}, b"\0"),
+    # 元数据不是对象
+    ({"__metadata__": [1]}, b""),
+])
+def test_malformed_header_is_rejected(tmp_path, header, data):
+    path = str(tmp_path / "bad")
+    write_raw(path, header, data)
+    with pytest.raises(ValueError):
+        TensorFile(path)
+
+
+def test_truncated_header_is_rejected(tmp_path):
+    path = tmp_path / "truncated"
+    with open(path, 'wb') as f:
+        write_tensors(f, make_state_dict())
+    data = path.read_bytes()
+    (header_length,) = struct.unpack("<Q", data[:8])
+    path.write_bytes(data[:8 + header_length // 2])
+    with pytest.raises(ValueError):
+        TensorFile(str(path))
+    path.write_bytes(data[:8] + b"{\xff\xfe" + data[11:])
+    with pytest.raises(ValueError):
+        TensorFile(str(path))
+
+
+@pytest.mark.parametrize("scheme", ["fp16", "int8", "topk"])
+def test_compression_round_trip_with_error_feedback(scheme):
+    base = make_state_dict()
+    trained = {key: value + torch.randn_like(value) if value.is_floating_point() else value + 1
+               for key, value in base.items()}
+    update, residual = compress_update(trained, base, scheme, topk_ratio=0.25)
+    decoded = decode_update(update, base)
+    assert list(decoded) == list(base)
+    for key, value in trained.items():
+        if value.dtype == torch.float32:
+            # 解码结果加上残差恰好还原训练后的模型：未传输的部分全部留到下一轮
+            assert torch.allclose(decoded[key] + residual[key], value, atol=1e-5)
+        elif value.is_floating_point():
+            # 低精度参数解码时会按自身精度舍入
+            assert torch.allclose(decoded[key].float() + residual[key], value.float(), atol=1e-2)
+        else:
+            assert torch.equal(decoded[key], value)
+    if scheme == "topk":
+        delta = trained['conv.weight'] - base['conv.weight']
+        kept = (decoded['conv.weight'] != base['conv.weight']).sum().item()
+        assert kept == math.ceil(0.25 * delta.numel())
+
+
+def test_compression_without_base_sends_full_model():
+    state_dict = make_state_dict()
+    update, residual = compress_update(state_dict, None, "int8")
+    assert update is state_dict and residual is None
+    assert decode_update(update) is state_dict
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from model_store import ChecksumMismatchError, ModelStore, cid_from_bytes32, cid_to_bytes32
+
+
+def test_put_deduplicates_and_matches_stream(tmp_path):
+    store = ModelStore(str(tmp_path))
+    cid = store.put_bytes(b"model")
+    assert store.put_bytes(b"model") == cid
+    stream_cid, size = store.put_stream(lambda f: (f.write(b"mo"), f.write(b"del")))
+    assert (stream_cid, size) == (cid, 5)
+    with open(store.path(cid), 'rb') as f:
+        assert f.read() == b"model"
+    # 去重后存储中只有一个对象，也没有残留的临时文件
+    files = [name for _, _, names in os.walk(str(tmp_path)) for name in names]
+    assert files == [cid]
+
+
+def test_stream_error_leaves_no_object(tmp_path):
+    store = ModelStore(str(tmp_path))
+
+    def failing_write(f):
+        f.write(b"half")
+        raise RuntimeError("写入中断")
+
+    with pytest.raises(RuntimeError):
+        store.put_stream(failing_write)
+    assert [name for _, _, names in os.walk(str(tmp_path)) for name in names] == []
+
+
+def test_corrupted_object_fails_verification(tmp_path):
+    cid = ModelStore(str(tmp_path)).put_bytes(b"model")
+    store = ModelStore(str(tmp_path))
+    with open(store.path(cid, verify=False), 'wb') as f:
+        f.write(b"tampered")
+    with pytest.raises(ChecksumMismatchError):
+        store.path(cid)
+    with pytest.raises(FileNotFoundError):
+        store.path("0" * 64)
+    with pytest.raises(ValueError):
+        store.path("not-a-cid")
+
+
+def test_bytes32_round_trip():
+    cid = "ab" * 32
+    assert cid_from_bytes32(cid_to_bytes32(cid)) == cid
+    assert cid_to_bytes32(None) == bytes(32)
+    assert cid_from_bytes32(bytes(32)) is None
+
+
+def test_garbage_collection_keeps_recent_rounds(tmp_path):
+    store = ModelStore(str(tmp_path))
+    shared, old, recent, pinned = (store.put_bytes(data) for data in (b"shared", b"old", b"recent", b"pinned"))
+    store.tag_round(1, [shared, old, pinned])
+    store.tag_round(2, [shared])
+    store.tag_round(3, [recent])
+    # 保留轮次不超过 keep_last_rounds 时不删除任何对象
+    assert store.collect_garbage(keep_last_rounds=3) == 0
+    assert store.collect_garbage(keep_last_rounds=2, extra_cids=[pinned]) == 1
+    assert not store.has(old)
+    assert all(store.has(cid) for cid in (shared, recent, pinned))
+    assert sorted(os.listdir(store.refs_dir)) == ["round_2.json", "round_3.json"]
@@ -0,0 +1,83 @@
+import inspect
+
+import numpy as np
+import pytest
+
+import config
+import data_loader
+from partitioner import PARTITION_STRATEGIES, compute_partition, load_partition
+
+NUM_CLIENTS = 4
+# 10 个类别、每类 30 个样本，按类别交错排列
+LABELS = np.tile(np.arange(10), 30)
+
+
+def split(offsets, indices):
+    return [indices[offsets[c]:offsets[c + 1]] for c in range(len(offsets) - 1)]
+
+
+@pytest.mark.parametrize("strategy", PARTITION_STRATEGIES)
+def test_partition_is_deterministic_and_disjoint(strategy):
+    offsets, indices = compute_partition(LABELS, NUM_CLIENTS, strategy, seed=3)
+    again = compute_partition(LABELS, NUM_CLIENTS, strategy, seed=3)
+    assert np.array_equal(offsets, again[0]) and np.array_equal(indices, again[1])
+    parts = split(offsets, indices)
+    assert len(parts) == NUM_CLIENTS
+    # 各客户端的索引升序、互不重叠
+    assert all(np.all(np.diff(part) > 0) for part in parts)
+    assert len(np.unique(indices)) == len(indices)
+    assert indices.min() >= 0 and indices.max() < len(LABELS)
+    if strategy in ("dirichlet", "shard"):
+        # 按标签划分的策略覆盖全部样本
+        assert len(indices) == len(LABELS)
+    else:
+        # 均分策略每个客户端分到 num_samples // num_clients 个样本，余数丢弃
+        assert all(len(part) == len(LABELS) // NUM_CLIENTS for part in parts)
+
+
+def test_seed_changes_random_partitions():
+    a = compute_partition(LABELS, NUM_CLIENTS, "iid", seed=0)[1]
+    b = compute_partition(LABELS, NUM_CLIENTS, "iid", seed=1)[1]
+    assert not np.array_equal(a, b)
+
+
+def test_contiguous_matches_original_slicing():
+    parts = split(*compute_partition(LABELS, NUM_CLIENTS, "contiguous"))
+    per_client = len(LABELS) // NUM_CLIENTS
+    for c, part in enumerate(parts):
+        assert np.array_equal(part, np.arange(c * per_client, (c + 1) * per_client))
+
+
+def test_shard_gives_each_client_few_labels():
+    # 5 个客户端 × 2 片 = 10 片，每片恰好是一个类别
+    parts = split(*compute_partition(LABELS, 5, "shard", seed=0, shards_per_client=2))
+    assert all(len(np.unique(LABELS[part])) <= 2 for part in parts)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        compute_partition(LABELS, NUM_CLIENTS, "unknown")
+    with pytest.raises(ValueError):
+        compute_partition(LABELS, 0, "iid")
+
+
+def test_cached_partition_file(tmp_path):
+    index = load_partition(str(tmp_path), "train", LABELS, NUM_CLIENTS, "dirichlet", seed=5, alpha=0.3)
+    offsets, indices = compute_partition(LABELS, NUM_CLIENTS, "dirichlet", seed=5, alpha=0.3)
+    assert index.num_clients == NUM_CLIENTS
+    for c, part in enumerate(split(offsets, indices)):
+        assert np.array_equal(index.client_indices(c), part)
+        assert index.client_size(c) == len(part)
+    with pytest.raises(IndexError):
+        index.client_indices(NUM_CLIENTS)
+    # 第二次加载直接复用缓存文件
+    again = load_partition(str(tmp_path), "train", LABELS, NUM_CLIENTS, "dirichlet", seed=5, alpha=0.3)
+    assert again.path == index.path
+
+
+def test_single_default_strategy():
+    # 客户端与 load_cifar10 共用 config 中的默认划分，默认保持原始的连续切分
+    assert config.PARTITION_STRATEGY == "contiguous"
+    parameters = inspect.signature(data_loader.load_cifar10).parameters
+    assert parameters["strategy"].default == config.PARTITION_STRATEGY
+    assert parameters["seed"].default == config.PARTITION_SEED
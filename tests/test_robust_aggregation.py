@@ -0,0 +1,32 @@
+import torch
+
+from robust_aggregation import aggregate_matrix, robust_aggregate
+
+
+def make_state_dicts(num_clients):
+    torch.manual_seed(0)
+    return [{"weight": torch.randn(4, 5) * 10, "bias": torch.randn(5) * 10} for _ in range(num_clients)]
+
+
+def test_clipping_without_reference_is_skipped():
+    # 第一轮没有全局模型：行向量是完整的模型参数，不能被裁剪到 clip_norm
+    state_dicts = make_state_dicts(3)
+    clipped = robust_aggregate(state_dicts, "mean", clip_norm=1.0, reference_state_dict=None)
+    unclipped = robust_aggregate(state_dicts, "mean")
+    for key in unclipped:
+        torch.testing.assert_close(clipped[key], unclipped[key])
+
+
+def test_clipping_bounds_updates_relative_to_reference():
+    state_dicts = make_state_dicts(3)
+    reference = {key: value + 0.5 for key, value in state_dicts[0].items()}
+    aggregated = robust_aggregate(state_dicts, "mean", clip_norm=1.0, reference_state_dict=reference)
+    delta = torch.cat([(aggregated[key] - reference[key]).reshape(-1) for key in reference])
+    assert delta.norm() <= 1.0 + 1e-4
+
+
+def test_clip_norm_larger_than_updates_is_a_no_op():
+    matrix = torch.randn(3, 8)
+    reference = matrix.mean(dim=0)
+    expected = aggregate_matrix(matrix.clone(), "mean")
+    torch.testing.assert_close(aggregate_matrix(matrix.clone(), "mean", clip_norm=1e6, reference=reference), expected)
@@ -0,0 +1,32 @@
+import queue
+
+import pytest
+
+import server
+
+
+class FakeService:
+    label = "聚合者"
+
+    def __init__(self, *signals):
+        self.signals = queue.Queue()
+        for signal in signals:
+            self.signals.put(signal)
+
+
+def test_round_failed_is_retried_until_finalized():
+    service = FakeService("ROUND_FAILED", "ROUND_FAILED", "ROUND_FINALIZED")
+    server.wait_for_round_finalized(service, 1)
+    assert service.signals.empty()
+
+
+def test_round_failures_are_capped(monkeypatch):
+    monkeypatch.setattr(server, "MAX_ROUND_FAILURES", 2)
+    service = FakeService("ROUND_FAILED", "ROUND_FAILED", "ROUND_FAILED", "ROUND_FINALIZED")
+    with pytest.raises(RuntimeError):
+        server.wait_for_round_finalized(service, 1)
+
+
+def test_service_exit_is_fatal():
+    with pytest.raises(RuntimeError):
+        server.wait_for_round_finalized(FakeService("EXITED"), 1)
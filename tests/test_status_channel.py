@@ -0,0 +1,61 @@
+import json
+
+from utils.status_channel import StatusChannel, StatusLogReader
+
+
+def open_channel(tmp_path, append=False):
+    return StatusChannel(str(tmp_path / "status.json"), str(tmp_path / "status_log.txt"),
+                         min_interval=0, append=append)
+
+
+def test_reader_only_consumes_complete_lines(tmp_path):
+    channel = open_channel(tmp_path)
+    reader = StatusLogReader(str(tmp_path / "status_log.txt"))
+    channel.append_log("第一行")
+    assert reader.read() == ["第一行"]
+    # 写了一半的行留到下次读取
+    with open(tmp_path / "status_log.txt", 'ab') as f:
+        f.write("半".encode('utf-8'))
+    assert reader.read() == ["第一行"]
+    with open(tmp_path / "status_log.txt", 'ab') as f:
+        f.write("行\n".encode('utf-8'))
+    assert reader.read() == ["第一行", "半行"]
+    channel.close()
+
+
+def test_reader_restarts_at_new_step_offset(tmp_path):
+    channel = open_channel(tmp_path)
+    reader = StatusLogReader(str(tmp_path / "status_log.txt"))
+    channel.append_log("旧步骤")
+    offset = channel.log_offset()
+    channel.append_log("新步骤")
+    assert reader.read(start_offset=offset) == ["新步骤"]
+    channel.close()
+
+
+def test_publish_keeps_latest_snapshot(tmp_path):
+    channel = open_channel(tmp_path)
+    channel.publish({'current_round': 1})
+    channel.publish({'current_round': 2})
+    channel.close()
+    with open(tmp_path / "status.json") as f:
+        assert json.load(f) == {'current_round': 2}
+
+
+def test_append_keeps_previous_log(tmp_path):
+    channel = open_channel(tmp_path)
+    channel.append_log("上一次运行")
+    channel.close()
+    resumed = open_channel(tmp_path, append=True)
+    # 续跑时偏移接在已有日志之后，新步骤不会重复展示旧日志
+    offset = resumed.log_offset()
+    assert offset > 0
+    resumed.append_log("续跑")
+    resumed.close()
+    reader = StatusLogReader(str(tmp_path / "status_log.txt"))
+    assert reader.read() == ["上一次运行", "续跑"]
+    assert StatusLogReader(str(tmp_path / "status_log.txt")).read(start_offset=offset) == ["续跑"]
+
+    fresh = open_channel(tmp_path)
+    fresh.close()
+    assert (tmp_path / "status_log.txt").read_bytes() == b""
@@ -0,0 +1,146 @@
+from types import SimpleNamespace
+
+import pytest
+from web3.exceptions import TransactionNotFound
+
+import tx_manager
+from tx_manager import TransactionFailedError, TransactionManager
+
+
+class FakeCall:
+    fn_name = "submitUpdate"
+    abi = {'inputs': [{'type': 'bytes32'}]}
+
+    def build_transaction(self, params):
+        return dict(params)
+
+    def estimate_gas(self, params):
+        return 100000
+
+
+class FakeEth:
+    """模拟节点：记录广播的交易，回执由测试按需放入 receipts。"""
+    def __init__(self):
+        self.sent = []
+        self.receipts = {}
+        self.gas_price_queries = 0
+        self.chain_nonce = 0
+        self.reject = None
+        self.on_send = None
+        self.on_reject = None
+        self.account = SimpleNamespace(sign_transaction=lambda tx, private_key: SimpleNamespace(rawTransaction=tx))
+
+    @property
+    def gas_price(self):
+        self.gas_price_queries += 1
+        return 100
+
+    def get_transaction_count(self, address, block_identifier):
+        return self.chain_nonce
+
+    def send_raw_transaction(self, tx):
+        if self.reject:
+            error, self.reject = self.reject, None
+            if self.on_reject:
+                self.on_reject()
+            raise ValueError(error)
+        tx_hash = f"{tx['nonce']}-{tx['gasPrice']}".encode()
+        self.sent.append((tx, tx_hash))
+        if self.on_send:
+            self.on_send(tx, tx_hash)
+        return tx_hash
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+
+def mined(eth, tx_hash, status=1):
+    eth.receipts[tx_hash] = SimpleNamespace(status=status, gasUsed=21000, transactionHash=tx_hash, blockNumber=1)
+
+
+@pytest.fixture
+def eth(monkeypatch):
+    monkeypatch.setattr(tx_manager, "RECEIPT_TIMEOUT", 0.05)
+    monkeypatch.setattr(tx_manager, "RECEIPT_POLL_INTERVAL", 0.001)
+    return FakeEth()
+
+
+def make_manager(eth):
+    return TransactionManager(SimpleNamespace(eth=eth), SimpleNamespace(address="0xabc", key=b"key"))
+
+
+def test_nonces_are_local_and_resynced_after_nonce_error(eth):
+    eth.on_send = lambda tx, tx_hash: mined(eth, tx_hash)
+    manager = make_manager(eth)
+    eth.chain_nonce = 5
+    futures = [manager.send(FakeCall()) for _ in range(3)]
+    assert [future.result().status for future in futures] == [1, 1, 1]
+    # 同一账户的其他进程发过交易后，本地 nonce 过低：重新同步后重试
+    eth.chain_nonce = 10
+    eth.reject = "nonce too low"
+    manager.send(FakeCall()).result()
+    assert [tx['nonce'] for tx, _ in eth.sent] == [5, 6, 7, 10]
+    manager.shutdown()
+
+
+def test_gas_price_is_cached_for_ttl(eth, monkeypatch):
+    eth.on_send = lambda tx, tx_hash: mined(eth, tx_hash)
+    manager = make_manager(eth)
+    monkeypatch.setattr(tx_manager, "GAS_PRICE_TTL", 60)
+    for _ in range(3):
+        manager.send(FakeCall())
+    assert eth.gas_price_queries == 1
+    monkeypatch.setattr(tx_manager, "GAS_PRICE_TTL", 0)
+    for _ in range(2):
+        manager.send(FakeCall())
+    assert eth.gas_price_queries == 3
+    manager.shutdown()
+
+
+def test_replaced_transaction_can_still_be_mined(eth):
+    # 替换交易广播之后，最初的那笔交易才被打包
+    def on_send(tx, tx_hash):
+        if len(eth.sent) == 2:
+            mined(eth, eth.sent[0][1])
+
+    eth.on_send = on_send
+    manager = make_manager(eth)
+    receipt = manager.send(FakeCall()).result()
+    assert receipt.transactionHash == eth.sent[0][1]
+    assert [tx['gasPrice'] for tx, _ in eth.sent] == [100, int(100 * tx_manager.GAS_PRICE_BUMP)]
+    assert eth.sent[0][0]['nonce'] == eth.sent[1][0]['nonce']
+    manager.shutdown()
+
+
+def test_rejected_replacement_keeps_waiting(eth):
+    # 第一笔交易超时后恰好上链，替换交易被节点以 nonce 过低拒绝
+    def on_send(tx, tx_hash):
+        eth.reject = "nonce too low"
+        eth.on_reject = lambda: mined(eth, tx_hash)
+
+    eth.on_send = on_send
+    manager = make_manager(eth)
+    receipt = manager.send(FakeCall()).result()
+    assert receipt.transactionHash == eth.sent[0][1]
+    assert len(eth.sent) == 1
+    manager.shutdown()
+
+
+def test_failed_transaction_drops_gas_estimate(eth):
+    eth.on_send = lambda tx, tx_hash: mined(eth, tx_hash, status=0)
+    manager = make_manager(eth)
+    with pytest.raises(TransactionFailedError):
+        manager.send(FakeCall()).result()
+    assert manager._gas_estimates == {}
+    manager.shutdown()
+
+
+def test_receipt_timeout_after_max_replacements(eth):
+    manager = make_manager(eth)
+    with pytest.raises(tx_manager.TimeExhausted):
+        manager.send(FakeCall()).result()
+    assert len(eth.sent) == tx_manager.MAX_REPLACEMENTS + 1
+    assert len({tx['nonce'] for tx, _ in eth.sent}) == 1
+    manager.shutdown()
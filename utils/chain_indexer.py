@@ -0,0 +1,255 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+from eth_utils import event_abi_to_log_topic
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'client')))
+from chain_reader import ChainReader, make_web3
+from model_store import cid_from_bytes32
+
+# --- 增量链上索引器 ---
+# 从保存的游标开始跟随新区块，把发往合约的交易和合约事件各解码一次后写入本地 SQLite，
+# 仪表盘和最终快照都从这里分页查询，刷新时不再重新扫描区块、也不再访问节点。
+CHAIN_INDEX_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs'))
+# 每个 JSON-RPC 批量请求取回的区块数
+BLOCKS_PER_BATCH = 100
+# 后台线程的同步间隔（秒）
+SYNC_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS transactions (
+    tx_hash TEXT PRIMARY KEY,
+    block INTEGER NOT NULL,
+    tx_index INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    func TEXT NOT NULL,
+    params TEXT NOT NULL,
+    round INTEGER
+);
+CREATE TABLE IF NOT EXISTS events (
+    tx_hash TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    block INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    round INTEGER,
+    client TEXT,
+    model_cid TEXT,
+    PRIMARY KEY (tx_hash, log_index)
+);
+CREATE INDEX IF NOT EXISTS tx_by_block ON transactions (block, tx_index);
+CREATE INDEX IF NOT EXISTS tx_by_round ON transactions (round);
+CREATE INDEX IF NOT EXISTS tx_by_sender ON transactions (sender);
+CREATE INDEX IF NOT EXISTS tx_by_func ON transactions (func);
+CREATE INDEX IF NOT EXISTS ev_by_round ON events (round, name);
+CREATE INDEX IF NOT EXISTS ev_by_client ON events (client);
+"""
+
+
+def default_index_path(contract_address):
+    """每个合约地址一个索引文件，重新部署合约后自然从头索引。"""
+    return os.path.join(CHAIN_INDEX_DIR, f"chain_index_{contract_address.lower()}.sqlite")
+
+
+def format_params(params):
+    """把交易参数格式化为仪表盘展示用的短字符串（过长的值截断到 30 个字符）。"""
+    return ", ".join(f"{k}: {str(v)[:30]}..." if len(str(v)) > 30 else f"{k}: {v}" for k, v in params.items())
+
+
+class ChainIndexer:
+    def __init__(self, db_path, rpc_url, contract_address, abi, session=None):
+        self.db_path = db_path
+        self.w3, session = make_web3(rpc_url, session)
+        self.contract = self.w3.eth.contract(address=contract_address, abi=abi)
+        self.reader = ChainReader(self.w3, self.contract, rpc_url, session)
+        # 事件签名的 topic0 -> 事件名
+        self._event_names = {
+            event_abi_to_log_topic(item): item['name'] for item in abi if item.get('type') == 'event'
+        }
+        # 最近一次同步是否成功（节点停止后为 False）
+        self.is_live = False
+        self._sync_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def _connect(self):
+        """打开一个连接，退出时提交（出错时回滚）并关闭。"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        # WAL 模式下读者（仪表盘的查询）不会阻塞写者（后台同步）
+        conn.execute("PRAGMA journal_mode=WAL")
+        # 索引文件可能随 server.py 的清理步骤被删除，每次连接时确保表结构存在
+        conn.executescript(SCHEMA)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- 同步 ---
+    def _get_meta(self, conn, key, default=None):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else default
+
+    @staticmethod
+    def _set_meta(conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _decode_transactions(self, blocks):
+        rows = []
+        contract_address = self.contract.address.lower()
+        for block in blocks:
+            for tx in block['transactions']:
+                if not tx['to'] or tx['to'].lower() != contract_address:
+                    continue
+                try:
+                    func_obj, func_params = self.contract.decode_function_input(tx['input'])
+                except ValueError:
+                    continue
+                params = {k: (v.hex() if isinstance(v, bytes) else str(v)) for k, v in func_params.items()}
+                rows.append((
+                    tx['hash'], int(tx['blockNumber'], 16), int(tx['transactionIndex'], 16),
+                    tx['from'], func_obj.fn_name, json.dumps(params),
+                ))
+        return rows
+
+    def _decode_events(self, from_block, to_block):
+        rows = []
+        logs = self.w3.eth.get_logs({'address': self.contract.address, 'fromBlock': from_block, 'toBlock': to_block})
+        for log in logs:
+            name = self._event_names.get(bytes(log['topics'][0])) if log['topics'] else None
+            if name is None:
+                continue
+            args = getattr(self.contract.events, name)().processLog(log).args
+            model_cid = args.get('modelCID', args.get('newGlobalModelCID'))
+            rows.append((
+                log['transactionHash'].hex(), log['logIndex'], log['blockNumber'], name,
+                args.get('round'), args.get('clientAddress'), cid_from_bytes32(model_cid) if model_cid is not None else None,
+            ))
+        return rows
+
+    def sync(self):
+        """把游标之后的新区块写入索引，并刷新当前轮次状态。返回本次索引的区块数。"""
+        with self._sync_lock:
+            with self._connect() as conn:
+                cursor = self._get_meta(conn, "cursor", -1)
+                cursor_hash = self._get_meta(conn, "cursor_hash")
+            # 区块高度、整轮状态与游标处区块的哈希合并为一次批量请求
+            calls = [("eth_blockNumber", []), self.contract.functions.getRoundState()]
+            if cursor >= 0:
+                calls.append(("eth_getBlockByNumber", [hex(cursor), False]))
+            results = self.reader.batch_call(calls)
+            latest_block = int(results[0], 16)
+            current_round, updates_needed, global_model_cid, updates = results[1]
+            if cursor >= 0 and (results[2] is None or results[2]['hash'] != cursor_hash):
+                # 节点重启或链被重组：已索引的数据不再对应当前链，从头重新索引
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM transactions")
+                    conn.execute("DELETE FROM events")
+                    conn.execute("DELETE FROM meta")
+                cursor = -1
+            indexed = 0
+            for start in range(cursor + 1, latest_block + 1, BLOCKS_PER_BATCH):
+                end = min(start + BLOCKS_PER_BATCH - 1, latest_block)
+                blocks = self.reader.batch_call([
+                    ("eth_getBlockByNumber", [hex(number), True]) for number in range(start, end + 1)
+                ])
+                tx_rows = self._decode_transactions(blocks)
+                event_rows = self._decode_events(start, end)
+                # 每批区块的数据与游标在同一个事务中提交，中途中断后可以从游标处继续
+                with self._connect() as conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO transactions (tx_hash, block, tx_index, sender, func, params) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", tx_rows)
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO events (tx_hash, log_index, block, name, round, client, model_cid) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", event_rows)
+                    conn.execute(
+                        "UPDATE transactions SET round = (SELECT e.round FROM events e WHERE e.tx_hash = transactions.tx_hash "
+                        "AND e.round IS NOT NULL LIMIT 1) WHERE block BETWEEN ? AND ?", (start, end))
+                    self._set_meta(conn, "cursor", end)
+                    self._set_meta(conn, "cursor_hash", blocks[-1]['hash'])
+                indexed += end - start + 1
+            with self._connect() as conn:
+                self._set_meta(conn, "round_state", {
+                    "block_number": latest_block,
+                    "onchain_round": current_round,
+                    "updates_received": len(updates),
+                    "updates_needed": updates_needed,
+                    "global_model_cid": cid_from_bytes32(global_model_cid),
+                })
+            self.is_live = True
+            return indexed
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception:
+                # 节点未启动或已停止：保留已索引的数据，稍后重试
+                self.is_live = False
+            self._stop.wait(interval)
+
+    def start(self, interval=SYNC_INTERVAL):
+        """启动后台同步线程（重复调用无副作用）。"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # --- 查询 ---
+    def transactions(self, limit=50, offset=0, round_number=None, client=None, func=None):
+        """按区块倒序分页查询合约交易，可按轮次、发送方和函数名过滤；limit=None 表示不分页。"""
+        clauses, args = [], []
+        if round_number is not None:
+            clauses.append("round = ?")
+            args.append(round_number)
+        if client is not None:
+            clauses.append("lower(sender) = lower(?)")
+            args.append(client)
+        if func is not None:
+            clauses.append("func = ?")
+            args.append(func)
+        query = "SELECT * FROM transactions"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY block DESC, tx_index DESC"
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            args += [limit, offset]
+        with self._connect() as conn:
+            rows = conn.execute(query, args).fetchall()
+        return [{
+            "block": row["block"], "hash": row["tx_hash"], "from": row["sender"], "func": row["func"],
+            "params": format_params(json.loads(row["params"])), "round": row["round"],
+        } for row in rows]
+
+    def round_updates(self, round_number):
+        """某一轮的全部 UpdateSubmitted 事件：[(client_address, model_cid), ...]。"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT client, model_cid FROM events WHERE round = ? AND name = 'UpdateSubmitted' ORDER BY block, log_index",
+                (round_number,)).fetchall()
+        return [(row["client"], row["model_cid"]) for row in rows]
+
+    def snapshot(self, history_limit=50):
+        """返回与仪表盘展示格式一致的状态字典；尚未同步过时返回 None。"""
+        with self._connect() as conn:
+            state = self._get_meta(conn, "round_state")
+        if state is None:
+            return None
+        state = dict(state, contract_address=self.contract.address)
+        state["history"] = self.transactions(limit=history_limit)
+        return state
@@ -0,0 +1,30 @@
+import json
+import os
+
+from utils.fileio import atomic_write
+
+# --- 续跑检查点 ---
+# 聚合者每确认结束一轮，就把该轮的结果（新全局模型的 CID 等）写入检查点文件；
+# server.py --resume 读取它并与链上的 currentRound / globalModelCID 核对后从第一个未完成的轮次继续。
+# 全局模型本身保存在内容寻址存储中（写入同样是原子的），检查点只记录引用。
+CHECKPOINT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'saved_models', 'checkpoint.json'))
+
+
+def write_checkpoint(round_number, global_model_cid, tx_hash=None, path=None):
+    """记录第 round_number 轮已在链上结束，下一轮从 global_model_cid 开始。"""
+    with atomic_write(path or CHECKPOINT_PATH, durable=True) as f:
+        json.dump({
+            "round": round_number,
+            "next_round": round_number + 1,
+            "global_model_cid": global_model_cid,
+            "tx_hash": tx_hash,
+        }, f, indent=2)
+
+
+def read_checkpoint(path=None):
+    """读取检查点；不存在或无法解析时返回 None。"""
+    try:
+        with open(path or CHECKPOINT_PATH, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
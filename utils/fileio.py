@@ -0,0 +1,34 @@
+import contextlib
+import os
+import threading
+
+# --- 原子写入 ---
+# 存储对象、检查点、状态快照、清单等文件都可能被别的进程同时读取，或在写入途中因崩溃而中断。
+# 统一先写同一目录下的临时文件，写完后用 os.replace 原子地替换目标文件：读者只会看到旧文件或完整的新文件。
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w', durable=False, **open_kwargs):
+    """
+    以原子替换的方式写入 path，用法与 open 相同：
+        with atomic_write(path, 'wb') as f:
+            f.write(data)
+    块内抛出异常时删除临时文件、保留原文件。durable=True 时在替换前 fsync，
+    保证替换后掉电也不会得到空文件（检查点等续跑依赖的文件使用）。
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # 临时文件名带进程号与线程号，同一文件被多个进程或线程同时写入时互不干扰
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, **open_kwargs) as f:
+            yield f
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,172 @@
+import atexit
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from utils.fileio import atomic_write
+
+# --- 运行指标 ---
+# 客户端、训练器、聚合器与 server.py 在热路径上记录三类指标，按轮次与客户端打标签：
+#   - span：阶段耗时（秒），例如 train / serialise / submit / aggregate / evaluate / finalise；
+#   - counter：累加量，例如模型读写字节数、RPC 调用次数、交易消耗的 gas；
+#   - gauge：瞬时值，例如每秒训练样本数、训练损失、峰值常驻内存。
+# 每个进程写自己的文件 METRICS_DIR/<进程名>.jsonl（每条记录一行，追加写入）：span 与 gauge 立即写入；
+# counter 在热路径上（例如每次 RPC 调用）只在内存中累加，flush() 时按标签各写一条自上次 flush 以来的增量。
+# flush() 同时把累计值以 Prometheus textfile 格式原子地重写到 <进程名>.prom（可交给 node_exporter 采集）。
+# 进程调用 configure() 之前，get_recorder() 返回什么都不写的记录器，库代码可以无条件地记录指标。
+METRICS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs', 'metrics'))
+# 导出格式："jsonl" / "prometheus"，为空时不写任何文件
+EXPORT_FORMATS = ("jsonl", "prometheus")
+# Prometheus 指标名前缀
+PROMETHEUS_PREFIX = "fl"
+# 不写入 Prometheus 标签的字段：轮次会让时间序列数量无限增长，只保留在 JSONL 中
+PROMETHEUS_EXCLUDED_LABELS = ("round",)
+
+
+def peak_rss_bytes():
+    """本进程的峰值常驻内存（字节）；ru_maxrss 在 Linux 上以 KB 为单位，在 macOS 上以字节为单位。"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _prometheus_labels(labels):
+    return ",".join(f'{key}="{str(value)}"' for key, value in labels)
+
+
+class MetricsRecorder:
+    """
+    单个进程的指标记录器，可在多个线程中共用。
+    构造时的标签（例如 client=0）附在每条记录上；set_context() 设置随进度变化的标签（例如 round），
+    单次记录时传入的标签优先级最高（例如后台评估线程显式标明它评估的轮次）。
+    """
+    def __init__(self, component, metrics_dir=None, export_formats=EXPORT_FORMATS, **labels):
+        self.labels = {"component": component, **labels}
+        self.name = "_".join(str(value) for value in self.labels.values())
+        metrics_dir = metrics_dir or METRICS_DIR
+        if export_formats:
+            os.makedirs(metrics_dir, exist_ok=True)
+        self.prometheus_path = os.path.join(metrics_dir, f"{self.name}.prom") if "prometheus" in export_formats else None
+        # 行缓冲：每条记录写完即落到文件，仪表盘可以实时读取
+        self._jsonl = open(os.path.join(metrics_dir, f"{self.name}.jsonl"), 'a', buffering=1) if "jsonl" in export_formats else None
+        self._context = {}
+        self._lock = threading.Lock()
+        # Prometheus 导出用的累计值：(名称, 标签) -> [总和, 次数] / 总和 / 最新值
+        self._spans = defaultdict(lambda: [0.0, 0])
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        # 尚未写入 JSONL 的 counter 增量：(名称, 完整标签) -> 增量
+        self._pending_counts = defaultdict(float)
+
+    def set_context(self, **labels):
+        with self._lock:
+            self._context.update(labels)
+
+    def _record(self, kind, name, value, labels):
+        with self._lock:
+            record_labels = {**self.labels, **self._context, **labels}
+            if kind == "counter":
+                self._pending_counts[(name, tuple(record_labels.items()))] += value
+            elif self._jsonl is not None:
+                self._write_jsonl(kind, name, value, record_labels)
+            key = (name, tuple((k, v) for k, v in record_labels.items() if k not in PROMETHEUS_EXCLUDED_LABELS))
+            if kind == "span":
+                total = self._spans[key]
+                total[0] += value
+                total[1] += 1
+            elif kind == "counter":
+                self._counters[key] += value
+            else:
+                self._gauges[key] = value
+
+    def _write_jsonl(self, kind, name, value, labels):
+        self._jsonl.write(json.dumps({"ts": time.time(), "type": kind, "name": name, "value": value, **labels}) + "\n")
+
+    @contextlib.contextmanager
+    def span(self, stage, **labels):
+        """记录 with 块的耗时；块内抛出异常时同样记录，并附上 error=True。"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            labels["error"] = True
+            raise
+        finally:
+            self._record("span", stage, time.perf_counter() - start, labels)
+
+    def count(self, name, value=1, **labels):
+        self._record("counter", name, value, labels)
+
+    def gauge(self, name, value, **labels):
+        self._record("gauge", name, value, labels)
+
+    def record_peak_rss(self, **labels):
+        self.gauge("peak_rss_bytes", peak_rss_bytes(), **labels)
+
+    def flush(self):
+        """写出 counter 的增量，并把累计值以 Prometheus textfile 格式写入 <进程名>.prom（先写临时文件再原子重命名）。"""
+        with self._lock:
+            if self._jsonl is not None:
+                for (name, labels), value in self._pending_counts.items():
+                    self._write_jsonl("counter", name, value, dict(labels))
+            self._pending_counts.clear()
+        if self.prometheus_path is None:
+            return
+        with self._lock:
+            lines = [f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds summary"]
+            # 标签值的类型可能不同（例如 error=True 与 client=0），按文本排序
+            for (name, labels), (total, count) in sorted(self._spans.items(), key=repr):
+                label_text = _prometheus_labels(labels + (("stage", name),))
+                lines.append(f"{PROMETHEUS_PREFIX}_stage_seconds_sum{{{label_text}}} {total}")
+                lines.append(f"{PROMETHEUS_PREFIX}_stage_seconds_count{{{label_text}}} {count}")
+            for kind, values, suffix in (("counter", self._counters, "_total"), ("gauge", self._gauges, "")):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name}{suffix} {kind}")
+                    for (key_name, labels), value in sorted(values.items(), key=repr):
+                        if key_name == name:
+                            lines.append(f"{PROMETHEUS_PREFIX}_{name}{suffix}{{{_prometheus_labels(labels)}}} {value}")
+        with atomic_write(self.prometheus_path) as f:
+            f.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self.flush()
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+
+
+class _NullRecorder(MetricsRecorder):
+    """configure() 之前使用的记录器：接口相同，不记录也不写文件。"""
+    def __init__(self):
+        super().__init__("null", export_formats=())
+
+    def _record(self, kind, name, value, labels):
+        pass
+
+
+_NULL_RECORDER = _NullRecorder()
+_recorder = None
+
+
+def configure(component, **labels):
+    """由进程入口调用一次，创建本进程的记录器；进程退出时自动写出 Prometheus 文件并关闭 JSONL。"""
+    global _recorder
+    _recorder = MetricsRecorder(component, **labels)
+    atexit.register(_recorder.close)
+    return _recorder
+
+
+def get_recorder():
+    return _recorder or _NULL_RECORDER
+
+
+def count_rpc_calls(make_request, w3):
+    """web3 中间件：统计本进程经由 Web3 发出的 JSON-RPC 调用（批量读取由 ChainReader 自行统计）。"""
+    def middleware(method, params):
+        get_recorder().count("rpc_calls", method=method)
+        return make_request(method, params)
+    return middleware
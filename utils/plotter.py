@@ -1,11 +1,78 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import csv
 import os
 
 # --- 全局参数 ---
 # 定义日志文件和图表保存的路径
 HISTORY_LOG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'logs', 'history.csv'))
 PLOT_SAVE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'plots', 'accuracy_vs_rounds.png'))
+PLOT_DPI = 300
+
+
+def _pyplot():
+    """按需导入 matplotlib（使用无界面的 Agg 后端），不绘图的进程不必承担导入开销。"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def read_history(history_path=HISTORY_LOG_PATH):
+    """读取 history.csv，返回 [(round, accuracy), ...]；文件不存在时返回空列表。"""
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, newline='') as f:
+        return [(int(row['Round']), float(row['Accuracy'])) for row in csv.DictReader(f)]
+
+
+class AccuracyPlotter:
+    """
+    进程内的增量绘图器：图表只创建一次并保持打开，每轮只追加一个新点后重新保存 PNG。
+    可以在聚合器中直接调用，也可以放在后台线程中使用（同一实例不要被多个线程同时调用）。
+    """
+    def __init__(self, save_path=PLOT_SAVE_PATH, dpi=PLOT_DPI, history_path=None):
+        self.save_path = save_path
+        self.dpi = dpi
+        # 给定 history_path 时先载入已有的记录（例如聚合器重启后继续绘图）
+        self.points = read_history(history_path) if history_path else []
+        self._fig = None
+        self._ax = None
+        self._line = None
+
+    def _ensure_figure(self):
+        if self._fig is not None:
+            return
+        plt = _pyplot()
+        plt.style.use('ggplot')
+        self._fig, self._ax = plt.subplots(figsize=(10, 6))
+        self._line, = self._ax.plot([], [], marker='o', linestyle='-', color='b', label='Global Model Accuracy')
+        self._ax.set_title('Model Accuracy vs. Federated Learning Rounds', fontsize=16)
+        self._ax.set_xlabel('Round', fontsize=12)
+        self._ax.set_ylabel('Accuracy (%)', fontsize=12)
+        # 设置 X 轴为整数刻度
+        self._ax.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
+        self._ax.legend()
+        self._ax.grid(True)
+
+    def add_point(self, round_number, accuracy, render=True):
+        self.points.append((round_number, accuracy))
+        if render:
+            self.render()
+
+    def render(self):
+        """用当前的全部点更新折线并保存 PNG。"""
+        self._ensure_figure()
+        rounds, accuracies = zip(*self.points) if self.points else ((), ())
+        self._line.set_data(rounds, accuracies)
+        self._ax.relim()
+        self._ax.autoscale_view()
+        os.makedirs(os.path.dirname(self.save_path), exist_ok=True)
+        self._fig.savefig(self.save_path, dpi=self.dpi)
+
+    def close(self):
+        if self._fig is not None:
+            _pyplot().close(self._fig)
+            self._fig = None
+
 
 def plot_accuracy():
     """
@@ -17,49 +84,15 @@ def plot_accuracy():
         print("请先运行几轮联邦学习以生成日志。")
         return
 
-    # 使用 pandas 读取 CSV 文件
-    try:
-        df = pd.read_csv(HISTORY_LOG_PATH)
-    except pd.errors.EmptyDataError:
+    plotter = AccuracyPlotter(history_path=HISTORY_LOG_PATH)
+    if not plotter.points:
         print(f"错误：日志文件 {HISTORY_LOG_PATH} 是空的。")
         return
-        
-    # 检查数据是否有效
-    if 'Round' not in df.columns or 'Accuracy' not in df.columns:
-        print("错误：CSV文件缺少 'Round' 或 'Accuracy' 列。")
-        return
 
-    # 开始绘图
-    # --- 这是修改的地方 ---
-    plt.style.use('ggplot') # 替换为一个更通用的样式
-    # --- 修改结束 ---
-    fig, ax = plt.subplots(figsize=(10, 6))
-
-    # 绘制折线图
-    ax.plot(df['Round'], df['Accuracy'], marker='o', linestyle='-', color='b', label='Global Model Accuracy')
-
-    # 设置图表标题和坐标轴标签
-    ax.set_title('Model Accuracy vs. Federated Learning Rounds', fontsize=16)
-    ax.set_xlabel('Round', fontsize=12)
-    ax.set_ylabel('Accuracy (%)', fontsize=12)
-    
-    # 设置 X 轴为整数刻度
-    ax.xaxis.set_major_locator(plt.MaxNLocator(integer=True))
-    
-    # 添加图例和网格
-    ax.legend()
-    ax.grid(True)
-
-    # 确保 'plots' 目录存在
-    os.makedirs(os.path.dirname(PLOT_SAVE_PATH), exist_ok=True)
-
-    # 保存图表到文件
-    plt.savefig(PLOT_SAVE_PATH, dpi=300)
+    plotter.render()
+    plotter.close()
     print(f"图表已保存到: {PLOT_SAVE_PATH}")
 
-    # 显示图表 (如果你在图形界面环境中，这会弹出一个窗口)
-    # plt.show()
-
 if __name__ == "__main__":
     # 运行绘图函数
     plot_accuracy()
\ No newline at end of file
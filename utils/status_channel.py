@@ -0,0 +1,134 @@
+import collections
+import json
+import os
+import threading
+import time
+
+from utils.fileio import atomic_write
+
+# --- 状态发布通道 ---
+# server.py 的运行状态分两部分发布：
+#   - 日志行追加写入只增不改的日志文件，读者按字节偏移增量读取；
+#   - 状态快照（轮次、步骤等）合并后按不超过 min_interval 的频率写入 status.json，
+#     先写临时文件再原子重命名，读者永远不会读到写了一半的 JSON。
+# 子进程输出再多，服务器也只是追加日志，不会反复重写整个状态文件。
+STATUS_MIN_INTERVAL = 0.5
+# 仪表盘展示的日志行数
+DEFAULT_TAIL_LINES = 20
+# 读者落后太多时只读取日志末尾的这么多字节
+MAX_TAIL_BYTES = 64 * 1024
+
+
+class StatusChannel:
+    """服务器端：追加日志行、合并并节流状态快照。"""
+    def __init__(self, status_path, log_path, min_interval=STATUS_MIN_INTERVAL, append=False):
+        self.status_path = status_path
+        self.min_interval = min_interval
+        # 新的运行从空日志开始，续跑（append=True）时接在已有日志之后；
+        # 二进制模式下 tell() 就是读者使用的字节偏移
+        self._log = open(log_path, 'ab' if append else 'wb')
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = None
+        self._published_seq = 0
+        self._written_seq = 0
+        self._dirty = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def append_log(self, line):
+        with self._lock:
+            self._log.write(line.encode('utf-8') + b"\n")
+            self._log.flush()
+
+    def log_offset(self):
+        """当前日志末尾的字节偏移，新步骤的日志从这里开始。"""
+        with self._lock:
+            return self._log.tell()
+
+    def publish(self, state):
+        """登记一份新的状态快照；实际写入由后台线程按节流频率完成，期间的多次发布只写最后一份。"""
+        with self._lock:
+            self._published_seq += 1
+            self._pending = (self._published_seq, dict(state))
+        self._dirty.set()
+
+    def _write_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        seq, state = pending
+        with self._write_lock:
+            # 并发的 flush() 可能已经写入了更新的快照
+            if seq <= self._written_seq:
+                return
+            try:
+                with atomic_write(self.status_path) as f:
+                    json.dump(state, f, indent=4)
+                self._written_seq = seq
+            except IOError as e:
+                print(f"警告：无法写入状态文件: {e}")
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            self._dirty.clear()
+            self._write_pending()
+            time.sleep(self.min_interval)
+
+    def flush(self):
+        """立即写入尚未落盘的状态快照。"""
+        self._write_pending()
+
+    def close(self):
+        self._closed = True
+        self._dirty.set()
+        self.flush()
+        with self._lock:
+            self._log.close()
+
+
+class StatusLogReader:
+    """读者端：按字节偏移增量读取日志文件，只保留最近 max_lines 行。"""
+    def __init__(self, log_path, max_lines=DEFAULT_TAIL_LINES):
+        self.log_path = log_path
+        self.lines = collections.deque(maxlen=max_lines)
+        self.offset = 0
+        self.step_offset = 0
+
+    def read(self, start_offset=0):
+        """
+        读取自上次调用以来新增的完整日志行，返回当前保留的行列表。
+        start_offset 是当前步骤日志的起点（来自状态快照）；起点变化时清空已读的行。
+        """
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return list(self.lines)
+        if size < self.offset:
+            # 日志被截断（服务器重新启动），从头读起
+            self.offset = self.step_offset = 0
+            self.lines.clear()
+        if start_offset != self.step_offset:
+            # 进入新步骤：只展示从该步骤起点开始的日志
+            self.offset = self.step_offset = start_offset
+            self.lines.clear()
+        if size <= self.offset:
+            return list(self.lines)
+        with open(self.log_path, 'rb') as f:
+            skip_partial_line = size - self.offset > MAX_TAIL_BYTES
+            if skip_partial_line:
+                self.offset = size - MAX_TAIL_BYTES
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        # 只消费完整的行，写了一半的最后一行留到下次读取
+        end = data.rfind(b"\n") + 1
+        chunk = data[:end]
+        if skip_partial_line:
+            chunk = chunk[chunk.find(b"\n") + 1:]
+        self.offset += end
+        for line in chunk.decode('utf-8', errors='replace').splitlines():
+            self.lines.append(line)
+        return list(self.lines)